@@ -5,8 +5,9 @@ from app.core.security import (
     require_admin_auth,
     remove_public_key_from_db, 
     get_all_public_keys,
-    get_db
+    keyring_cache
 )
+from app.models import get_db
 
 router = APIRouter()
 
@@ -44,4 +45,8 @@ async def api_list_keys(
             "created_by": key.created_by
         }
         for key in keys
-    } 
\ No newline at end of file
+    } 
+
+@router.get("/auth/keyring/stats")
+async def api_keyring_stats(admin: str = Depends(require_admin_auth)):
+    return keyring_cache.stats()
@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from starlette.responses import Response
+from app.core.metrics import METRICS_CONTENT_TYPE, REGISTRY
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus text exposition of the counters and histograms in app.core.metrics"""
+    return Response(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
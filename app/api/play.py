@@ -1,27 +1,58 @@
+import os
 from fastapi import APIRouter, HTTPException, Depends, Request
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from app.core.config import Config, get_config
-from app.models import AsyncSessionLocal, Video
-import os
-
-# Path where NAS is mounted inside the container
-NAS_MOUNT_PATH = "/nas/videos"
-VIDEOS_DIR = os.path.join(NAS_MOUNT_PATH, "videos")
+from app.models import Video, get_db
+from app.core.streaming import guess_media_type
+from app.core.page_cache import CachedPage, page_cache, play_page_key
+from app.core.playback_urls import sign_playback_url
+from app.core.share_cache import NOT_FOUND, share_cache
+from app.api.upload import shared_file, stat_share
 
 # Templates directory
-templates = Jinja2Templates(directory="app/templates")
+# Relative to the package, so the app can be imported from any working directory
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+templates = Jinja2Templates(directory=os.path.join(APP_DIR, "templates"))
+# Served by the app itself, so the player never depends on a CDN (see HLS_JS_VERSION in the Dockerfile)
+STATIC_DIR = os.path.join(APP_DIR, "static")
+HLS_JS = "hls.min.js"
+# Types Chrome, Firefox and Safari all accept on a <source>; for anything else (QuickTime,
+# Matroska) the type is left off, since a browser skips a source whose type it does not know
+# even when it could play the bytes
+SOURCE_MEDIA_TYPES = ("video/mp4", "video/webm")
 
 router = APIRouter()
 
-async def get_db():
-    async with AsyncSessionLocal() as session:
-        yield session
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
 
 @router.get("/play/{share_token}", response_class=HTMLResponse)
 async def play_video(request: Request, share_token: str, db: AsyncSession = Depends(get_db), config: Config = Depends(get_config)):
+    if config.playback_url_secret and config.playback_url_bind_client:
+        # Every viewer gets URLs signed for their own address; nothing to share between them
+        body = await render_play_page(request, share_token, db, config)
+        return CachedPage(body, config.version).response(request)
+    # Rendered once per video and config; changes to the video invalidate the page
+    key = play_page_key(share_token)
+    page = page_cache.get(key, config.version)
+    if page is None:
+        body = await render_play_page(request, share_token, db, config)
+        page = page_cache.put(key, body, config.version)
+    return page.response(request)
+
+
+async def render_play_page(request: Request, share_token: str, db: AsyncSession, config: Config) -> bytes:
+    # Tokens known not to exist are answered without a query
+    if share_cache.get(share_token, False, config.version) is NOT_FOUND:
+        raise HTTPException(status_code=404, detail="Video not found")
+
     # Find video by share token
     result = await db.execute(
         select(Video).where(Video.share_token == share_token)
@@ -29,25 +60,51 @@ async def play_video(request: Request, share_token: str, db: AsyncSession = Depe
     video = result.scalar_one_or_none()
     
     if not video:
+        share_cache.put(share_token, False, config.version, NOT_FOUND)
         raise HTTPException(status_code=404, detail="Video not found")
     
-    # Check if file exists
-    video_path = os.path.join(VIDEOS_DIR, video.filename)
-    if not os.path.exists(video_path):
-        raise HTTPException(status_code=404, detail="Video file not found")
+    # Check if file exists (in offload mode nginx does this when the video is fetched);
+    # the result is remembered for the player's first request to /videos
+    shared = await stat_share(video, config)
     
-    # Generate video URL for the player
-    video_url = f"/videos/{share_token}"
+    # Generate video URL for the player (/videos serves the transcoded rendition when there is one)
+    share_url = f"/videos/{share_token}"
+    video_url = share_url
+    download_url = f"{share_url}?original=1" if video.transcoded else share_url
+    if config.playback_url_secret:
+        # Range requests for the bytes then skip the database on any worker
+        client_ip = config.get_real_client_ip(request) if config.playback_url_bind_client else None
+        video_url = sign_playback_url(config, shared, client_ip)
+        download_url = sign_playback_url(config, shared_file(video, True, config), client_ip) if video.transcoded else video_url
+    # Thumbnails are made on the transcode workers; a missing one is made again when first requested
+    thumbnails = config.thumbnails and config.transcode_workers > 0
+    # Stored media metadata; the transcoded rendition is always H.264/AAC MP4
+    mime_type = "video/mp4" if video.transcoded else (video.mime_type or guess_media_type(video.filename))
     
     return templates.TemplateResponse(
+        request,
         "video_player.html",
         {
-            "request": request,
             "video_url": video_url,
+            "share_url": share_url,
+            "download_url": download_url,
+            # Adaptive playback as soon as packaging has started; segments fill in as they are encoded
+            "hls_url": f"{share_url}/hls/master.m3u8" if video.hls_status in ("packaging", "ready") else None,
+            # Without it browsers lacking native HLS play the MP4
+            "hls_js_url": f"/static/{HLS_JS}" if os.path.exists(os.path.join(STATIC_DIR, HLS_JS)) else None,
+            "poster_url": f"{share_url}/poster.jpg" if thumbnails else None,
+            "sprite_vtt_url": f"{share_url}/sprite.vtt" if thumbnails else None,
             "filename": video.filename,
             "upload_date": video.upload_date.strftime("%Y-%m-%d %H:%M:%S") if video.upload_date else "Unknown",
             "file_size": f"{video.file_size / (1024*1024):.1f} MB" if video.file_size else "Unknown",
+            "mime_type": mime_type,
+            "source_type": mime_type if mime_type in SOURCE_MEDIA_TYPES else None,
+            "duration": format_duration(video.duration) if video.duration else None,
+            "resolution": f"{video.width}×{video.height}" if video.width and video.height else None,
+            "codecs": " / ".join(codec for codec in (video.video_codec, video.audio_codec) if codec) or None,
+            "width": video.width or 1280,
+            "height": video.height or 720,
             "share_token": share_token,
             "domain": config.domain,
         }
-    ) 
\ No newline at end of file
+    ).body
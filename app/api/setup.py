@@ -2,27 +2,32 @@ from fastapi import APIRouter, Request, Depends
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.models import AsyncSessionLocal
+from app.models import get_db
 from app.core.config import get_config
 from app.core.security import get_admin_keys
+import os
 import json
 import qrcode
 import base64
 from io import BytesIO
+from functools import lru_cache
+from app.core.page_cache import SETUP_PAGE_KEY, page_cache
 
 router = APIRouter()
 
 # Templates directory
-templates = Jinja2Templates(directory="app/templates")
+templates = Jinja2Templates(directory=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates"))
 
-async def get_db():
-    async with AsyncSessionLocal() as session:
-        yield session
 
 def generate_qr_code(data: dict) -> str:
     """Generate QR code as base64 encoded image"""
+    return qr_code_png(json.dumps(data))
+
+@lru_cache(maxsize=32)
+def qr_code_png(payload: str) -> str:
+    """Base64 PNG of a QR code, memoized: the setup payload only changes with config and admin keys"""
     qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(json.dumps(data))
+    qr.add_data(payload)
     qr.make(fit=True)
     
     img = qr.make_image(fill_color="black", back_color="white")
@@ -35,6 +40,14 @@ def generate_qr_code(data: dict) -> str:
 @router.get("/setup", response_class=HTMLResponse)
 async def setup_page(request: Request, db: AsyncSession = Depends(get_db), config = Depends(get_config)):
     """Setup page with QR code for iOS app configuration"""
+    # Rendered once per config; adding or removing keys invalidates it
+    page = page_cache.get(SETUP_PAGE_KEY, config.version)
+    if page is None:
+        body = await render_setup_page(request, db, config)
+        page = page_cache.put(SETUP_PAGE_KEY, body, config.version)
+    return page.response(request)
+
+async def render_setup_page(request: Request, db: AsyncSession, config) -> bytes:
     # Check if admin keys exist
     admin_keys = await get_admin_keys(db)
     has_admin_keys = len(admin_keys) > 0
@@ -46,18 +59,15 @@ async def setup_page(request: Request, db: AsyncSession = Depends(get_db), confi
     # Generate QR code
     qr_code_b64 = generate_qr_code(qr_data)
     
-    # Get real client IP for display
-    client_ip = config.get_real_client_ip(request)
-    
+    # Nothing per-client goes into the page, so one rendering serves every visitor
     return templates.TemplateResponse(
+        request,
         "setup.html",
         {
-            "request": request,
             "qr_code": qr_code_b64,
             "qr_data": json.dumps(qr_data, indent=2),
             "domain": config.domain,
             "has_admin_keys": has_admin_keys,
-            "client_ip": client_ip,
             "initial_admin_configured": config.has_initial_admin_config()
         }
-    )
\ No newline at end of file
+    ).body
\ No newline at end of file
@@ -1,9 +1,31 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Form, HTTPException, Depends, Request
+from sqlalchemy import func, insert, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from app.models import AsyncSessionLocal, ChunkUpload, Video
-from app.core.security import require_signature
+from app.models import AssemblyJob, ChunkUpload, Video, get_db
+from app.core.security import (
+    UploadCredentials, issue_upload_token, require_admin_auth, require_signature, require_upload_auth
+)
+from app.core.ingest import stream_chunk_to_disk
+from app.core.raw_upload import (
+    RAW_UPLOAD_CONTENT_TYPES, append_body, current_offset, hash_file, raw_upload_path, raw_uploads
+)
+from app.core.streaming import AccelRedirectResponse, VideoStreamResponse
+from app.core.hls import HLS_FILE, MEDIA_TYPES, empty_event_playlist, hls_dir_name
+from starlette.responses import Response
+from app.core.assembly import AssemblyQueue, chunk_file_path, get_assembly_queue
+from app.core.reaper import UploadReaper, get_upload_reaper
+from app.core.transcode import (
+    TranscodeQueue, get_transcode_queue, transcoded_download_name, transcoded_name
+)
+from app.core.thumbnails import THUMBNAIL_FILES, THUMBNAIL_MEDIA_TYPES, ThumbnailCache, get_thumbnail_cache, thumbnail_name
+from app.core.media import MEDIA_COLUMNS
+from app.core.page_cache import page_cache, play_page_key
+from app.core.share_cache import NOT_FOUND, ShareCache, SharedFile, share_cache
+from app.core.playback_urls import verify_playback_token
+from app.core.metrics import UPLOAD_BYTES, UPLOADS_IN_PROGRESS
+from app.core.blobs import add_reference, collect_garbage, find_blob, release_reference, video_storage_name
+import anyio
 import uuid
 import os
 import shutil
@@ -12,9 +34,9 @@ from app.core.config import Config, get_config
 
 router = APIRouter()
 
-async def get_db():
-    async with AsyncSessionLocal() as session:
-        yield session
+CHUNK_DIGEST_MISMATCH = "Chunk digest mismatch; resend the chunk"
+RAW_SESSION_CONFLICT = "This upload_id is a raw upload; send it with PATCH /upload/raw/{upload_id}"
+
 
 def generate_unique_filename(original_filename: str) -> str:
     """Generate a unique filename to prevent overwrites"""
@@ -27,125 +49,583 @@ def generate_unique_filename(original_filename: str) -> str:
 async def initiate_upload(
     filename: str = Form(...),
     total_chunks: int = Form(...),
+    file_digest: str = Form(None),
     db: AsyncSession = Depends(get_db),
     key_id: str = Depends(require_signature),
+    transcode_queue: TranscodeQueue = Depends(get_transcode_queue),
+    config: Config = Depends(get_config),
 ):
     upload_id = str(uuid.uuid4())
     # Generate unique filename to prevent overwrites
     unique_filename = generate_unique_filename(filename)
     
-    # Store initial chunk upload session in DB
-    for chunk_number in range(1, total_chunks + 1):
-        chunk = ChunkUpload(
-            upload_id=upload_id,
-            filename=unique_filename,  # Use unique filename
-            chunk_number=chunk_number,
-            total_chunks=total_chunks,
-            received=False,
-            created_at=datetime.utcnow(),
-            uploader_key_id=key_id  # Store uploader's key_id
-        )
-        db.add(chunk)
+    if total_chunks < 1:
+        raise HTTPException(status_code=422, detail="total_chunks must be at least 1")
+
+    # A client that already knows the file digest (SHA-256 of its bytes) skips
+    # the upload entirely when those bytes are stored; keys are trusted uploaders
+    if file_digest:
+        blob = await find_blob(db, file_digest.lower())
+        if blob is not None and await add_reference(db, blob):
+            share_token = str(uuid.uuid4())
+            video = Video(
+                filename=unique_filename,
+                upload_date=datetime.utcnow(),
+                file_size=blob.file_size,
+                share_token=share_token,
+                transcoded=False,
+                uploader_key_id=key_id,
+                digest=blob.digest,
+                blob_id=blob.id
+            )
+            db.add(video)
+            await db.commit()
+            share_cache.invalidate(share_token)
+            await transcode_queue.enqueue(db, video.id)
+            return {
+                "upload_id": None,
+                "duplicate": True,
+                "share_token": share_token,
+                "video_link": f"/videos/{share_token}",
+            }
+
+    # Store initial chunk upload session in DB with a single executemany insert
+    created_at = datetime.utcnow()
+    await db.execute(insert(ChunkUpload), [
+        {
+            "upload_id": upload_id,
+            "filename": unique_filename,  # Use unique filename
+            "chunk_number": chunk_number,
+            "total_chunks": total_chunks,
+            "received": False,
+            "created_at": created_at,
+            "uploader_key_id": key_id  # Store uploader's key_id
+        }
+        for chunk_number in range(1, total_chunks + 1)
+    ])
     await db.commit()
-    return {"upload_id": upload_id}
+    return {
+        "upload_id": upload_id,
+        # Chunk and complete calls authenticate with this instead of a signature
+        "upload_token": issue_upload_token(config, upload_id, key_id, total_chunks),
+    }
 
 @router.post("/upload/chunk")
 async def upload_chunk(
-    upload_id: str = Form(...),
-    chunk_number: int = Form(...),
-    total_chunks: int = Form(...),
-    file: UploadFile = File(...),
+    request: Request,
     db: AsyncSession = Depends(get_db),
-    key_id: str = Depends(require_signature),
+    credentials: UploadCredentials = Depends(require_upload_auth),
     config: Config = Depends(get_config)
 ):
-    # Enforce key_id consistency
+    # Stream the multipart body straight to disk (fields: upload_id, chunk_number, total_chunks,
+    # optional chunk_digest (hex SHA-256), file)
+    with UPLOADS_IN_PROGRESS.track_inprogress(protocol="multipart"):
+        streamed = await stream_chunk_to_disk(request, config.chunks_dir)
+    try:
+        upload_id = streamed.field("upload_id")
+        try:
+            chunk_number = int(streamed.field("chunk_number"))
+        except ValueError:
+            raise HTTPException(status_code=422, detail="chunk_number must be an integer")
+        credentials.check_upload(upload_id)
+        if credentials.upload_id is not None:
+            # The upload token already vouches for the uploader, the chunk count and the protocol
+            if credentials.raw:
+                raise HTTPException(status_code=409, detail=RAW_SESSION_CONFLICT)
+            if not 1 <= chunk_number <= credentials.total_chunks:
+                raise HTTPException(status_code=404, detail="Chunk upload session not found")
+        else:
+            # Enforce key_id consistency (single indexed lookup on upload_id + chunk_number)
+            result = await db.execute(
+                select(ChunkUpload.uploader_key_id, ChunkUpload.upload_length).where(
+                    ChunkUpload.upload_id == upload_id,
+                    ChunkUpload.chunk_number == chunk_number
+                )
+            )
+            row = result.one_or_none()
+            if row is None:
+                raise HTTPException(status_code=404, detail="Chunk upload session not found")
+            if row.uploader_key_id != credentials.key_id:
+                raise HTTPException(status_code=403, detail="Uploader key_id mismatch for this upload_id")
+            if row.upload_length is not None:
+                # Chunk 1 of a raw upload is the file being PATCHed
+                raise HTTPException(status_code=409, detail=RAW_SESSION_CONFLICT)
+        # The digest was computed while streaming; a mismatch means the bytes were damaged in transit
+        expected_digest = streamed.fields.get("chunk_digest")
+        if expected_digest and expected_digest.lower() != streamed.digest:
+            raise HTTPException(status_code=400, detail=CHUNK_DIGEST_MISMATCH)
+    except BaseException:
+        await anyio.to_thread.run_sync(os.remove, streamed.path)
+        raise
+    # Move the streamed file into place; a rename is metadata-only on the NAS
+    chunk_path = chunk_file_path(config.chunks_dir, upload_id, chunk_number)
+    await anyio.to_thread.run_sync(os.replace, streamed.path, chunk_path)
     result = await db.execute(
-        select(ChunkUpload).where(
+        update(ChunkUpload).where(
             ChunkUpload.upload_id == upload_id,
             ChunkUpload.chunk_number == chunk_number
-        )
+        ).values(received=True, digest=streamed.digest)
+    )
+    await db.commit()
+    if result.rowcount == 0:
+        # Expired by the reaper while the token was still valid
+        await anyio.to_thread.run_sync(os.remove, chunk_path)
+        raise HTTPException(status_code=404, detail="Chunk upload session not found")
+    UPLOAD_BYTES.inc(streamed.size, protocol="multipart")
+    return {"status": "chunk received", "digest": streamed.digest}
+
+@router.get("/upload/chunks/{upload_id}")
+async def received_chunks(
+    upload_id: str,
+    db: AsyncSession = Depends(get_db),
+    key_id: str = Depends(require_signature),
+    config: Config = Depends(get_config)
+):
+    """Chunk numbers already stored for an upload, so a client can resume it (with a fresh upload token)"""
+    result = await db.execute(
+        select(ChunkUpload.chunk_number, ChunkUpload.received, ChunkUpload.total_chunks, ChunkUpload.uploader_key_id,
+               ChunkUpload.upload_length)
+        .where(ChunkUpload.upload_id == upload_id)
+        .order_by(ChunkUpload.chunk_number)
     )
-    chunk = result.scalar_one_or_none()
-    if not chunk:
+    rows = result.all()
+    if not rows:
         raise HTTPException(status_code=404, detail="Chunk upload session not found")
-    if chunk.uploader_key_id != key_id:
+    if any(row.uploader_key_id != key_id for row in rows):
         raise HTTPException(status_code=403, detail="Uploader key_id mismatch for this upload_id")
-    # Save chunk to disk using shutil
-    chunk_path = os.path.join(config.chunks_dir, f"{upload_id}_{chunk_number}.part")
-    with open(chunk_path, "wb") as f:
-        shutil.copyfileobj(file.file, f)
-    chunk.received = True
+    if rows[0].upload_length is not None:
+        raise HTTPException(status_code=409, detail=RAW_SESSION_CONFLICT)
+    return {
+        "upload_id": upload_id,
+        "total_chunks": rows[0].total_chunks,
+        "received": [row.chunk_number for row in rows if row.received],
+        "upload_token": issue_upload_token(config, upload_id, key_id, rows[0].total_chunks),
+    }
+
+@router.post("/upload/raw")
+async def create_raw_upload(
+    filename: str = Form(...),
+    upload_length: int = Form(...),
+    db: AsyncSession = Depends(get_db),
+    key_id: str = Depends(require_signature),
+    config: Config = Depends(get_config)
+):
+    """Start a raw-body upload: the file is then sent with PATCH /upload/raw/{upload_id} at increasing offsets"""
+    if upload_length < 1:
+        raise HTTPException(status_code=422, detail="upload_length must be at least 1")
+    upload_id = str(uuid.uuid4())
+    # The whole file is the one chunk of the upload, so /upload/complete and assembly work unchanged
+    db.add(ChunkUpload(
+        upload_id=upload_id,
+        filename=generate_unique_filename(filename),
+        chunk_number=1,
+        total_chunks=1,
+        received=False,
+        created_at=datetime.utcnow(),
+        uploader_key_id=key_id,
+        upload_length=upload_length
+    ))
     await db.commit()
-    return {"status": "chunk received"}
+    return {
+        "upload_id": upload_id,
+        "upload_url": f"/upload/raw/{upload_id}",
+        "upload_offset": 0,
+        "upload_token": issue_upload_token(config, upload_id, key_id, 1, raw=True),
+    }
+
+async def raw_upload_session(db: AsyncSession, upload_id: str, credentials: UploadCredentials) -> ChunkUpload:
+    credentials.check_upload(upload_id)
+    result = await db.execute(
+        select(ChunkUpload).where(ChunkUpload.upload_id == upload_id, ChunkUpload.chunk_number == 1)
+    )
+    upload = result.scalar_one_or_none()
+    if upload is None:
+        raise HTTPException(status_code=404, detail="Raw upload session not found")
+    if upload.uploader_key_id != credentials.key_id:
+        raise HTTPException(status_code=403, detail="Uploader key_id mismatch for this upload_id")
+    if upload.upload_length is None:
+        raise HTTPException(status_code=409, detail="This upload_id is a chunked upload; send it with /upload/chunk")
+    return upload
+
+@router.head("/upload/raw/{upload_id}")
+async def raw_upload_offset(
+    upload_id: str,
+    db: AsyncSession = Depends(get_db),
+    credentials: UploadCredentials = Depends(require_upload_auth),
+    config: Config = Depends(get_config)
+):
+    """How many bytes of a raw upload the server has, so the client can resume from there"""
+    upload = await raw_upload_session(db, upload_id, credentials)
+    offset = await anyio.to_thread.run_sync(current_offset, raw_upload_path(config.chunks_dir, upload_id))
+    return Response(status_code=200, headers={
+        "upload-offset": str(offset),
+        "upload-length": str(upload.upload_length),
+        "cache-control": "no-store",
+    })
+
+@router.patch("/upload/raw/{upload_id}")
+async def patch_raw_upload(
+    upload_id: str,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    credentials: UploadCredentials = Depends(require_upload_auth),
+    config: Config = Depends(get_config)
+):
+    """Append the request body at Upload-Offset; the body goes straight to the file, no multipart parsing"""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type not in RAW_UPLOAD_CONTENT_TYPES:
+        raise HTTPException(status_code=415, detail="Expected application/offset+octet-stream")
+    try:
+        offset = int(request.headers["upload-offset"])
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=400, detail="Missing or invalid Upload-Offset header")
+    upload = await raw_upload_session(db, upload_id, credentials)
+    path = raw_upload_path(config.chunks_dir, upload_id)
+
+    async with raw_uploads.lock(upload_id):
+        current = await anyio.to_thread.run_sync(current_offset, path)
+        if upload.received or offset != current:
+            raise HTTPException(status_code=409, detail="Upload-Offset does not match the bytes received",
+                                headers={"upload-offset": str(current)})
+        running_hash = raw_uploads.take_hash(upload_id, offset)
+        with UPLOADS_IN_PROGRESS.track_inprogress(protocol="raw"):
+            writer = await append_body(request, path, offset, upload.upload_length, running_hash)
+        UPLOAD_BYTES.inc(writer.bytes_written, protocol="raw")
+        new_offset = offset + writer.bytes_written
+        if new_offset == upload.upload_length:
+            raw_uploads.forget(upload_id)
+            # Continued across PATCHes when this process saw them all, otherwise read back once
+            digest = writer.digest if running_hash is not None else await anyio.to_thread.run_sync(hash_file, path)
+            upload.received = True
+            upload.digest = digest
+            await db.commit()
+        elif running_hash is not None:
+            raw_uploads.keep_hash(upload_id, new_offset, writer.running_hash)
+    return Response(status_code=204, headers={"upload-offset": str(new_offset)})
 
 @router.post("/upload/complete")
 async def complete_upload(
     upload_id: str = Form(...),
     db: AsyncSession = Depends(get_db),
-    key_id: str = Depends(require_signature),
-    config: Config = Depends(get_config)
+    credentials: UploadCredentials = Depends(require_upload_auth),
+    assembly_queue: AssemblyQueue = Depends(get_assembly_queue)
 ):
-    # Get all chunks for this upload
+    credentials.check_upload(upload_id)
+    key_id = credentials.key_id
+    # Completing twice returns the job that is already running (or retries a failed one)
+    result = await db.execute(
+        select(AssemblyJob).where(AssemblyJob.upload_id == upload_id)
+    )
+    job = result.scalar_one_or_none()
+    if job:
+        if job.uploader_key_id != key_id:
+            raise HTTPException(status_code=403, detail="Uploader key_id mismatch for this upload_id")
+        if job.status == "failed":
+            # The chunks are kept when assembly fails, so completing again retries it
+            job = await assembly_queue.retry(db, job)
+        return job_status(job)
+    # Summarise the chunks in one aggregate query instead of loading every row
     result = await db.execute(
-        select(ChunkUpload).where(ChunkUpload.upload_id == upload_id)
+        select(
+            func.count(),
+            func.count().filter(ChunkUpload.received == False),
+            func.count().filter(ChunkUpload.uploader_key_id != key_id),
+            func.min(ChunkUpload.filename),
+            func.min(ChunkUpload.total_chunks),
+        ).where(ChunkUpload.upload_id == upload_id)
     )
-    chunks = result.scalars().all()
-    if not chunks:
+    chunk_count, missing, foreign, unique_filename, total_chunks = result.one()
+    if not chunk_count:
         raise HTTPException(status_code=404, detail="No chunks found for this upload_id")
     # Enforce key_id consistency
-    if any(chunk.uploader_key_id != key_id for chunk in chunks):
+    if foreign:
         raise HTTPException(status_code=403, detail="Uploader key_id mismatch for this upload_id")
     # Ensure all chunks are received
-    if not all(chunk.received for chunk in chunks):
+    if missing or chunk_count != total_chunks:
         raise HTTPException(status_code=400, detail="Not all chunks uploaded yet")
-    unique_filename = chunks[0].filename  # This is now the unique filename
-    total_chunks = chunks[0].total_chunks
-    assembled_path = os.path.join(config.videos_dir, unique_filename)
-    # Assemble chunks using shutil
-    with open(assembled_path, "wb") as outfile:
-        for i in range(1, total_chunks + 1):
-            chunk_path = os.path.join(config.chunks_dir, f"{upload_id}_{i}.part")
-            with open(chunk_path, "rb") as infile:
-                shutil.copyfileobj(infile, outfile)
-            os.remove(chunk_path)
-    # Store video metadata in DB
-    file_size = os.path.getsize(assembled_path)
-    share_token = str(uuid.uuid4())
-    video = Video(
-        filename=unique_filename,  # Store the unique filename
-        upload_date=datetime.utcnow(),
-        file_size=file_size,
-        share_token=share_token,
-        transcoded=False,
-        uploader_key_id=key_id  # Store uploader's key_id
+    # Assemble in the background; the client polls /upload/status/{job_id}
+    job = await assembly_queue.enqueue(
+        db,
+        upload_id=upload_id,
+        filename=unique_filename,  # This is now the unique filename
+        total_chunks=total_chunks,
+        key_id=key_id
     )
-    db.add(video)
-    # Clean up chunk records
-    for chunk in chunks:
-        await db.delete(chunk)
-    await db.commit()
-    return {"status": "upload complete", "video_link": f"/videos/{share_token}"}
+    return job_status(job)
+
+@router.get("/upload/status/{job_id}")
+async def upload_status(
+    job_id: str,
+    db: AsyncSession = Depends(get_db),
+    key_id: str = Depends(require_signature)
+):
+    result = await db.execute(
+        select(AssemblyJob).where(AssemblyJob.job_id == job_id)
+    )
+    job = result.scalar_one_or_none()
+    if not job:
+        raise HTTPException(status_code=404, detail="Assembly job not found")
+    if job.uploader_key_id != key_id:
+        raise HTTPException(status_code=403, detail="Uploader key_id mismatch for this job")
+    return job_status(job)
+
+def job_status(job: AssemblyJob) -> dict:
+    """Client-facing view of an assembly job"""
+    status = {
+        "status": job.status,
+        "job_id": job.job_id,
+        "upload_id": job.upload_id,
+        "status_url": f"/upload/status/{job.job_id}",
+    }
+    if job.status == "done":
+        status["share_token"] = job.share_token
+        status["video_link"] = f"/videos/{job.share_token}"
+    elif job.status == "failed":
+        status["error"] = job.error
+    return status
+
+@router.get("/upload/videos")
+async def list_videos(
+    db: AsyncSession = Depends(get_db),
+    key_id: str = Depends(require_signature)
+):
+    """The caller's videos with their stored media metadata, newest first"""
+    result = await db.execute(
+        select(Video).where(Video.uploader_key_id == key_id).order_by(Video.id.desc())
+    )
+    return {"videos": [video_info(video) for video in result.scalars()]}
+
+def video_info(video: Video) -> dict:
+    """Client-facing view of a video; metadata comes from the row, never from the file"""
+    info = {
+        "share_token": video.share_token,
+        "filename": video.filename,
+        "file_size": video.file_size,
+        "upload_date": video.upload_date.isoformat() if video.upload_date else None,
+        "video_link": f"/videos/{video.share_token}",
+        "transcoded": bool(video.transcoded),
+    }
+    info.update({column: getattr(video, column) for column in MEDIA_COLUMNS})
+    return info
+
+def shared_file(video: Video, original: bool, config: Config) -> SharedFile:
+    """The web rendition when there is one, unless the original is asked for"""
+    if video.transcoded and not original:
+        storage_name, download_name = transcoded_name(video), transcoded_download_name(video)
+        media_type = "video/mp4"
+    else:
+        storage_name, download_name = video_storage_name(video), video.filename
+        # Sniffed at upload; videos not probed yet fall back to the extension
+        media_type = video.mime_type
+    return SharedFile(video.id, storage_name, download_name, media_type,
+                      os.path.join(config.videos_dir, storage_name))
+
+async def resolve_share(
+    db: AsyncSession, share_token: str, config: Config, original: bool = False, cache: ShareCache = None
+) -> SharedFile:
+    """Share token to the file behind it, through the share cache; 404 when the video or file is missing"""
+    cache = share_cache if cache is None else cache
+    resolved = cache.get(share_token, original, config.version)
+    if resolved is NOT_FOUND:
+        raise HTTPException(status_code=404, detail="Video not found")
+    if resolved is not None:
+        return resolved
 
-@router.get("/videos/{share_token}")
-async def share_video(share_token: str, db: AsyncSession = Depends(get_db), config: Config = Depends(get_config)):
     # Find video by share token
     result = await db.execute(
         select(Video).where(Video.share_token == share_token)
     )
     video = result.scalar_one_or_none()
-    
     if not video:
+        cache.put(share_token, original, config.version, NOT_FOUND)
         raise HTTPException(status_code=404, detail="Video not found")
+
+    return await stat_share(video, config, original, cache)
+
+async def stat_share(video: Video, config: Config, original: bool = False, cache: ShareCache = None) -> SharedFile:
+    """Check the file of a loaded video and remember it under its share token"""
+    cache = share_cache if cache is None else cache
+    resolved = shared_file(video, original, config)
+    # Offload mode: nginx serves the bytes (and 404s if the file is missing)
+    if not config.accel_redirect_prefix:
+        try:
+            resolved.stat_result = await anyio.to_thread.run_sync(os.stat, resolved.path)
+        except FileNotFoundError:
+            # Not remembered: the file may still be on its way
+            raise HTTPException(status_code=404, detail="Video file not found")
+    cache.put(video.share_token, original, config.version, resolved)
+    return resolved
+
+@router.api_route("/videos/{share_token}", methods=["GET", "HEAD"])
+async def share_video(
+    share_token: str,
+    original: bool = False,
+    db: AsyncSession = Depends(get_db),
+    config: Config = Depends(get_config)
+):
+    # Range requests after the first one are answered from the share cache
+    shared = await resolve_share(db, share_token, config, original)
     
-    # Check if file exists
-    video_path = os.path.join(config.videos_dir, video.filename)
-    if not os.path.exists(video_path):
-        raise HTTPException(status_code=404, detail="Video file not found")
+    if config.accel_redirect_prefix:
+        return AccelRedirectResponse(
+            config.accel_redirect_prefix, shared.storage_name,
+            media_type=shared.media_type, download_name=shared.download_name
+        )
     
-    # Return the video file
-    return FileResponse(
-        path=video_path,
-        filename=video.filename,
-        media_type="video/mp4"  # You might want to detect this dynamically
-    ) 
\ No newline at end of file
+    # Stream the video with range, conditional and validator support
+    return VideoStreamResponse(
+        path=shared.path,
+        filename=shared.download_name,
+        media_type=shared.media_type
+    )
+
+@router.api_route("/videos/signed/{token}", methods=["GET", "HEAD"])
+async def signed_video(request: Request, token: str, config: Config = Depends(get_config)):
+    """Serve a signed playback URL with one token check and no database or session work"""
+    claims = verify_playback_token(config, token, config.get_real_client_ip(request))
+    storage_name, media_type, download_name = claims["p"], claims["t"], claims["n"]
+
+    if config.accel_redirect_prefix:
+        return AccelRedirectResponse(
+            config.accel_redirect_prefix, storage_name, media_type=media_type, download_name=download_name
+        )
+
+    # A file deleted since the URL was signed is a 404 from the response, which opens it first
+    return VideoStreamResponse(
+        path=os.path.join(config.videos_dir, storage_name), filename=download_name, media_type=media_type
+    )
+
+# Segments never change once written; playlists only change while packaging
+HLS_SEGMENT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+HLS_PLAYLIST_CACHE_CONTROL = "public, max-age=86400"
+
+@router.api_route("/videos/{share_token}/hls/{path:path}", methods=["GET", "HEAD"])
+async def share_video_hls(
+    share_token: str,
+    path: str,
+    db: AsyncSession = Depends(get_db),
+    config: Config = Depends(get_config)
+):
+    if not HLS_FILE.match(path):
+        raise HTTPException(status_code=404, detail="Not found")
+    result = await db.execute(
+        select(Video.id, Video.hls_status).where(Video.share_token == share_token)
+    )
+    video = result.one_or_none()
+    if not video or video.hls_status not in ("packaging", "ready"):
+        raise HTTPException(status_code=404, detail="Video not found")
+
+    media_type = MEDIA_TYPES[os.path.splitext(path)[1]]
+    if path.endswith(".ts"):
+        cache_control = HLS_SEGMENT_CACHE_CONTROL
+    elif video.hls_status == "ready" or path.endswith("master.m3u8"):
+        cache_control = HLS_PLAYLIST_CACHE_CONTROL
+    else:
+        # The EVENT playlist still grows; players must re-fetch it
+        cache_control = "no-cache"
+    headers = {"cache-control": cache_control}
+    storage_name = os.path.join(hls_dir_name(video), path)
+
+    if config.accel_redirect_prefix and video.hls_status == "ready":
+        return AccelRedirectResponse(
+            config.accel_redirect_prefix, storage_name, media_type=media_type,
+            headers=headers, content_disposition_type=None
+        )
+
+    file_path = os.path.join(config.videos_dir, storage_name)
+    try:
+        await anyio.to_thread.run_sync(os.stat, file_path)
+    except FileNotFoundError:
+        if path.endswith("index.m3u8") and video.hls_status == "packaging":
+            # ffmpeg has not finished this rendition's first segment yet
+            return Response(empty_event_playlist(config.hls_segment_seconds), media_type=media_type, headers=headers)
+        raise HTTPException(status_code=404, detail="Not found")
+    return VideoStreamResponse(path=file_path, media_type=media_type, headers=headers)
+
+# Thumbnails of a video only change if they are evicted and made again, which the ETag covers
+THUMBNAIL_CACHE_CONTROL = "public, max-age=86400"
+
+@router.api_route("/videos/{share_token}/{name}", methods=["GET", "HEAD"])
+async def video_thumbnail(
+    share_token: str,
+    name: str,
+    db: AsyncSession = Depends(get_db),
+    cache: ThumbnailCache = Depends(get_thumbnail_cache),
+    transcode_queue: TranscodeQueue = Depends(get_transcode_queue)
+):
+    """Poster frame (poster.jpg) and seek-preview sprite (sprite.jpg, indexed by sprite.vtt)"""
+    if name not in THUMBNAIL_FILES:
+        raise HTTPException(status_code=404, detail="Not found")
+    result = await db.execute(select(Video.id).where(Video.share_token == share_token))
+    video_id = result.scalar_one_or_none()
+    if video_id is None:
+        raise HTTPException(status_code=404, detail="Video not found")
+    cache_name = thumbnail_name(video_id, name)
+    if await anyio.to_thread.run_sync(cache.lookup, cache_name) is None:
+        # Not made yet, or evicted: make it again in the background
+        await transcode_queue.regenerate_thumbnails(db, video_id)
+        raise HTTPException(status_code=404, detail="Thumbnail not available yet")
+    return VideoStreamResponse(
+        path=cache.path(cache_name),
+        media_type=THUMBNAIL_MEDIA_TYPES[os.path.splitext(name)[1]],
+        headers={"cache-control": THUMBNAIL_CACHE_CONTROL}
+    )
+
+@router.delete("/videos/{share_token}")
+async def delete_video(
+    share_token: str,
+    db: AsyncSession = Depends(get_db),
+    key_id: str = Depends(require_signature),
+    config: Config = Depends(get_config),
+    thumbnail_cache: ThumbnailCache = Depends(get_thumbnail_cache)
+):
+    result = await db.execute(
+        select(Video).where(Video.share_token == share_token)
+    )
+    video = result.scalar_one_or_none()
+    if not video:
+        raise HTTPException(status_code=404, detail="Video not found")
+    if video.uploader_key_id != key_id:
+        raise HTTPException(status_code=403, detail="Uploader key_id mismatch for this video")
+    await db.delete(video)
+    # Shared bytes and their rendition are removed by blob garbage collection once nothing references them
+    owned_files = []
+    if video.blob_id is not None:
+        await release_reference(db, video.blob_id)
+    else:
+        owned_files += [transcoded_name(video), video.filename]
+    await db.commit()
+    page_cache.invalidate(play_page_key(share_token))
+    share_cache.invalidate(share_token)
+    for name in owned_files:
+        try:
+            await anyio.to_thread.run_sync(os.remove, os.path.join(config.videos_dir, name))
+        except FileNotFoundError:
+            pass
+    await anyio.to_thread.run_sync(
+        lambda: shutil.rmtree(os.path.join(config.videos_dir, hls_dir_name(video)), ignore_errors=True)
+    )
+    await anyio.to_thread.run_sync(thumbnail_cache.discard, video.id)
+    return {"status": "deleted", "share_token": share_token}
+
+@router.post("/upload/blobs/gc")
+async def blob_gc(
+    db: AsyncSession = Depends(get_db),
+    admin: str = Depends(require_admin_auth),
+    config: Config = Depends(get_config)
+):
+    """Remove stored blobs no video references any more"""
+    return await collect_garbage(db, config)
+
+@router.get("/upload/reaper/stats")
+async def reaper_stats(
+    admin: str = Depends(require_admin_auth),
+    reaper: UploadReaper = Depends(get_upload_reaper)
+):
+    """What the abandoned-upload reaper has cleaned up since startup"""
+    return reaper.stats.as_dict()
+
+@router.get("/upload/share-cache/stats")
+async def share_cache_stats(admin: str = Depends(require_admin_auth)):
+    """Hit rate of share token resolution for /videos"""
+    return share_cache.stats()
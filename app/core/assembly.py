@@ -0,0 +1,324 @@
+import os
+import uuid
+import time
+import asyncio
+import logging
+import anyio
+from datetime import datetime
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.models import AsyncSessionLocal, AssemblyJob, Blob, ChunkUpload, Video
+from app.core.config import get_config
+from app.core.ingest import file_digest
+from app.core.blobs import add_reference, blob_name, find_blob
+from app.core.transcode import get_transcode_queue
+from app.core import filecopy
+from app.core.faststart import FaststartError, faststart_in_place
+from app.core.media import probe_media
+from app.core.share_cache import share_cache
+from app.core.metrics import ASSEMBLIES_IN_PROGRESS, ASSEMBLY_SECONDS
+
+# Containers worth checking for a trailing moov box
+FASTSTART_EXTENSIONS = {".mp4", ".m4v", ".mov"}
+
+
+def chunk_file_path(chunks_dir: str, upload_id: str, chunk_number: int) -> str:
+    """Path of a received chunk on disk"""
+    return os.path.join(chunks_dir, f"{upload_id}_{chunk_number}.part")
+
+
+def _append_chunk(src_path: str, dst_fd: int, offset: int, methods: list) -> int:
+    src_fd = os.open(src_path, os.O_RDONLY)
+    try:
+        count = os.fstat(src_fd).st_size
+        copied = filecopy.copy_range(src_fd, dst_fd, offset, count, methods=methods)
+        if copied != count:
+            raise IOError(f"Short copy of {src_path}: {copied} of {count} bytes")
+        return count
+    finally:
+        os.close(src_fd)
+
+
+def assemble_chunks(chunk_paths: list, dest_path: str, remove_chunks: bool = True) -> int:
+    """Assemble chunk files into ``dest_path`` without copying bytes through Python.
+
+    Each chunk is appended with the cheapest available in-kernel copy. Chunks
+    are only removed once the whole file is written, so a failed assembly can
+    be run again (completing the upload once more retries it). Returns the size
+    of the assembled file.
+    """
+    if len(chunk_paths) == 1:
+        # A single chunk (e.g. a raw upload) becomes the file with a hard link: no bytes move
+        try:
+            if os.path.exists(dest_path):
+                os.remove(dest_path)
+            os.link(chunk_paths[0], dest_path)
+        except OSError:
+            pass  # Different filesystems, or no hard links on this NAS share: copy instead
+        else:
+            if remove_chunks:
+                os.remove(chunk_paths[0])
+            return os.stat(dest_path).st_size
+    methods = list(filecopy.COPY_METHODS)
+    offset = 0
+    dst_fd = os.open(dest_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        for path in chunk_paths:
+            offset += _append_chunk(path, dst_fd, offset, methods)
+    finally:
+        os.close(dst_fd)
+    if remove_chunks:
+        for path in chunk_paths:
+            os.remove(path)
+    return offset
+
+
+class AssemblyQueue:
+    """Runs upload assembly in the background, bounded per disk, with job state kept in the DB"""
+
+    def __init__(self, session_factory, config=None, transcode_queue=None):
+        self.session_factory = session_factory
+        self._config = config
+        self._transcode_queue = transcode_queue
+        self._disk_slots = {}
+        self._tasks = set()
+        # Serialises "is this digest stored yet?" with registering a new blob in this process;
+        # other worker processes are caught by the unique digest in _place_blob
+        self._blob_lock = asyncio.Lock()
+
+    @property
+    def config(self):
+        # Follow reload_config() unless a config was given explicitly
+        return self._config or get_config()
+
+    @property
+    def transcode_queue(self):
+        return self._transcode_queue or get_transcode_queue()
+
+    async def enqueue(self, session: AsyncSession, upload_id: str, filename: str, total_chunks: int, key_id: str) -> AssemblyJob:
+        """Persist a queued job and start working on it; returns the job row"""
+        job = AssemblyJob(
+            job_id=str(uuid.uuid4()),
+            upload_id=upload_id,
+            filename=filename,
+            total_chunks=total_chunks,
+            status="queued",
+            uploader_key_id=key_id
+        )
+        session.add(job)
+        await session.commit()
+        self.schedule(job.job_id)
+        return job
+
+    async def retry(self, session: AsyncSession, job: AssemblyJob) -> AssemblyJob:
+        """Queue a failed job again; its chunks are still where the failed attempt left them"""
+        # Conditional, so two concurrent retries start a single run
+        result = await session.execute(
+            update(AssemblyJob)
+            .where(AssemblyJob.job_id == job.job_id, AssemblyJob.status == "failed")
+            .values(status="queued", error=None)
+        )
+        await session.commit()
+        if result.rowcount == 1:
+            logging.info(f"🔁 Retrying assembly of upload {job.upload_id}")
+            self.schedule(job.job_id)
+        await session.refresh(job)
+        return job
+
+    def schedule(self, job_id: str):
+        task = asyncio.create_task(self._run(job_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def resume_pending(self):
+        """Re-schedule jobs that were queued or mid-assembly when the server stopped"""
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(AssemblyJob.job_id).where(AssemblyJob.status.in_(("queued", "assembling")))
+            )
+            job_ids = result.scalars().all()
+        for job_id in job_ids:
+            self.schedule(job_id)
+        if job_ids:
+            logging.info(f"🔄 Resumed {len(job_ids)} assembly job(s)")
+
+    async def shutdown(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _slot_for(self, path: str) -> asyncio.Semaphore:
+        disk = os.stat(path).st_dev
+        if disk not in self._disk_slots:
+            self._disk_slots[disk] = asyncio.Semaphore(self.config.assembly_workers_per_disk)
+        return self._disk_slots[disk]
+
+    async def _set_status(self, session: AsyncSession, job: AssemblyJob, status: str, error: str = None):
+        job.status = status
+        job.error = error
+        await session.commit()
+
+    async def _run(self, job_id: str):
+        started = time.perf_counter()
+        with ASSEMBLIES_IN_PROGRESS.track_inprogress():
+            try:
+                outcome = await self._assemble(job_id)
+            except Exception as e:
+                # Whatever step failed, the job must not stay queued and be retried on every restart
+                outcome = await self._fail(job_id, e)
+        if outcome is not None:
+            ASSEMBLY_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
+
+    async def _fail(self, job_id: str, error: Exception):
+        """Mark a job failed, keeping its chunks; returns the outcome to record"""
+        try:
+            async with self.session_factory() as session:
+                result = await session.execute(select(AssemblyJob).where(AssemblyJob.job_id == job_id))
+                job = result.scalar_one()
+                if job.status == "done":
+                    return None
+                logging.error(f"❌ Assembly of upload {job.upload_id} failed: {error}")
+                await self._set_status(session, job, "failed", str(error))
+        except Exception as e:
+            logging.error(f"❌ Could not record the failure of assembly job {job_id} ({error}): {e}")
+        return "failed"
+
+    async def _assemble(self, job_id: str):
+        """Assemble one job; returns its outcome, or None when it had already finished.
+
+        Any exception leaves the chunks in place for ``_run`` to mark the job failed.
+        """
+        async with self.session_factory() as session:
+            result = await session.execute(select(AssemblyJob).where(AssemblyJob.job_id == job_id))
+            job = result.scalar_one()
+            if job.status in ("done", "failed"):
+                return None
+            chunk_paths = [
+                chunk_file_path(self.config.chunks_dir, job.upload_id, i)
+                for i in range(1, job.total_chunks + 1)
+            ]
+            result = await session.execute(
+                select(ChunkUpload.digest)
+                .where(ChunkUpload.upload_id == job.upload_id)
+                .order_by(ChunkUpload.chunk_number)
+            )
+            chunk_digests = result.scalars().all()
+            # Hashed before the copy, so a duplicate is never assembled; the copy itself stays in the kernel
+            digest = None
+            if chunk_digests and all(chunk_digests):
+                digest = await anyio.to_thread.run_sync(file_digest, chunk_paths, chunk_digests)
+            blob = await find_blob(session, digest) if digest else None
+            if blob is not None and await add_reference(session, blob):
+                # Same bytes are already stored: nothing to assemble
+                file_size = blob.file_size
+                outcome = "duplicate"
+                logging.info(f"♻️ Upload {job.upload_id} duplicates blob {digest[:12]}")
+            else:
+                blob = None
+                outcome = "assembled"
+                async with self._slot_for(self.config.videos_dir):
+                    await self._set_status(session, job, "assembling")
+                    if digest:
+                        # Assemble next to the blob's final location so placing it is a rename
+                        blob_path = os.path.join(self.config.videos_dir, blob_name(digest))
+                        assembled_path = os.path.join(os.path.dirname(blob_path), f".{job.job_id}.assembling")
+                        await anyio.to_thread.run_sync(lambda: os.makedirs(os.path.dirname(blob_path), exist_ok=True))
+                    else:
+                        # Chunks without digests (received before digests existed) keep the old layout
+                        assembled_path = os.path.join(self.config.videos_dir, job.filename)
+                    file_size = await anyio.to_thread.run_sync(
+                        assemble_chunks, chunk_paths, assembled_path, False
+                    )
+                    if self.config.mp4_faststart and os.path.splitext(job.filename)[1].lower() in FASTSTART_EXTENSIONS:
+                        # Video.digest still names the uploaded bytes; the blob holds the playable layout
+                        file_size = await anyio.to_thread.run_sync(self._faststart, assembled_path, file_size)
+            # Header-only probe; the result is stored so requests never need to open the file for it
+            media_path = os.path.join(self.config.videos_dir, blob_name(digest)) if blob else assembled_path
+            media_info = await anyio.to_thread.run_sync(self._probe, media_path)
+            async with self._blob_lock:
+                if digest and blob is None:
+                    blob = await self._place_blob(session, digest, assembled_path, blob_path, file_size)
+                # Create the video and drop the chunk bookkeeping in one transaction
+                share_token = str(uuid.uuid4())
+                video = Video(
+                    filename=job.filename,
+                    upload_date=datetime.utcnow(),
+                    file_size=file_size,
+                    share_token=share_token,
+                    transcoded=False,
+                    uploader_key_id=job.uploader_key_id,
+                    digest=digest,
+                    blob_id=blob.id if blob else None,
+                    **media_info
+                )
+                session.add(video)
+                await session.execute(delete(ChunkUpload).where(ChunkUpload.upload_id == job.upload_id))
+                job.share_token = share_token
+                await self._set_status(session, job, "done")
+                share_cache.invalidate(share_token)
+            logging.info(f"✅ Assembled upload {job.upload_id} into {job.filename} ({file_size} bytes)")
+            try:
+                await self.transcode_queue.enqueue(session, video.id)
+            except Exception as e:
+                # The video is playable as uploaded; only the web rendition is missing
+                logging.error(f"❌ Queueing transcode jobs for video {video.id} failed: {e}")
+        for path in chunk_paths:
+            try:
+                await anyio.to_thread.run_sync(os.remove, path)
+            except OSError:
+                # The reaper removes chunk files left behind
+                pass
+        return outcome
+
+    @staticmethod
+    def _faststart(path: str, file_size: int) -> int:
+        """Relocate moov in place; a file that can't be rewritten is kept as uploaded"""
+        try:
+            if faststart_in_place(path):
+                return os.path.getsize(path)
+        except (FaststartError, OSError) as e:
+            logging.warning(f"⚠️ Faststart skipped for {os.path.basename(path)}: {e}")
+        return file_size
+
+    @staticmethod
+    def _probe(path: str) -> dict:
+        try:
+            return probe_media(path)
+        except OSError as e:
+            logging.warning(f"⚠️ Could not probe {os.path.basename(path)}: {e}")
+            return {}
+
+    async def _place_blob(self, session: AsyncSession, digest: str, assembled_path: str,
+                          blob_path: str, file_size: int) -> Blob:
+        """Register a freshly assembled file as a blob, or drop it if an identical one appeared meanwhile"""
+        blob = await find_blob(session, digest)
+        if blob is not None and await add_reference(session, blob):
+            await anyio.to_thread.run_sync(os.remove, assembled_path)
+            return blob
+        blob = Blob(digest=digest, file_size=file_size, ref_count=1)
+        try:
+            # The row goes first: _blob_lock only covers this process, and another worker
+            # may register the same digest, which the unique constraint turns away here
+            async with session.begin_nested():
+                session.add(blob)
+        except IntegrityError:
+            blob = await find_blob(session, digest)
+            if blob is None or not await add_reference(session, blob):
+                raise
+            logging.info(f"♻️ Blob {digest[:12]} was stored by another worker meanwhile")
+            await anyio.to_thread.run_sync(os.remove, assembled_path)
+            return blob
+        await anyio.to_thread.run_sync(os.replace, assembled_path, blob_path)
+        return blob
+
+
+_assembly_queue = None
+
+def get_assembly_queue() -> AssemblyQueue:
+    """Get the process-wide assembly queue for dependency injection"""
+    global _assembly_queue
+    if _assembly_queue is None:
+        _assembly_queue = AssemblyQueue(AsyncSessionLocal)
+    return _assembly_queue
@@ -0,0 +1,114 @@
+import os
+import time
+import logging
+import anyio
+from sqlalchemy import delete, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.models import Blob, Video
+
+# Content-addressed files live under videos_dir, so nginx's X-Accel-Redirect location covers them too
+BLOBS_DIR = "blobs"
+# Web renditions; a blob's rendition is shared by every video holding a reference to it
+TRANSCODED_DIR = "transcoded"
+# Files in the blob tree without a row are only removed once they are this old (seconds),
+# so an assembly that is still writing its file is never collected
+ORPHAN_GRACE_PERIOD = 3600
+GC_BATCH_SIZE = 500
+
+
+def blob_name(digest: str) -> str:
+    """Path of a blob relative to videos_dir, fanned out by the first digest byte"""
+    return os.path.join(BLOBS_DIR, digest[:2], digest)
+
+
+def blob_rendition_name(digest: str) -> str:
+    """Path of a blob's web rendition relative to videos_dir"""
+    return os.path.join(TRANSCODED_DIR, f"{digest}.mp4")
+
+
+def video_storage_name(video: Video) -> str:
+    """Path of a video's bytes relative to videos_dir"""
+    if video.blob_id is not None:
+        return blob_name(video.digest)
+    return video.filename
+
+
+async def find_blob(session: AsyncSession, digest: str) -> Blob:
+    result = await session.execute(select(Blob).where(Blob.digest == digest))
+    return result.scalar_one_or_none()
+
+
+async def add_reference(session: AsyncSession, blob: Blob) -> bool:
+    """Count one more Video pointing at ``blob``; False if GC removed it meanwhile.
+
+    The caller commits, together with the Video row that holds the reference.
+    """
+    result = await session.execute(
+        update(Blob).where(Blob.id == blob.id).values(ref_count=Blob.ref_count + 1)
+    )
+    return result.rowcount == 1
+
+
+async def release_reference(session: AsyncSession, blob_id: int):
+    """Drop one reference; the blob is removed by the next collect_garbage pass"""
+    await session.execute(
+        update(Blob).where(Blob.id == blob_id, Blob.ref_count > 0).values(ref_count=Blob.ref_count - 1)
+    )
+
+
+def _remove(path: str) -> int:
+    """Delete a file; returns the bytes freed"""
+    try:
+        size = os.stat(path).st_size
+        os.remove(path)
+    except FileNotFoundError:
+        return 0
+    return size
+
+
+def _list_blob_files(root: str, older_than: float) -> list:
+    """Files in the blob tree last modified before ``older_than``"""
+    found = []
+    if not os.path.isdir(root):
+        return found
+    for fanout in os.scandir(root):
+        if not fanout.is_dir():
+            continue
+        for entry in os.scandir(fanout.path):
+            if entry.is_file() and entry.stat().st_mtime < older_than:
+                found.append((entry.name, entry.path))
+    return found
+
+
+async def collect_garbage(session: AsyncSession, config, grace: float = ORPHAN_GRACE_PERIOD) -> dict:
+    """Delete unreferenced blobs and blob-tree files that have no row.
+
+    Rows go first and only while still unreferenced, so a concurrent
+    duplicate upload either keeps the blob alive or no longer finds it.
+    """
+    stats = {"blobs_removed": 0, "orphans_removed": 0, "bytes_freed": 0}
+    result = await session.execute(select(Blob.id, Blob.digest).where(Blob.ref_count <= 0))
+    for blob_id, digest in result.all():
+        deleted = await session.execute(delete(Blob).where(Blob.id == blob_id, Blob.ref_count <= 0))
+        await session.commit()
+        if deleted.rowcount != 1:
+            continue
+        for name in (blob_name(digest), blob_rendition_name(digest)):
+            stats["bytes_freed"] += await anyio.to_thread.run_sync(_remove, os.path.join(config.videos_dir, name))
+        stats["blobs_removed"] += 1
+
+    # Leftovers of interrupted assemblies and rows removed by hand
+    root = os.path.join(config.videos_dir, BLOBS_DIR)
+    files = await anyio.to_thread.run_sync(_list_blob_files, root, time.time() - grace)
+    for start in range(0, len(files), GC_BATCH_SIZE):
+        batch = dict(files[start:start + GC_BATCH_SIZE])
+        result = await session.execute(select(Blob.digest).where(Blob.digest.in_(list(batch))))
+        for digest in result.scalars().all():
+            batch.pop(digest)
+        for path in batch.values():
+            stats["bytes_freed"] += await anyio.to_thread.run_sync(_remove, path)
+            stats["orphans_removed"] += 1
+    if stats["blobs_removed"] or stats["orphans_removed"]:
+        logging.info(f"🧹 Blob GC: {stats}")
+    return stats
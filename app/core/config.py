@@ -1,23 +1,142 @@
 import os
+import hashlib
+import secrets
 from fastapi import Request
 import logging
 
+UPLOAD_TOKEN_SECRET_FILE = ".upload_token_secret"
+
+
+def stored_secret(path: str) -> str:
+    """Secret kept in ``path``, generated by whichever process needs it first.
+
+    The file is published with a hard link, which fails if it already exists, so
+    concurrent workers all end up with the first secret written. When the NAS is
+    not writable the secret only lives as long as the process.
+    """
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logging.warning(f"⚠️ Could not read {path}: {e}")
+    secret = secrets.token_urlsafe(32)
+    partial = f"{path}.{os.getpid()}.tmp"
+    try:
+        fd = os.open(partial, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(secret)
+        os.link(partial, path)
+    except FileExistsError:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError as e:
+        logging.warning(f"⚠️ Could not store a secret in {path} ({e}); set it in the environment for multiple workers")
+    finally:
+        try:
+            os.remove(partial)
+        except OSError:
+            pass
+    return secret
+
+
 class Config:
-    """Application configuration"""
+    """Application configuration, read from the environment once and then immutable.
+
+    Use ``replace()`` for a modified copy and ``reload_config()`` to re-read
+    the environment.
+    """
     
-    def __init__(self):
+    def __init__(self, **overrides):
         self.domain = os.environ.get("DOMAIN", "localhost:8000")
         
         # Initial admin key configuration
         self.initial_admin_key_id = os.environ.get("INITIAL_ADMIN_KEY_ID")
         
-        self.nas_mount_path = "/nas/videos"
-        self.initial_admin_public_key_file_name = os.path.join(self.nas_mount_path, os.environ.get("INITIAL_ADMIN_PUBLIC_KEY_FILE_NAME"))
+        self.nas_mount_path = os.environ.get("NAS_MOUNT_PATH", "/nas/videos")
+        initial_admin_public_key_file_name = os.environ.get("INITIAL_ADMIN_PUBLIC_KEY_FILE_NAME")
+        self.initial_admin_public_key_file_name = (
+            os.path.join(self.nas_mount_path, initial_admin_public_key_file_name)
+            if initial_admin_public_key_file_name else None
+        )
         self.chunks_dir = os.path.join(self.nas_mount_path, "chunks")
         self.videos_dir = os.path.join(self.nas_mount_path, "videos")
+        # Database (SQLite on the NAS by default; any SQLAlchemy async URL works)
+        self.database_url = os.environ.get(
+            "DATABASE_URL", f"sqlite+aiosqlite:///{os.path.join(self.nas_mount_path, 'vide0db.sqlite3')}"
+        )
+        self.database_echo = os.environ.get("DATABASE_ECHO", "").lower() in ("1", "true", "yes")
+        self.database_pool_size = int(os.environ.get("DATABASE_POOL_SIZE", "10"))
+        self.database_max_overflow = int(os.environ.get("DATABASE_MAX_OVERFLOW", "20"))
+        # When set (e.g. "/_accel/videos/"), video bytes are served by nginx via X-Accel-Redirect
+        self.accel_redirect_prefix = os.environ.get("VIDEO_ACCEL_REDIRECT_PREFIX") or None
+        # How many uploads may be assembled at once on the same disk
+        self.assembly_workers_per_disk = int(os.environ.get("ASSEMBLY_WORKERS_PER_DISK", "2"))
+        # Optionally move the MP4 index (moov) ahead of the media data after assembly so playback
+        # starts at once; off by default because it rewrites every upload a second time
+        self.mp4_faststart = os.environ.get("MP4_FASTSTART", "false").lower() in ("1", "true", "yes")
+        # Transcoding to web-friendly H.264/AAC MP4; 0 workers disables it
+        self.ffmpeg_path = os.environ.get("FFMPEG_PATH", "ffmpeg")
+        self.transcode_workers = int(os.environ.get("TRANSCODE_WORKERS", "1"))
+        self.ffprobe_path = os.environ.get("FFPROBE_PATH", "ffprobe")
+        # HLS ladder as height:kbps pairs, e.g. "1080:5000,720:2800,480:1400"; empty disables packaging
+        self.hls_ladder = [
+            tuple(int(value) for value in rung.split(":"))
+            for rung in os.environ.get("HLS_LADDER", "").split(",") if rung.strip()
+        ]
+        self.hls_segment_seconds = int(os.environ.get("HLS_SEGMENT_SECONDS", "6"))
+        # Poster frames and seek-preview sprites, made on the transcode workers and kept in an LRU cache
+        self.thumbnails = os.environ.get("THUMBNAILS", "true").lower() in ("1", "true", "yes")
+        self.thumbnails_dir = os.path.join(self.nas_mount_path, "thumbnails")
+        self.thumbnail_cache_bytes = int(os.environ.get("THUMBNAIL_CACHE_MB", "512")) * 1024 * 1024
+        # Server secret for expiring playback URLs, whose tokens are sealed with AES-GCM under a key
+        # derived from it (hiding and authenticating the storage path); empty disables them
+        self.playback_url_secret = os.environ.get("PLAYBACK_URL_SECRET") or None
+        self.playback_url_ttl = int(os.environ.get("PLAYBACK_URL_TTL_SECONDS", str(6 * 3600)))
+        # Signed URLs only work from the address of the viewer they were made for
+        self.playback_url_bind_client = os.environ.get("PLAYBACK_URL_BIND_CLIENT", "").lower() in ("1", "true", "yes")
+        # Server secret for upload tokens; without one, a secret is generated once and kept on the
+        # NAS so every worker process (and every restart) accepts the same tokens
+        self.upload_token_secret = (
+            overrides.get("upload_token_secret") or os.environ.get("UPLOAD_TOKEN_SECRET")
+            or stored_secret(os.path.join(self.nas_mount_path, UPLOAD_TOKEN_SECRET_FILE))
+        )
+        # Uploads not completed within this many seconds are expired by the reaper
+        self.upload_ttl = int(os.environ.get("UPLOAD_TTL_SECONDS", str(24 * 3600)))
+        self.reaper_interval = int(os.environ.get("REAPER_INTERVAL_SECONDS", "600"))
+        self.reaper_batch_size = int(os.environ.get("REAPER_BATCH_SIZE", "100"))
+        # Upper bound on files the reaper deletes per second, so it never crowds out live uploads
+        self.reaper_files_per_second = float(os.environ.get("REAPER_FILES_PER_SECOND", "50"))
+        for name, value in overrides.items():
+            if not hasattr(self, name):
+                raise TypeError(f"Unknown config setting: {name}")
+            setattr(self, name, value)
+        # Changes whenever any setting does; caches of config-derived output key on it
+        settings = sorted((k, repr(v)) for k, v in vars(self).items() if not k.startswith("_"))
+        self._version = hashlib.sha1(repr(settings).encode()).hexdigest()[:12]
+        self._frozen = True
+
+    def __setattr__(self, name, value):
+        if getattr(self, "_frozen", False):
+            raise AttributeError("Config is immutable; use replace() or reload_config()")
+        super().__setattr__(name, value)
+
+    @property
+    def version(self) -> str:
+        return self._version
+
+    def replace(self, **changes) -> "Config":
+        """Copy of this config with some settings changed"""
+        settings = {k: v for k, v in vars(self).items() if not k.startswith("_")}
+        settings.update(changes)
+        return Config(**settings)
+
+    def ensure_directories(self):
+        """Create the NAS directories; done once at boot, not per request"""
         os.makedirs(self.chunks_dir, exist_ok=True)
         os.makedirs(self.videos_dir, exist_ok=True)
-
+        os.makedirs(self.thumbnails_dir, exist_ok=True)
     
     def get_real_client_ip(self, request: Request) -> str:
         """Extract real client IP from request, handling proxy headers"""
@@ -70,7 +189,17 @@ class Config:
         except Exception as e:
             return None
 
+_config = None
+
+def reload_config() -> Config:
+    """Re-read the environment and make the result the process-wide config"""
+    global _config
+    _config = Config()
+    return _config
+
 # Dependency injection function
 def get_config() -> Config:
-    """Get a config instance for dependency injection"""
-    return Config() 
\ No newline at end of file
+    """Get the process-wide config instance for dependency injection"""
+    if _config is None:
+        return reload_config()
+    return _config 
\ No newline at end of file
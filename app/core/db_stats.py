@@ -0,0 +1,93 @@
+import logging
+import time
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+from app.core.metrics import DB_QUERY_SECONDS
+
+
+class DBStats:
+    """Database work done while handling one request"""
+
+    def __init__(self):
+        self.sessions = 0
+        self.connections = 0
+        self.queries = 0
+        self.query_time = 0.0
+
+
+# Stats for the request being handled in the current context, if any
+current_db_stats: ContextVar = ContextVar("current_db_stats", default=None)
+
+
+def count_session():
+    """Called by get_db for every request-scoped session it opens"""
+    stats = current_db_stats.get()
+    if stats is not None:
+        stats.sessions += 1
+
+
+@event.listens_for(Pool, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    stats = current_db_stats.get()
+    if stats is not None:
+        stats.connections += 1
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._vide0_query_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_vide0_query_start", None)
+    elapsed = time.perf_counter() - started if started is not None else None
+    if elapsed is not None:
+        # Every query, including background jobs outside any request
+        DB_QUERY_SECONDS.observe(elapsed)
+    stats = current_db_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        if elapsed is not None:
+            stats.query_time += elapsed
+
+
+class DBStatsMiddleware:
+    """Counts sessions, pool checkouts and queries per HTTP request.
+
+    With ``expose_headers`` the counts are returned as ``X-DB-*`` response
+    headers, which is how the tests catch regressions; otherwise they are
+    only logged at debug level. Nested instances share the outer request's stats.
+    """
+
+    def __init__(self, app, expose_headers: bool = False):
+        self.app = app
+        self.expose_headers = expose_headers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or current_db_stats.get() is not None:
+            await self.app(scope, receive, send)
+            return
+        stats = DBStats()
+        token = current_db_stats.set(stats)
+
+        async def send_with_stats(message):
+            if message["type"] == "http.response.start" and self.expose_headers:
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-db-sessions", str(stats.sessions).encode()),
+                    (b"x-db-connections", str(stats.connections).encode()),
+                    (b"x-db-queries", str(stats.queries).encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            current_db_stats.reset(token)
+            logging.debug(
+                f"{scope['method']} {scope['path']}: {stats.sessions} session(s), "
+                f"{stats.connections} connection(s), {stats.queries} queries in {stats.query_time * 1000:.1f}ms"
+            )
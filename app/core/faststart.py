@@ -0,0 +1,201 @@
+import os
+import struct
+import logging
+from bisect import bisect_right
+from app.core import filecopy
+
+# Boxes on the path from moov down to the chunk offset tables; everything else is copied opaquely
+CONTAINER_BOXES = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+# moov holds only sample tables; anything bigger than this is not a file we should rewrite
+MAX_MOOV_SIZE = 256 * 1024 * 1024
+# Largest chunk offset an stco entry can hold; beyond it the table is upgraded to co64
+STCO_MAX = 0xFFFFFFFF
+
+
+class FaststartError(Exception):
+    """The file is not an MP4/QuickTime file we can safely rewrite"""
+
+
+class Box:
+    """A parsed box inside moov: either a container with children or an opaque payload"""
+
+    def __init__(self, box_type: bytes, payload: bytes = None, children: list = None):
+        self.type = box_type
+        self.payload = payload
+        self.children = children
+
+    def serialize(self, patch) -> bytes:
+        if self.children is not None:
+            body = b"".join(child.serialize(patch) for child in self.children)
+            box_type = self.type
+        else:
+            box_type, body = patch(self.type, self.payload)
+        if len(body) + 8 > 0xFFFFFFFF:
+            return struct.pack(">I4sQ", 1, box_type, len(body) + 16) + body
+        return struct.pack(">I4s", len(body) + 8, box_type) + body
+
+
+def read_box_header(read, offset: int, limit: int):
+    """``(type, header_size, box_size)`` of the box at ``offset``"""
+    header = read(16, offset)
+    if len(header) < 8:
+        raise FaststartError(f"Truncated box header at {offset}")
+    size, box_type = struct.unpack(">I4s", header[:8])
+    header_size = 8
+    if size == 1:
+        if len(header) < 16:
+            raise FaststartError(f"Truncated box header at {offset}")
+        size = struct.unpack(">Q", header[8:16])[0]
+        header_size = 16
+    elif size == 0:
+        size = limit - offset
+    if size < header_size or offset + size > limit:
+        raise FaststartError(f"Box {box_type!r} at {offset} overruns its parent")
+    return box_type, header_size, size
+
+
+def top_level_boxes(fd: int, file_size: int) -> list:
+    """``(type, offset, size)`` of every top-level box, reading only their headers"""
+    boxes = []
+    offset = 0
+    while offset < file_size:
+        box_type, _, size = read_box_header(lambda n, at: os.pread(fd, n, at), offset, file_size)
+        boxes.append((box_type, offset, size))
+        offset += size
+    return boxes
+
+
+def parse_boxes(data: bytes, box_type: bytes = None) -> Box:
+    """Parse a moov box (without its header) into a tree"""
+    children = []
+    offset = 0
+    while offset < len(data):
+        child_type, header_size, size = read_box_header(lambda n, at: data[at:at + n], offset, len(data))
+        payload = data[offset + header_size:offset + size]
+        if child_type in CONTAINER_BOXES:
+            children.append(parse_boxes(payload, child_type))
+        else:
+            children.append(Box(child_type, payload=payload))
+        offset += size
+    return Box(box_type, children=children)
+
+
+def _chunk_offsets(box_type: bytes, payload: bytes) -> list:
+    count = struct.unpack(">I", payload[4:8])[0]
+    width = 4 if box_type == b"stco" else 8
+    if len(payload) < 8 + count * width:
+        raise FaststartError(f"Truncated {box_type.decode()} table")
+    return list(struct.unpack(f">{count}{'I' if width == 4 else 'Q'}", payload[8:8 + count * width]))
+
+
+def _plan(moov: Box, boxes: list, moov_index: int, insert_at: int):
+    """Serialize moov for its new position; returns ``(moov_bytes, layout)``.
+
+    ``layout`` lists ``(old_offset, size, new_offset)`` for every other top-level box.
+    """
+    others = [box for i, box in enumerate(boxes) if i != moov_index]
+    starts = [offset for _, offset, _ in others]
+
+    def layout_for(moov_size):
+        layout = []
+        position = 0
+        for index, (_, offset, size) in enumerate(others):
+            if index == insert_at:
+                position += moov_size
+            layout.append((offset, size, position))
+            position += size
+        return layout
+
+    def make_patch(layout, use_co64):
+        def shift(offset):
+            index = bisect_right(starts, offset) - 1
+            if index < 0 or offset >= layout[index][0] + layout[index][1]:
+                raise FaststartError(f"Chunk offset {offset} is not inside a media box")
+            return offset - layout[index][0] + layout[index][2]
+
+        def patch(box_type, payload):
+            if box_type not in (b"stco", b"co64"):
+                return box_type, payload
+            offsets = [shift(offset) for offset in _chunk_offsets(box_type, payload)]
+            if box_type == b"stco" and not use_co64:
+                if offsets and max(offsets) > STCO_MAX:
+                    raise OverflowError()
+                return box_type, payload[:8] + struct.pack(f">{len(offsets)}I", *offsets)
+            return b"co64", payload[:8] + struct.pack(f">{len(offsets)}Q", *offsets)
+        return patch
+
+    # The moov size depends on whether stco must become co64, which depends on the moov size
+    moov_size = len(moov.serialize(lambda box_type, payload: (box_type, payload)))
+    for use_co64 in (False, True):
+        while True:
+            layout = layout_for(moov_size)
+            try:
+                moov_bytes = moov.serialize(make_patch(layout, use_co64))
+            except OverflowError:
+                break
+            if len(moov_bytes) == moov_size:
+                return moov_bytes, layout
+            moov_size = len(moov_bytes)
+    raise FaststartError("Could not lay out the moov box")
+
+
+def faststart(src_path: str, dest_path: str) -> bool:
+    """Write ``src_path`` to ``dest_path`` with moov ahead of the media data.
+
+    Only box headers and moov are read into memory; media data is copied with
+    the in-kernel copy methods used for assembly. Returns False (and writes
+    nothing) when the file is already faststart.
+    """
+    src_fd = os.open(src_path, os.O_RDONLY)
+    try:
+        file_size = os.fstat(src_fd).st_size
+        boxes = top_level_boxes(src_fd, file_size)
+        types = [box_type for box_type, _, _ in boxes]
+        if b"moov" not in types or b"mdat" not in types:
+            raise FaststartError("Not an MP4/QuickTime file (no moov or mdat box)")
+        moov_index = types.index(b"moov")
+        first_mdat = types.index(b"mdat")
+        if moov_index < first_mdat:
+            return False
+        _, moov_offset, moov_size = boxes[moov_index]
+        if moov_size > MAX_MOOV_SIZE:
+            raise FaststartError(f"moov box too large ({moov_size} bytes)")
+        moov_data = os.pread(src_fd, moov_size, moov_offset)
+        header_size = read_box_header(lambda n, at: moov_data[at:at + n], 0, moov_size)[1]
+        moov = parse_boxes(moov_data[header_size:], b"moov")
+
+        moov_bytes, layout = _plan(moov, boxes, moov_index, first_mdat)
+        methods = list(filecopy.COPY_METHODS)
+        dst_fd = os.open(dest_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            moov_written = False
+            for index, (old_offset, size, new_offset) in enumerate(layout):
+                if index == first_mdat:
+                    os.pwrite(dst_fd, moov_bytes, new_offset - len(moov_bytes))
+                    moov_written = True
+                if filecopy.copy_range(src_fd, dst_fd, new_offset, size, old_offset, methods) != size:
+                    raise IOError(f"Short copy of {src_path}")
+            if not moov_written:
+                raise FaststartError("moov was not placed")
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+    return True
+
+
+def faststart_in_place(path: str) -> bool:
+    """Rewrite ``path`` with moov first if needed; leaves the file untouched on any error"""
+    temp_path = f"{path}.faststart"
+    try:
+        if not faststart(path, temp_path):
+            return False
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    os.replace(temp_path, path)
+    logging.info(f"Moved moov to the front of {os.path.basename(path)}")
+    return True
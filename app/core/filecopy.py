@@ -0,0 +1,75 @@
+import os
+import errno
+import logging
+
+# Fallback copy buffer, large enough to keep NAS round trips down
+COPY_BUFFER_SIZE = 1024 * 1024
+# errno values meaning "this copy primitive is not available here", not a real I/O failure
+_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL, errno.ENOTSUP}
+
+
+def _copy_file_range(src_fd: int, dst_fd: int, offset: int, count: int, src_offset: int = 0) -> int:
+    """In-kernel copy; reflinks on btrfs/XFS and becomes a server-side copy on NFS 4.2"""
+    copied = 0
+    while copied < count:
+        n = os.copy_file_range(src_fd, dst_fd, count - copied, src_offset + copied, offset + copied)
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+def _sendfile(src_fd: int, dst_fd: int, offset: int, count: int, src_offset: int = 0) -> int:
+    """In-kernel copy through the page cache, no user-space buffers"""
+    os.lseek(dst_fd, offset, os.SEEK_SET)
+    copied = 0
+    while copied < count:
+        n = os.sendfile(dst_fd, src_fd, src_offset + copied, count - copied)
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+def _buffered_copy(src_fd: int, dst_fd: int, offset: int, count: int, src_offset: int = 0) -> int:
+    """Portable read/write fallback"""
+    copied = 0
+    while copied < count:
+        data = os.pread(src_fd, min(COPY_BUFFER_SIZE, count - copied), src_offset + copied)
+        if not data:
+            break
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(dst_fd, view, offset + copied)
+            view = view[written:]
+            copied += written
+    return copied
+
+
+# Tried in order; a method that reports "unsupported" is dropped from the caller's list
+COPY_METHODS = [
+    method for method, available in (
+        (_copy_file_range, hasattr(os, "copy_file_range")),
+        (_sendfile, hasattr(os, "sendfile")),
+        (_buffered_copy, True),
+    ) if available
+]
+
+
+def copy_range(src_fd: int, dst_fd: int, offset: int, count: int, src_offset: int = 0, methods: list = None) -> int:
+    """Copy ``count`` bytes at ``src_offset`` to ``offset`` in ``dst_fd`` with the cheapest working method.
+
+    Returns the bytes copied, short only at end of file. ``methods`` is a copy
+    of COPY_METHODS shared across calls; methods found unsupported are removed from it.
+    """
+    methods = methods if methods is not None else list(COPY_METHODS)
+    while methods:
+        try:
+            copied = methods[0](src_fd, dst_fd, offset, count, src_offset)
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED_ERRNOS or len(methods) == 1:
+                raise
+            logging.info(f"{methods[0].__name__} unavailable ({e.strerror}), falling back")
+            methods.pop(0)
+            continue
+        return copied
@@ -0,0 +1,115 @@
+import os
+import re
+import json
+from app.models import Video
+
+HLS_DIR = "hls"
+MASTER_PLAYLIST = "master.m3u8"
+# Only these names are ever served from a video's HLS directory
+HLS_FILE = re.compile(r"^(master\.m3u8|\d+p/index\.m3u8|\d+p/seg_\d+\.ts)$")
+MEDIA_TYPES = {".m3u8": "application/vnd.apple.mpegurl", ".ts": "video/mp2t"}
+AUDIO_BITRATE = 128_000
+
+
+def hls_dir_name(video: Video) -> str:
+    """Directory of a video's HLS ladder relative to videos_dir"""
+    return os.path.join(HLS_DIR, str(video.id))
+
+
+def empty_event_playlist(segment_seconds: int) -> str:
+    """Placeholder for a rendition whose first segment is not written yet; players keep reloading it"""
+    return (
+        "#EXTM3U\n#EXT-X-VERSION:3\n"
+        f"#EXT-X-TARGETDURATION:{segment_seconds}\n"
+        "#EXT-X-PLAYLIST-TYPE:EVENT\n"
+    )
+
+
+def parse_probe(output: bytes) -> dict:
+    """Source width, height, duration and whether it has audio, from ``ffprobe -of json``"""
+    probe = json.loads(output or b"{}")
+    streams = probe.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    if video is None:
+        raise ValueError("No video stream found")
+    return {
+        "width": int(video["width"]),
+        "height": int(video["height"]),
+        "audio": any(s.get("codec_type") == "audio" for s in streams),
+        # Seconds; 0 when the container does not say
+        "duration": float(probe.get("format", {}).get("duration") or 0),
+    }
+
+
+def ffprobe_command(ffprobe_path: str, source: str) -> list:
+    return [
+        ffprobe_path, "-v", "error",
+        "-show_entries", "stream=codec_type,width,height:format=duration",
+        "-of", "json", source,
+    ]
+
+
+def select_ladder(ladder: list, source_height: int) -> list:
+    """Rungs no taller than the source; the smallest rung is kept for tiny sources"""
+    ladder = sorted(ladder, reverse=True)
+    fitting = [rung for rung in ladder if rung[0] <= source_height]
+    return fitting or ladder[-1:]
+
+
+def rendition_width(height: int, source: dict) -> int:
+    # Same rounding as scale=-2: keep the aspect ratio, width even
+    return max(2, round(source["width"] * height / source["height"] / 2) * 2)
+
+
+def master_playlist(ladder: list, source: dict) -> str:
+    """Written before packaging starts, so players can open the stream right away"""
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    for height, kbps in ladder:
+        bandwidth = kbps * 1000 + (AUDIO_BITRATE if source["audio"] else 0)
+        lines.append(
+            f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={rendition_width(height, source)}x{height}"
+        )
+        lines.append(f"{height}p/index.m3u8")
+    return "\n".join(lines) + "\n"
+
+
+def ffmpeg_hls_command(ffmpeg_path: str, source_path: str, output_dir: str, ladder: list,
+                       source: dict, segment_seconds: int) -> list:
+    """One decode feeding every rendition; segments and EVENT playlists appear as they are encoded"""
+    count = len(ladder)
+    filters = [f"[0:v]split={count}" + "".join(f"[s{i}]" for i in range(count))]
+    filters += [f"[s{i}]scale=-2:{height}[v{i}]" for i, (height, _) in enumerate(ladder)]
+    command = [
+        ffmpeg_path, "-hide_banner", "-nostdin", "-y",
+        "-i", source_path,
+        "-filter_complex", ";".join(filters),
+    ]
+    stream_map = []
+    for i, (height, kbps) in enumerate(ladder):
+        command += ["-map", f"[v{i}]"]
+        if source["audio"]:
+            command += ["-map", "0:a:0"]
+        command += [
+            f"-b:v:{i}", f"{kbps}k",
+            f"-maxrate:v:{i}", f"{kbps * 107 // 100}k",
+            f"-bufsize:v:{i}", f"{kbps * 3 // 2}k",
+        ]
+        stream_map.append(f"v:{i},a:{i},name:{height}p" if source["audio"] else f"v:{i},name:{height}p")
+    command += [
+        "-c:v", "libx264", "-preset", "veryfast", "-profile:v", "main", "-pix_fmt", "yuv420p",
+        # Keyframe at every segment boundary so renditions switch cleanly
+        "-sc_threshold", "0", "-force_key_frames", f"expr:gte(t,n_forced*{segment_seconds})",
+    ]
+    if source["audio"]:
+        command += ["-c:a", "aac", "-b:a", f"{AUDIO_BITRATE // 1000}k", "-ac", "2"]
+    command += [
+        "-f", "hls",
+        "-hls_time", str(segment_seconds),
+        "-hls_playlist_type", "event",
+        # Segments are renamed into place when complete, so a served segment is never partial
+        "-hls_flags", "independent_segments+temp_file",
+        "-hls_segment_filename", os.path.join(output_dir, "%v", "seg_%05d.ts"),
+        "-var_stream_map", " ".join(stream_map),
+        os.path.join(output_dir, "%v", "index.m3u8"),
+    ]
+    return command
@@ -0,0 +1,213 @@
+import os
+import uuid
+import hashlib
+import logging
+import anyio
+from fastapi import HTTPException, Request
+from python_multipart.multipart import MultipartParser, parse_options_header
+from python_multipart.exceptions import FormParserError
+
+# Flush to disk in 1 MiB blocks so NAS writes stay large and offset-aligned
+INGEST_BUFFER_SIZE = 1024 * 1024
+# Plain form fields (upload_id, chunk_number, ...) are tiny; refuse anything bigger
+MAX_FIELD_SIZE = 64 * 1024
+# Chunk and file digests are hex SHA-256; the file digest is taken over the content itself,
+# so it is the same however the file was split into chunks (or sent raw)
+DIGEST_ALGORITHM = "sha256"
+
+
+def file_digest(chunk_paths: list, chunk_digests: list) -> str:
+    """Digest of the chunks' concatenated bytes, checking each chunk against its ingest digest.
+
+    A single chunk's digest already is the file digest (raw uploads are one
+    chunk), so it is not read again. Otherwise every chunk is read once in large
+    blocks that feed both its own hash and the file's.
+    """
+    if len(chunk_paths) == 1:
+        return chunk_digests[0]
+    combined = hashlib.new(DIGEST_ALGORITHM)
+    for path, expected in zip(chunk_paths, chunk_digests):
+        chunk = hashlib.new(DIGEST_ALGORITHM)
+        with open(path, "rb") as f:
+            while block := f.read(INGEST_BUFFER_SIZE):
+                chunk.update(block)
+                combined.update(block)
+        if chunk.hexdigest() != expected:
+            raise IOError(f"Chunk {os.path.basename(path)} changed on disk since it was received")
+    return combined.hexdigest()
+
+
+class ChunkFileWriter:
+    """Buffers incoming body bytes and writes aligned blocks to disk off the event loop.
+
+    Each block is hashed in the same worker thread that writes it, so the
+    digest costs no extra read of the data. With ``offset`` the bytes go into an
+    existing file from that position on, continuing ``running_hash`` (the hash
+    of everything before it) when one is given.
+    """
+
+    def __init__(self, path: str, buffer_size: int = INGEST_BUFFER_SIZE, offset: int = 0, running_hash=None):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.offset = offset
+        self.bytes_written = 0
+        self._hash = running_hash or hashlib.new(DIGEST_ALGORITHM)
+        self._buffer = bytearray()
+        self._fd = None
+
+    async def open(self):
+        flags = os.O_WRONLY | os.O_CREAT | (os.O_TRUNC if self.offset == 0 else 0)
+        self._fd = await anyio.to_thread.run_sync(os.open, self.path, flags, 0o644)
+        if self.offset:
+            await anyio.to_thread.run_sync(os.lseek, self._fd, self.offset, os.SEEK_SET)
+
+    async def write(self, data: bytes):
+        self._buffer += data
+        if len(self._buffer) >= self.buffer_size:
+            aligned = len(self._buffer) - len(self._buffer) % self.buffer_size
+            block = bytes(self._buffer[:aligned])
+            del self._buffer[:aligned]
+            await anyio.to_thread.run_sync(self._write_all, block)
+
+    async def close(self):
+        if self._buffer:
+            block = bytes(self._buffer)
+            self._buffer.clear()
+            await anyio.to_thread.run_sync(self._write_all, block)
+        await anyio.to_thread.run_sync(os.close, self._fd)
+        self._fd = None
+
+    async def abort(self):
+        """Close and delete a partially written file"""
+        self._buffer.clear()
+        if self._fd is not None:
+            await anyio.to_thread.run_sync(os.close, self._fd)
+            self._fd = None
+        try:
+            await anyio.to_thread.run_sync(os.remove, self.path)
+        except FileNotFoundError:
+            pass
+
+    @property
+    def digest(self) -> str:
+        """Hex digest of everything written so far"""
+        return self._hash.hexdigest()
+
+    @property
+    def running_hash(self):
+        """The hash object itself, to be continued by a later writer"""
+        return self._hash
+
+    def _write_all(self, block: bytes):
+        self._hash.update(block)
+        view = memoryview(block)
+        while view:
+            written = os.write(self._fd, view)
+            view = view[written:]
+        self.bytes_written += len(block)
+
+
+class StreamedChunk:
+    """Result of streaming a multipart chunk upload: its form fields and the file on disk"""
+
+    def __init__(self, fields: dict, path: str, size: int, digest: str = None):
+        self.fields = fields
+        self.path = path
+        self.size = size
+        self.digest = digest
+
+    def field(self, name: str) -> str:
+        try:
+            return self.fields[name]
+        except KeyError:
+            raise HTTPException(status_code=422, detail=f"Missing form field: {name}")
+
+
+async def stream_chunk_to_disk(request: Request, target_dir: str, file_field: str = "file") -> StreamedChunk:
+    """Parse a multipart body as it arrives, streaming the file part straight to disk.
+
+    The file is written to a temporary name inside ``target_dir`` because the
+    fields identifying the chunk may arrive after the file part; callers move
+    it into place with ``os.replace`` once the fields have been validated.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected multipart/form-data with a boundary")
+
+    fields = {}
+    part = {}
+    header_name = bytearray()
+    header_value = bytearray()
+    pending = []
+    file_seen = False
+
+    def on_part_begin():
+        part.clear()
+        part["headers"] = {}
+        part["data"] = bytearray()
+
+    def on_header_field(data, start, end):
+        header_name.extend(data[start:end])
+
+    def on_header_value(data, start, end):
+        header_value.extend(data[start:end])
+
+    def on_header_end():
+        part["headers"][bytes(header_name).lower()] = bytes(header_value)
+        header_name.clear()
+        header_value.clear()
+
+    def on_headers_finished():
+        nonlocal file_seen
+        _, options = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        part["name"] = options.get(b"name", b"").decode("utf-8", "replace")
+        part["is_file"] = part["name"] == file_field and b"filename" in options
+        if part["is_file"]:
+            if file_seen:
+                raise HTTPException(status_code=400, detail="Only one file part is allowed")
+            file_seen = True
+
+    def on_part_data(data, start, end):
+        if part["is_file"]:
+            pending.append(data[start:end])
+        else:
+            if len(part["data"]) + end - start > MAX_FIELD_SIZE:
+                raise HTTPException(status_code=413, detail=f"Form field {part['name']} too large")
+            part["data"].extend(data[start:end])
+
+    def on_part_end():
+        if not part["is_file"]:
+            fields[part["name"]] = part["data"].decode("utf-8", "replace")
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+    })
+
+    writer = ChunkFileWriter(os.path.join(target_dir, f".incoming-{uuid.uuid4()}"))
+    await writer.open()
+    try:
+        async for data in request.stream():
+            parser.write(data)
+            for block in pending:
+                await writer.write(block)
+            pending.clear()
+        parser.finalize()
+        await writer.close()
+    except BaseException as e:
+        await writer.abort()
+        if isinstance(e, FormParserError):
+            raise HTTPException(status_code=400, detail="Invalid multipart data")
+        raise
+
+    if not file_seen:
+        await writer.abort()
+        raise HTTPException(status_code=422, detail=f"Missing file part: {file_field}")
+
+    logging.debug(f"Streamed {writer.bytes_written} bytes to {writer.path}")
+    return StreamedChunk(fields, writer.path, writer.bytes_written, writer.digest)
@@ -0,0 +1,279 @@
+import os
+import struct
+import logging
+import anyio
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.models import Video
+from app.core.blobs import video_storage_name
+from app.core.faststart import FaststartError, read_box_header, top_level_boxes
+
+# Enough for the container signature and, in Matroska/WebM, the Info and Tracks elements
+HEAD_BYTES = 64 * 1024
+# Video columns filled in by probe_media
+MEDIA_COLUMNS = ("container", "mime_type", "duration", "width", "height", "video_codec", "audio_codec", "bitrate")
+BACKFILL_BATCH_SIZE = 200
+
+MP4_CODECS = {
+    "avc1": "h264", "avc3": "h264", "hvc1": "hevc", "hev1": "hevc", "av01": "av1", "vp09": "vp9",
+    "mp4v": "mpeg4", "apcn": "prores", "apch": "prores", "mp4a": "aac", "ac-3": "ac3", "ec-3": "eac3",
+    "opus": "opus", "flac": "flac", ".mp3": "mp3", "lpcm": "pcm", "sowt": "pcm", "twos": "pcm",
+}
+MATROSKA_CODECS = {
+    "V_MPEG4/ISO/AVC": "h264", "V_MPEGH/ISO/HEVC": "hevc", "V_AV1": "av1", "V_VP8": "vp8", "V_VP9": "vp9",
+    "A_AAC": "aac", "A_OPUS": "opus", "A_VORBIS": "vorbis", "A_AC3": "ac3", "A_EAC3": "eac3",
+    "A_FLAC": "flac", "A_MPEG/L3": "mp3", "A_PCM/INT/LIT": "pcm",
+}
+
+# Matroska element IDs (with their length marker bits, as they appear in the file)
+EBML_HEADER, EBML_DOCTYPE = 0x1A45DFA3, 0x4282
+MKV_SEGMENT, MKV_CLUSTER = 0x18538067, 0x1F43B675
+MKV_INFO, MKV_TIMECODE_SCALE, MKV_DURATION = 0x1549A966, 0x2AD7B1, 0x4489
+MKV_TRACKS, MKV_TRACK_ENTRY, MKV_TRACK_TYPE, MKV_CODEC_ID = 0x1654AE6B, 0xAE, 0x83, 0x86
+MKV_VIDEO, MKV_PIXEL_WIDTH, MKV_PIXEL_HEIGHT = 0xE0, 0xB0, 0xBA
+MKV_MASTERS = {EBML_HEADER, MKV_SEGMENT, MKV_INFO, MKV_TRACKS, MKV_TRACK_ENTRY, MKV_VIDEO}
+
+
+def sniff_container(head: bytes) -> tuple:
+    """``(container, mime_type)`` from the file's magic bytes; ``(None, None)`` if unrecognised"""
+    if head[4:8] == b"ftyp":
+        return ("mov", "video/quicktime") if head[8:12] == b"qt  " else ("mp4", "video/mp4")
+    if head[4:8] in (b"moov", b"mdat", b"wide", b"free"):
+        # QuickTime files from before ftyp existed
+        return "mov", "video/quicktime"
+    if head[:4] == struct.pack(">I", EBML_HEADER):
+        if _ebml_doctype(head) == "webm":
+            return "webm", "video/webm"
+        return "mkv", "video/x-matroska"
+    if head[:4] == b"RIFF" and head[8:12] == b"AVI ":
+        return "avi", "video/x-msvideo"
+    if head[:4] == b"OggS":
+        return "ogg", "video/ogg"
+    if head[:3] == b"FLV":
+        return "flv", "video/x-flv"
+    if head[:4] == b"\x00\x00\x01\xba":
+        return "mpeg", "video/mpeg"
+    if len(head) > 188 and head[0] == 0x47 and head[188] == 0x47:
+        return "mpegts", "video/mp2t"
+    return None, None
+
+
+def _mp4_codec(fourcc: bytes) -> str:
+    name = fourcc.decode("latin-1")
+    return MP4_CODECS.get(name.lower(), name.strip().lower())
+
+
+def _mp4_info(fd: int, file_size: int) -> dict:
+    """Duration, dimensions and codecs from moov, reading box headers and a few small boxes only.
+
+    The sample tables that make up most of moov are skipped, so this is a handful
+    of small reads whether moov is at the front or the end of the file.
+    """
+    read = lambda n, at: os.pread(fd, n, at)
+
+    def children(start, end):
+        while start + 8 <= end:
+            box_type, header_size, size = read_box_header(read, start, end)
+            yield box_type, start + header_size, start + size
+            start += size
+
+    info = {}
+    moov = next(((offset, offset + size) for box_type, offset, size in top_level_boxes(fd, file_size)
+                 if box_type == b"moov"), None)
+    if moov is None:
+        return info
+    for box_type, start, end in children(moov[0] + read_box_header(read, *moov)[1], moov[1]):
+        if box_type == b"mvhd":
+            payload = read(32, start)
+            if payload[0] == 1:
+                timescale, duration = struct.unpack(">IQ", payload[20:32])
+            else:
+                timescale, duration = struct.unpack(">II", payload[12:20])
+            if timescale:
+                info["duration"] = duration / timescale
+        elif box_type == b"trak":
+            track = _mp4_track(read, children, start, end)
+            if track.get("handler") == b"vide" and "video_codec" not in info:
+                info["video_codec"] = track.get("codec")
+                if track.get("width"):
+                    info["width"], info["height"] = track["width"], track["height"]
+            elif track.get("handler") == b"soun" and "audio_codec" not in info:
+                info["audio_codec"] = track.get("codec")
+    return info
+
+
+def _mp4_track(read, children, start, end) -> dict:
+    track = {}
+    for box_type, box_start, box_end in children(start, end):
+        if box_type == b"tkhd":
+            # Presentation size as 16.16 fixed point in the box's last 8 bytes
+            width, height = struct.unpack(">II", read(8, box_end - 8))
+            track["width"], track["height"] = width >> 16, height >> 16
+        elif box_type == b"mdia":
+            for mdia_type, mdia_start, mdia_end in children(box_start, box_end):
+                if mdia_type == b"hdlr":
+                    track["handler"] = read(12, mdia_start)[8:12]
+                elif mdia_type == b"minf":
+                    for stbl_type, stbl_start, stbl_end in children(mdia_start, mdia_end):
+                        if stbl_type != b"stbl":
+                            continue
+                        for stsd_type, stsd_start, _ in children(stbl_start, stbl_end):
+                            if stsd_type == b"stsd":
+                                # version/flags, entry count, then the first sample entry's size and format
+                                track["codec"] = _mp4_codec(read(16, stsd_start)[12:16])
+    return track
+
+
+def _ebml_vint(data: bytes, offset: int, keep_marker: bool) -> tuple:
+    """Variable-length integer at ``offset``: ``(value, length)``; value None for 'unknown size'"""
+    first = data[offset]
+    length = 1
+    while length <= 8 and not first & (0x80 >> (length - 1)):
+        length += 1
+    if length > 8 or offset + length > len(data):
+        raise ValueError("Invalid EBML integer")
+    value = first if keep_marker else first & (0xFF >> length)
+    for byte in data[offset + 1:offset + length]:
+        value = (value << 8) | byte
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        return None, length
+    return value, length
+
+
+def _ebml_elements(data: bytes, start: int, end: int):
+    """``(id, payload_start, payload_end)`` of the elements in ``data[start:end]``, stopping at the buffer's end"""
+    offset = start
+    while offset < end:
+        element_id, id_length = _ebml_vint(data, offset, keep_marker=True)
+        size, size_length = _ebml_vint(data, offset + id_length, keep_marker=False)
+        payload = offset + id_length + size_length
+        # Unknown-size and truncated masters run to the end of what we have read
+        payload_end = end if size is None else min(payload + size, end)
+        yield element_id, payload, payload_end
+        if size is None or payload + size > end:
+            return
+        offset = payload + size
+
+
+def _ebml_doctype(head: bytes) -> str:
+    try:
+        for element_id, start, end in _ebml_elements(head, 0, len(head)):
+            if element_id != EBML_HEADER:
+                break
+            for child_id, child_start, child_end in _ebml_elements(head, start, end):
+                if child_id == EBML_DOCTYPE:
+                    return head[child_start:child_end].decode("ascii", "replace")
+    except (ValueError, IndexError):
+        pass
+    return None
+
+
+def _matroska_info(head: bytes) -> dict:
+    """Duration, dimensions and codecs from the Info and Tracks elements at the start of the file"""
+    info = {}
+    uint = lambda start, end: int.from_bytes(head[start:end], "big")
+    timecode_scale = 1_000_000
+    duration = None
+
+    def walk(start, end):
+        nonlocal timecode_scale, duration
+        for element_id, payload_start, payload_end in _ebml_elements(head, start, end):
+            if element_id == MKV_CLUSTER:
+                return False
+            if element_id == MKV_TIMECODE_SCALE:
+                timecode_scale = uint(payload_start, payload_end)
+            elif element_id == MKV_DURATION:
+                fmt = ">d" if payload_end - payload_start == 8 else ">f"
+                duration = struct.unpack(fmt, head[payload_start:payload_end])[0]
+            elif element_id == MKV_TRACK_ENTRY:
+                _matroska_track(head, payload_start, payload_end, info, uint)
+            elif element_id in MKV_MASTERS:
+                if walk(payload_start, payload_end) is False:
+                    return False
+        return True
+
+    walk(0, len(head))
+    if duration is not None:
+        info["duration"] = duration * timecode_scale / 1e9
+    return info
+
+
+def _matroska_track(head: bytes, start: int, end: int, info: dict, uint):
+    track = {}
+    for element_id, payload_start, payload_end in _ebml_elements(head, start, end):
+        if element_id == MKV_TRACK_TYPE:
+            track["type"] = uint(payload_start, payload_end)
+        elif element_id == MKV_CODEC_ID:
+            codec_id = head[payload_start:payload_end].decode("ascii", "replace").rstrip("\0")
+            track["codec"] = MATROSKA_CODECS.get(codec_id) or MATROSKA_CODECS.get(
+                codec_id.rsplit("/", 1)[0], codec_id.lower()
+            )
+        elif element_id == MKV_VIDEO:
+            for video_id, video_start, video_end in _ebml_elements(head, payload_start, payload_end):
+                if video_id == MKV_PIXEL_WIDTH:
+                    track["width"] = uint(video_start, video_end)
+                elif video_id == MKV_PIXEL_HEIGHT:
+                    track["height"] = uint(video_start, video_end)
+    if track.get("type") == 1 and "video_codec" not in info:
+        info["video_codec"] = track.get("codec")
+        if track.get("width"):
+            info["width"], info["height"] = track["width"], track.get("height")
+    elif track.get("type") == 2 and "audio_codec" not in info:
+        info["audio_codec"] = track.get("codec")
+
+
+def probe_media(path: str) -> dict:
+    """Container, MIME type, duration, dimensions, codecs and bitrate of a stored video.
+
+    Reads the first ``HEAD_BYTES`` and, for MP4/QuickTime, box headers wherever
+    moov is; never decodes media. Unknown containers get ``container="unknown"``;
+    fields that cannot be read stay None. Raises OSError only.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        file_size = os.fstat(fd).st_size
+        head = os.pread(fd, HEAD_BYTES, 0)
+        container, mime_type = sniff_container(head)
+        media = dict.fromkeys(MEDIA_COLUMNS)
+        media.update(container=container or "unknown", mime_type=mime_type)
+        try:
+            if container in ("mp4", "mov"):
+                media.update(_mp4_info(fd, file_size))
+            elif container in ("mkv", "webm"):
+                media.update(_matroska_info(head))
+        except (FaststartError, ValueError, IndexError, struct.error) as e:
+            logging.warning(f"⚠️ Could not read {container} metadata of {os.path.basename(path)}: {e}")
+    finally:
+        os.close(fd)
+    if media["duration"]:
+        media["bitrate"] = int(file_size * 8 / media["duration"])
+    return media
+
+
+async def backfill_media_info(session: AsyncSession, config, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """Probe videos stored before metadata existed; returns how many were filled in"""
+    filled = 0
+    last_id = 0
+    while True:
+        result = await session.execute(
+            select(Video).where(Video.container.is_(None), Video.id > last_id).order_by(Video.id).limit(batch_size)
+        )
+        videos = result.scalars().all()
+        if not videos:
+            break
+        for video in videos:
+            last_id = video.id
+            try:
+                media = await anyio.to_thread.run_sync(
+                    probe_media, os.path.join(config.videos_dir, video_storage_name(video))
+                )
+            except OSError as e:
+                logging.warning(f"⚠️ Could not probe video {video.id}: {e}")
+                continue
+            for column, value in media.items():
+                setattr(video, column, value)
+            filled += 1
+        await session.commit()
+    if filled:
+        logging.info(f"🎞️ Read media metadata of {filled} existing video(s)")
+    return filled
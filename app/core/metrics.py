@@ -0,0 +1,236 @@
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+# Prometheus text exposition format
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Request latencies, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# DB queries and signature checks, which should take well under a millisecond each
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)
+# Bytes a response handed to the server in messages that carry no body (http.response.pathsend);
+# the response adds them to this scope key once the send has gone through
+SENT_BYTES_SCOPE_KEY = "vide0.sent_bytes"
+ASSEMBLY_BUCKETS = (0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    """A named family of samples keyed by label values.
+
+    Updates take a lock held for a dict lookup and an addition, so metrics can
+    be recorded from the event loop and from worker threads alike.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (), registry: "Registry" = None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._samples: Dict[tuple, object] = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple([str(labels[name]) for name in self.label_names])
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            samples = sorted(self._samples.items())
+            lines.extend(self._render_samples(samples))
+        return lines
+
+    def _render_samples(self, samples: list) -> list:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in samples]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._samples[key] = self._samples.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._samples.get(self._key(labels), 0)
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS, registry: "Registry" = None):
+        super().__init__(name, documentation, labels, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            sample = self._samples.get(key)
+            if sample is None:
+                # Per-bucket (not cumulative) counts, then sum and count
+                sample = self._samples[key] = [[0] * len(self.buckets), 0.0, 0]
+            i = bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                sample[0][i] += 1
+            sample[1] += value
+            sample[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        sample = self._samples.get(self._key(labels))
+        return sample[2] if sample else 0
+
+    def _render_samples(self, samples: list) -> list:
+        lines = []
+        for key, (bucket_counts, total, count) in samples:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                le = _format_labels(self.label_names, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            inf = _format_labels(self.label_names, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class Registry:
+    """The metrics served at /metrics"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: Metric):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = Counter(
+    "vide0_http_requests_total", "HTTP requests by route template and status code.", ("method", "route", "status")
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "vide0_http_request_duration_seconds", "Time from request start to the end of the response body.", ("method", "route")
+)
+HTTP_RESPONSE_BYTES = Counter(
+    "vide0_http_response_bytes_total", "Response body bytes the app handed to the server (not by nginx offload).", ("route",)
+)
+UPLOAD_BYTES = Counter(
+    "vide0_upload_bytes_total", "Upload bytes written to the chunks directory.", ("protocol",)
+)
+UPLOADS_IN_PROGRESS = Gauge(
+    "vide0_upload_requests_in_progress", "Chunk POSTs and raw PATCHes currently streaming to disk.", ("protocol",)
+)
+ASSEMBLY_SECONDS = Histogram(
+    "vide0_assembly_duration_seconds", "Time from picking up an assembly job to its video being created.",
+    ("outcome",), buckets=ASSEMBLY_BUCKETS
+)
+ASSEMBLIES_IN_PROGRESS = Gauge("vide0_assemblies_in_progress", "Assembly jobs being worked on.")
+DB_QUERY_SECONDS = Histogram(
+    "vide0_db_query_duration_seconds", "SQL statement execution time, from SQLAlchemy engine events.",
+    buckets=FAST_BUCKETS
+)
+SIGNATURE_VERIFY_SECONDS = Histogram(
+    "vide0_signature_verify_duration_seconds", "Key signature checks, including the key lookup on a cache miss.",
+    ("result",), buckets=FAST_BUCKETS
+)
+
+
+def route_label(scope) -> str:
+    """Route template (e.g. /videos/{share_token}) so share tokens never become label values"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Records per-route request counts, latency histograms and response bytes.
+
+    Costs two clock reads and a few dict updates per request. Bytes are counted
+    from the body and zero-copy messages once the server accepted them, plus what
+    the response reports under ``SENT_BYTES_SCOPE_KEY`` for path sends, so a
+    client that disconnects early is not counted for the rest of the file.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+        sent = 0
+
+        async def send_with_metrics(message):
+            nonlocal status, sent
+            message_type = message["type"]
+            if message_type == "http.response.start":
+                status = message["status"]
+            await send(message)
+            # Only counted once the server took the bytes; send() raises after a disconnect
+            if message_type == "http.response.body":
+                sent += len(message.get("body", b""))
+            elif message_type == "http.response.zerocopysend":
+                sent += message.get("count") or 0
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            route = route_label(scope)
+            HTTP_REQUESTS.inc(method=scope["method"], route=route, status=status)
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=scope["method"], route=route)
+            sent += scope.get(SENT_BYTES_SCOPE_KEY, 0)
+            if sent:
+                HTTP_RESPONSE_BYTES.inc(sent, route=route)
@@ -0,0 +1,50 @@
+import hashlib
+from fastapi import Request
+from starlette.responses import HTMLResponse, Response
+from app.core.ttl_cache import TTLCache
+
+# Browsers keep the page but ask every time; an unchanged page costs a 304
+PAGE_CACHE_CONTROL = "no-cache"
+
+
+class CachedPage:
+    """A rendered HTML page with its validator"""
+
+    def __init__(self, body: bytes, version: str):
+        self.body = body
+        self.version = version
+        self.etag = f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+
+    def response(self, request: Request) -> Response:
+        """200 with the page, or 304 when the browser already has this version"""
+        headers = {"etag": self.etag, "cache-control": PAGE_CACHE_CONTROL}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            if "*" in tags or self.etag in tags or f"W/{self.etag}" in tags:
+                return Response(status_code=304, headers=headers)
+        return HTMLResponse(self.body, headers=headers)
+
+
+class PageCache(TTLCache):
+    """Rendered pages keyed by e.g. ``play:<share_token>``, by config version"""
+
+    def __init__(self, max_size: int = 4096, ttl: float = 60):
+        super().__init__(max_size, ttl)
+
+    def get(self, key: str, version: str) -> CachedPage:
+        return super().get(key, version)
+
+    def put(self, key: str, body: bytes, version: str) -> CachedPage:
+        page = CachedPage(body, version)
+        super().put(key, page, version)
+        return page
+
+
+def play_page_key(share_token: str) -> str:
+    return f"play:{share_token}"
+
+
+SETUP_PAGE_KEY = "setup"
+
+page_cache = PageCache()
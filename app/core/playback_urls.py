@@ -0,0 +1,51 @@
+import time
+from fastapi import HTTPException
+
+from app.core.config import Config
+from app.core.share_cache import SharedFile
+from app.core.tokens import open_token, seal_token
+
+PLAYBACK_URL_PREFIX = "/videos/signed/"
+# Token scopes: bound to the viewer's address, or usable from anywhere
+CLIENT_BOUND, UNBOUND = "c", "a"
+# Claim types a playback token must have; anything else was not made by sign_playback_url.
+# The content type is null for videos not probed yet (served by extension)
+PLAYBACK_CLAIMS = {"p": str, "t": (str, type(None)), "n": str, "e": int}
+
+
+def sign_playback_url(config: Config, shared: SharedFile, client_ip: str = None, now: float = None) -> str:
+    """Expiring URL for a resolved video that /videos/signed/ serves without the database.
+
+    The token carries everything needed to serve the file (storage path, content
+    type, download name, expiry), encrypted and authenticated with a key derived
+    from the server secret, so the URL does not reveal where or under which
+    digest the file is stored. With ``client_ip`` the token is also bound to the
+    viewer's address, so the URL only works from there.
+    """
+    claims = {
+        "p": shared.storage_name,
+        "t": shared.media_type,
+        "n": shared.download_name,
+        "e": int((time.time() if now is None else now) + config.playback_url_ttl),
+    }
+    scope = UNBOUND if client_ip is None else CLIENT_BOUND
+    return f"{PLAYBACK_URL_PREFIX}{scope}.{seal_token(config.playback_url_secret, claims, client_ip)}"
+
+
+def verify_playback_token(config: Config, token: str, client_ip: str, now: float = None) -> dict:
+    """Claims of a signed playback token; 403 when forged, expired or used from another address"""
+    if not config.playback_url_secret:
+        raise HTTPException(status_code=404, detail="Not found")
+    scope, _, sealed = token.partition(".")
+    try:
+        if scope not in (CLIENT_BOUND, UNBOUND):
+            raise ValueError("unknown scope")
+        # The scope is authenticated too: dropping the binding changes the associated data
+        claims = open_token(config.playback_url_secret, sealed, client_ip if scope == CLIENT_BOUND else None)
+    except ValueError:
+        raise HTTPException(status_code=403, detail="Invalid playback URL")
+    if any(not isinstance(claims.get(name), kind) for name, kind in PLAYBACK_CLAIMS.items()):
+        raise HTTPException(status_code=403, detail="Invalid playback URL")
+    if claims["e"] < (time.time() if now is None else now):
+        raise HTTPException(status_code=403, detail="Playback URL expired")
+    return claims
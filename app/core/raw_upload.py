@@ -0,0 +1,102 @@
+import os
+import asyncio
+import hashlib
+import weakref
+from collections import OrderedDict
+import anyio
+from fastapi import HTTPException, Request
+from starlette.requests import ClientDisconnect
+from app.core.assembly import chunk_file_path
+from app.core.ingest import DIGEST_ALGORITHM, INGEST_BUFFER_SIZE, ChunkFileWriter
+
+# tus sends application/offset+octet-stream; plain octet-stream is accepted too
+RAW_UPLOAD_CONTENT_TYPES = {"application/offset+octet-stream", "application/octet-stream"}
+
+
+def raw_upload_path(chunks_dir: str, upload_id: str) -> str:
+    """A raw upload is written in place as the single chunk of its upload"""
+    return chunk_file_path(chunks_dir, upload_id, 1)
+
+
+def current_offset(path: str) -> int:
+    """Bytes received so far: whatever reached the disk, including a PATCH cut short"""
+    try:
+        return os.stat(path).st_size
+    except FileNotFoundError:
+        return 0
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.new(DIGEST_ALGORITHM)
+    with open(path, "rb") as f:
+        while block := f.read(INGEST_BUFFER_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class RawUploads:
+    """Per-upload locks and running digests of raw uploads in progress.
+
+    The digest of a raw upload is continued from PATCH to PATCH so the file is
+    never read again; when the state is gone (another process served the
+    previous PATCH, or the server restarted) it is computed from the file once
+    the upload is complete.
+    """
+
+    def __init__(self, max_hashes: int = 1024):
+        self.max_hashes = max_hashes
+        self._hashes = OrderedDict()
+        self._locks = weakref.WeakValueDictionary()
+
+    def lock(self, upload_id: str) -> asyncio.Lock:
+        lock = self._locks.get(upload_id)
+        if lock is None:
+            lock = self._locks[upload_id] = asyncio.Lock()
+        return lock
+
+    def take_hash(self, upload_id: str, offset: int):
+        """Running hash of the first ``offset`` bytes, or None when it is not known here"""
+        entry = self._hashes.pop(upload_id, None)
+        if offset == 0:
+            return hashlib.new(DIGEST_ALGORITHM)
+        if entry is None or entry[0] != offset:
+            return None
+        return entry[1]
+
+    def keep_hash(self, upload_id: str, offset: int, running_hash):
+        self._hashes[upload_id] = (offset, running_hash)
+        while len(self._hashes) > self.max_hashes:
+            self._hashes.popitem(last=False)
+
+    def forget(self, upload_id: str):
+        self._hashes.pop(upload_id, None)
+
+
+raw_uploads = RawUploads()
+
+
+async def append_body(request: Request, path: str, offset: int, length: int, running_hash=None) -> ChunkFileWriter:
+    """Stream the request body into ``path`` from ``offset`` on, without multipart parsing.
+
+    Bytes that arrive before the client goes away are kept, so the next PATCH
+    resumes after them. A body that would run past the declared length is
+    refused and nothing of it is kept.
+    """
+    writer = ChunkFileWriter(path, offset=offset, running_hash=running_hash)
+    await writer.open()
+    received = 0
+    try:
+        async for data in request.stream():
+            received += len(data)
+            if offset + received > length:
+                raise HTTPException(status_code=413, detail="Body runs past the declared Upload-Length")
+            await writer.write(data)
+    except ClientDisconnect:
+        pass
+    except BaseException as e:
+        await writer.close()
+        if isinstance(e, HTTPException):
+            await anyio.to_thread.run_sync(os.truncate, path, offset)
+        raise
+    await writer.close()
+    return writer
@@ -0,0 +1,196 @@
+import os
+import re
+import time
+import asyncio
+import logging
+import anyio
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func
+from sqlalchemy.future import select
+from app.models import AsyncSessionLocal, AssemblyJob, ChunkUpload
+from app.core.config import get_config
+from app.core.assembly import chunk_file_path
+
+# Files in chunks_dir without a session are only removed once they are this old (seconds);
+# .incoming-* files are chunks still being streamed in
+ORPHAN_GRACE_PERIOD = 3600
+_CHUNK_FILE = re.compile(r"^(?P<upload_id>.+)_(?P<chunk_number>\d+)\.part$")
+
+
+class ReaperStats:
+    """Totals since startup plus the outcome of the last run"""
+
+    def __init__(self):
+        self.runs = 0
+        self.uploads_expired = 0
+        self.rows_deleted = 0
+        self.files_removed = 0
+        self.orphans_removed = 0
+        self.bytes_freed = 0
+        self.errors = 0
+        self.last_run_at = None
+        self.last_run_seconds = None
+
+    def as_dict(self) -> dict:
+        stats = dict(vars(self))
+        stats["last_run_at"] = self.last_run_at.isoformat() if self.last_run_at else None
+        return stats
+
+
+class RateLimiter:
+    """Spaces out operations so at most ``rate`` happen per second"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = time.monotonic()
+
+    async def wait(self):
+        now = time.monotonic()
+        if self._next > now:
+            await asyncio.sleep(self._next - now)
+        self._next = max(self._next, now) + self.interval
+
+
+def _remove(path: str):
+    """Delete a file; returns the bytes freed, or None if it was already gone"""
+    try:
+        size = os.stat(path).st_size
+        os.remove(path)
+    except FileNotFoundError:
+        return None
+    return size
+
+
+def _scan_chunks_dir(chunks_dir: str, older_than: float) -> list:
+    """``(upload_id or None, path)`` for files last modified before ``older_than``"""
+    found = []
+    with os.scandir(chunks_dir) as entries:
+        for entry in entries:
+            if not entry.is_file() or entry.stat().st_mtime >= older_than:
+                continue
+            match = _CHUNK_FILE.match(entry.name)
+            if match:
+                found.append((match["upload_id"], entry.path))
+            elif entry.name.startswith(".incoming-"):
+                found.append((None, entry.path))
+    return found
+
+
+class UploadReaper:
+    """Periodically expires abandoned chunk uploads and removes orphaned chunk files.
+
+    Sessions whose ``created_at`` is older than ``config.upload_ttl`` and that
+    have no queued or running assembly job lose their rows and ``.part`` files.
+    Work is done in batches of ``reaper_batch_size`` uploads and file deletions
+    are paced to ``reaper_files_per_second``.
+    """
+
+    def __init__(self, session_factory, config=None):
+        self.session_factory = session_factory
+        self._config = config
+        self.stats = ReaperStats()
+        self._task = None
+
+    @property
+    def config(self):
+        # Follow reload_config() unless a config was given explicitly
+        return self._config or get_config()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.config.reaper_interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.stats.errors += 1
+                logging.error(f"❌ Upload reaper run failed: {e}")
+
+    async def run_once(self) -> dict:
+        """One pass: expire stale sessions, then reconcile chunks_dir against the DB"""
+        started = time.monotonic()
+        limiter = RateLimiter(self.config.reaper_files_per_second)
+        expired = await self._expire_sessions(limiter)
+        orphans = await self._remove_orphans(limiter)
+        self.stats.runs += 1
+        self.stats.last_run_at = datetime.utcnow()
+        self.stats.last_run_seconds = time.monotonic() - started
+        if expired or orphans:
+            logging.info(f"🧹 Reaped {expired} abandoned upload(s) and {orphans} orphaned chunk file(s)")
+        return self.stats.as_dict()
+
+    async def _expire_sessions(self, limiter: RateLimiter) -> int:
+        cutoff = datetime.utcnow() - timedelta(seconds=self.config.upload_ttl)
+        active_jobs = select(AssemblyJob.upload_id).where(AssemblyJob.status.in_(("queued", "assembling")))
+        expired = 0
+        while True:
+            async with self.session_factory() as session:
+                result = await session.execute(
+                    select(ChunkUpload.upload_id, func.max(ChunkUpload.total_chunks))
+                    .where(ChunkUpload.created_at < cutoff, ChunkUpload.upload_id.not_in(active_jobs))
+                    .group_by(ChunkUpload.upload_id)
+                    .limit(self.config.reaper_batch_size)
+                )
+                batch = result.all()
+                if not batch:
+                    return expired
+                # Rows first: once they are gone a late chunk for the upload is refused
+                result = await session.execute(
+                    delete(ChunkUpload).where(ChunkUpload.upload_id.in_([upload_id for upload_id, _ in batch]))
+                )
+                await session.commit()
+                self.stats.rows_deleted += result.rowcount
+            for upload_id, total_chunks in batch:
+                for chunk_number in range(1, total_chunks + 1):
+                    path = chunk_file_path(self.config.chunks_dir, upload_id, chunk_number)
+                    await limiter.wait()
+                    freed = await anyio.to_thread.run_sync(_remove, path)
+                    if freed is not None:
+                        self.stats.files_removed += 1
+                        self.stats.bytes_freed += freed
+            expired += len(batch)
+            self.stats.uploads_expired += len(batch)
+
+    async def _remove_orphans(self, limiter: RateLimiter) -> int:
+        files = await anyio.to_thread.run_sync(
+            _scan_chunks_dir, self.config.chunks_dir, time.time() - ORPHAN_GRACE_PERIOD
+        )
+        removed = 0
+        batch_size = self.config.reaper_batch_size
+        for start in range(0, len(files), batch_size):
+            batch = files[start:start + batch_size]
+            upload_ids = {upload_id for upload_id, _ in batch if upload_id}
+            async with self.session_factory() as session:
+                result = await session.execute(
+                    select(ChunkUpload.upload_id).where(ChunkUpload.upload_id.in_(upload_ids)).distinct()
+                )
+                live = set(result.scalars().all())
+            for upload_id, path in batch:
+                if upload_id in live:
+                    continue
+                await limiter.wait()
+                freed = await anyio.to_thread.run_sync(_remove, path)
+                if freed is not None:
+                    self.stats.bytes_freed += freed
+                    removed += 1
+        self.stats.orphans_removed += removed
+        return removed
+
+
+_upload_reaper = None
+
+def get_upload_reaper() -> UploadReaper:
+    """Get the process-wide upload reaper"""
+    global _upload_reaper
+    if _upload_reaper is None:
+        _upload_reaper = UploadReaper(AsyncSessionLocal)
+    return _upload_reaper
@@ -1,23 +1,39 @@
 import base64
 import os
+import time
 from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
 from cryptography.hazmat.primitives import serialization
 from cryptography.exceptions import InvalidSignature
-from typing import Dict, List
+from typing import List
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from app.models import AsyncSessionLocal, PublicKey
-from app.core.config import get_config
+from app.models import PublicKey, get_db
+from app.core.config import Config, get_config
+from app.core.tokens import decode_token, encode_token
+from app.core.page_cache import SETUP_PAGE_KEY, page_cache
+from app.core.ttl_cache import TTLCache
+from app.core.metrics import SIGNATURE_VERIFY_SECONDS
 
 from fastapi import HTTPException, Header, Depends, Request
 import logging
 
 
-# Database helper functions
-async def get_db():
-    async with AsyncSessionLocal() as session:
-        yield session
+class KeyringCache(TTLCache):
+    """Parsed Ed25519 public keys and admin flags, keyed by key_id"""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300):
+        super().__init__(max_size, ttl)
+
+    def get(self, key_id: str):
+        """Return ``(public_key, is_admin)`` or None"""
+        return super().get(key_id)
 
+    def put(self, key_id: str, public_key: Ed25519PublicKey, is_admin: bool):
+        super().put(key_id, (public_key, is_admin))
+
+keyring_cache = KeyringCache()
+
+# Database helper functions
 async def get_public_key_by_id(session: AsyncSession, key_id: str) -> PublicKey:
     """Get a public key by key_id from the database"""
     result = await session.execute(
@@ -32,7 +48,7 @@ async def add_public_key_to_db(
     is_admin: bool = False,
     created_by: str = None,
     domain: str = None,
-    config = Depends(get_config)
+    config = None
 ) -> PublicKey:
     """Add a public key to the database"""
     # Check if key already exists
@@ -51,11 +67,13 @@ async def add_public_key_to_db(
         public_key_pem=public_key_pem,
         is_admin=is_admin,
         created_by=created_by,
-        domain=domain or config.domain
+        domain=domain or (config or get_config()).domain
     )
     session.add(public_key)
     await session.commit()
     await session.refresh(public_key)
+    keyring_cache.invalidate(key_id)
+    page_cache.invalidate(SETUP_PAGE_KEY)
     return public_key
 
 async def remove_public_key_from_db(session: AsyncSession, key_id: str) -> bool:
@@ -66,6 +84,8 @@ async def remove_public_key_from_db(session: AsyncSession, key_id: str) -> bool:
     
     await session.delete(public_key)
     await session.commit()
+    keyring_cache.invalidate(key_id)
+    page_cache.invalidate(SETUP_PAGE_KEY)
     return True
 
 async def get_all_public_keys(session: AsyncSession) -> List[PublicKey]:
@@ -85,6 +105,18 @@ async def is_admin_key(session: AsyncSession, key_id: str) -> bool:
     public_key = await get_public_key_by_id(session, key_id)
     return public_key.is_admin if public_key else False
 
+async def load_public_key(session: AsyncSession, key_id: str):
+    """``(public_key, is_admin)`` of a whitelisted key from the keyring cache or the database; None if unknown"""
+    cached = keyring_cache.get(key_id)
+    if cached:
+        return cached
+    public_key_record = await get_public_key_by_id(session, key_id)
+    if not public_key_record:
+        return None
+    public_key = serialization.load_pem_public_key(public_key_record.public_key_pem.encode(), backend=None)
+    keyring_cache.put(key_id, public_key, public_key_record.is_admin)
+    return public_key, public_key_record.is_admin
+
 # Require admin authentication
 async def require_admin_auth(
     key_id: str = Header(...),
@@ -96,8 +128,10 @@ async def require_admin_auth(
     # First verify the signature
     await require_signature(key_id, signature, message, session)
     
-    # Then check if it's an admin key
-    if not await is_admin_key(session, key_id):
+    # Then check if it's an admin key (the verification above left it in the keyring cache)
+    cached = keyring_cache.get(key_id)
+    is_admin = cached[1] if cached else await is_admin_key(session, key_id)
+    if not is_admin:
         raise HTTPException(status_code=401, detail="Not authorized: not admin key")
     
     return key_id
@@ -109,23 +143,86 @@ async def require_signature(
     session: AsyncSession = Depends(get_db)
 ):
     """Verify signature for any key"""
-    # Get the public key from database
     logging.info(f"Verifying signature for key_id: {key_id}")
-    public_key_record = await get_public_key_by_id(session, key_id)
-    if not public_key_record:
-        logging.error(f"❌ Key not found: {key_id}")
-        raise HTTPException(status_code=401, detail="Key not found")
+    started = time.perf_counter()
     try:
-        # Load the public key
-        public_key = serialization.load_pem_public_key(
-            public_key_record.public_key_pem.encode(),
-            backend=None
-        )
+        loaded = await load_public_key(session, key_id)
+        if loaded is None:
+            logging.error(f"❌ Key not found: {key_id}")
+            raise HTTPException(status_code=401, detail="Key not found")
+        public_key = loaded[0]
         # Verify the signature
         signature_bytes = base64.b64decode(signature)
         message_bytes = base64.b64decode(message)
         public_key.verify(signature_bytes, message_bytes)
+    except HTTPException:
+        SIGNATURE_VERIFY_SECONDS.observe(time.perf_counter() - started, result="unknown_key")
+        raise
     except (ValueError, InvalidSignature, Exception) as e:
+        SIGNATURE_VERIFY_SECONDS.observe(time.perf_counter() - started, result="invalid")
         raise HTTPException(status_code=401, detail=f"Invalid signature: {str(e)}")
-    
-    return key_id
\ No newline at end of file
+    SIGNATURE_VERIFY_SECONDS.observe(time.perf_counter() - started, result="valid")
+    return key_id
+
+
+def issue_upload_token(config: Config, upload_id: str, key_id: str, total_chunks: int, now: float = None,
+                       raw: bool = False) -> str:
+    """Bearer token for the chunk and complete calls of one upload.
+
+    It is an HMAC over the upload_id, the uploader's key_id, the chunk count,
+    the protocol (``raw`` for PATCH uploads) and an expiry (the upload TTL: the
+    reaper expires the upload by then anyway), so checking it costs one MAC
+    instead of a key lookup and an Ed25519 verify.
+    """
+    claims = {
+        "u": upload_id,
+        "k": key_id,
+        "n": total_chunks,
+        "e": int((time.time() if now is None else now) + config.upload_ttl),
+    }
+    if raw:
+        claims["r"] = 1
+    return encode_token(config.upload_token_secret, claims)
+
+
+class UploadCredentials:
+    """Who is calling an upload endpoint, and for which upload when a bearer token was used"""
+
+    def __init__(self, key_id: str, upload_id: str = None, total_chunks: int = None, raw: bool = False):
+        self.key_id = key_id
+        # None when the caller signed the request with its key
+        self.upload_id = upload_id
+        self.total_chunks = total_chunks
+        # Token issued for a raw (PATCH) upload
+        self.raw = raw
+
+    def check_upload(self, upload_id: str):
+        if self.upload_id is not None and self.upload_id != upload_id:
+            raise HTTPException(status_code=403, detail="Upload token is for another upload_id")
+
+
+async def require_upload_auth(
+    authorization: str = Header(None),
+    key_id: str = Header(None),
+    signature: str = Header(None),
+    message: str = Header(None),
+    session: AsyncSession = Depends(get_db),
+    config: Config = Depends(get_config)
+) -> UploadCredentials:
+    """Accept an upload token from /upload/initiate, or a key signature as for any other call"""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            claims = decode_token(config.upload_token_secret, token.strip())
+        except ValueError:
+            raise HTTPException(status_code=401, detail="Invalid upload token")
+        if claims["e"] < time.time():
+            raise HTTPException(status_code=401, detail="Upload token expired")
+        # Removing a key revokes its tokens (as soon as the keyring entry goes, in other workers)
+        if await load_public_key(session, claims["k"]) is None:
+            raise HTTPException(status_code=401, detail="Key not found")
+        return UploadCredentials(claims["k"], claims["u"], claims["n"], bool(claims.get("r")))
+    if not (key_id and signature and message):
+        raise HTTPException(status_code=401, detail="Upload token or key signature required")
+    return UploadCredentials(await require_signature(key_id, signature, message, session))
+
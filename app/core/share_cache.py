@@ -0,0 +1,79 @@
+import os
+from typing import Dict
+from app.core.ttl_cache import TTLCache
+
+
+class SharedFile:
+    """What a share token resolves to: the file to serve and how to serve it"""
+
+    __slots__ = ("video_id", "storage_name", "download_name", "media_type", "path", "stat_result")
+
+    def __init__(self, video_id: int, storage_name: str, download_name: str, media_type: str,
+                 path: str, stat_result: os.stat_result = None):
+        self.video_id = video_id
+        self.storage_name = storage_name
+        self.download_name = download_name
+        self.media_type = media_type
+        self.path = path
+        # None in offload mode, where nginx stats the file
+        self.stat_result = stat_result
+
+    @property
+    def size(self) -> int:
+        return self.stat_result.st_size if self.stat_result else None
+
+    @property
+    def mtime(self) -> float:
+        return self.stat_result.st_mtime if self.stat_result else None
+
+
+# Cached answer for a token no video has
+NOT_FOUND = object()
+
+
+class ShareCache(TTLCache):
+    """``(share_token, original)`` to the resolved ``SharedFile``, by config version.
+
+    A player sends dozens of Range requests per video; only the first one pays
+    for the query and the stat. Unknown tokens are remembered too (for the
+    shorter ``negative_ttl``) so scanners cannot turn guesses into queries.
+    Creating, deleting or re-transcoding a video invalidates its token.
+    """
+
+    def __init__(self, max_size: int = 8192, ttl: float = 60, negative_ttl: float = 10):
+        super().__init__(max_size, ttl)
+        self.negative_ttl = negative_ttl
+        self.negative_hits = 0
+
+    def get(self, share_token: str, original: bool, version: str):
+        """Return the ``SharedFile``, ``NOT_FOUND``, or None when nothing is cached"""
+        return super().get((share_token, original), version)
+
+    def put(self, share_token: str, original: bool, version: str, value):
+        ttl = self.negative_ttl if value is NOT_FOUND else self.ttl
+        super().put((share_token, original), value, version, ttl)
+
+    def invalidate(self, share_token: str = None):
+        """Drop both renditions of one token, or every entry when share_token is None"""
+        if share_token is None:
+            super().invalidate()
+        else:
+            super().invalidate((share_token, False))
+            super().invalidate((share_token, True))
+
+    def _count_hit(self, value):
+        if value is NOT_FOUND:
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            **super().stats(),
+            "negative_hits": self.negative_hits,
+            "hit_rate": round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+share_cache = ShareCache()
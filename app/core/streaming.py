@@ -0,0 +1,293 @@
+import os
+import stat
+import mimetypes
+from email.utils import formatdate, parsedate_to_datetime
+from secrets import token_hex
+from urllib.parse import quote
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from app.core.metrics import SENT_BYTES_SCOPE_KEY
+
+# Large reads keep NAS round trips (SMB/NFS) down; 1 MiB matches the ingest block size
+STREAM_READ_SIZE = 1024 * 1024
+# More ranges than this in one request is a scanner, not a player; serve the whole file
+MAX_RANGES = 32
+
+mimetypes.add_type("video/x-matroska", ".mkv")
+mimetypes.add_type("video/webm", ".webm")
+mimetypes.add_type("video/quicktime", ".mov")
+
+
+def guess_media_type(filename: str) -> str:
+    """Content type from the file extension"""
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range_header(value: str, size: int) -> list:
+    """Parse a ``Range`` header into sorted, merged ``(start, end)`` pairs (end exclusive).
+
+    Returns an empty list when the header should be ignored (malformed or too
+    many ranges) and raises ``RangeNotSatisfiable`` when no range overlaps the file.
+    """
+    units, _, spec = value.partition("=")
+    if units.strip().lower() != "bytes" or not spec:
+        return []
+    parts = spec.split(",")
+    if len(parts) > MAX_RANGES:
+        return []
+    ranges = []
+    for part in parts:
+        first, sep, last = part.strip().partition("-")
+        if not sep:
+            return []
+        try:
+            if first:
+                start = int(first)
+                end = int(last) + 1 if last else max(size, start + 1)
+                if start >= end:
+                    return []
+            else:
+                # Suffix range: the last N bytes
+                length = int(last)
+                if length == 0:
+                    continue
+                start, end = max(size - length, 0), size
+        except ValueError:
+            return []
+        if start < size:
+            ranges.append((start, min(end, size)))
+    if not ranges:
+        raise RangeNotSatisfiable()
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def content_disposition(filename: str, disposition_type: str = "attachment") -> str:
+    """Content-Disposition value, RFC 5987-encoded when the name is not plain ASCII"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition_type}; filename*=utf-8''{quoted}"
+    return f'{disposition_type}; filename="{filename}"'
+
+
+class AccelRedirectResponse(Response):
+    """Empty response telling nginx to serve ``filename`` from an internal location.
+
+    nginx keeps our Content-Type and Content-Disposition and handles ranges,
+    validators and sendfile itself, so no video bytes pass through Python.
+    """
+
+    def __init__(self, prefix: str, filename: str, media_type: str = None, headers: dict = None,
+                 download_name: str = None, content_disposition_type: str = "attachment"):
+        download_name = download_name or os.path.basename(filename)
+        super().__init__(
+            status_code=200,
+            media_type=media_type or guess_media_type(download_name),
+            headers=headers,
+        )
+        # filename may include subdirectories of the internal location (e.g. blobs/ab/abcd...)
+        self.headers["x-accel-redirect"] = prefix.rstrip("/") + "/" + quote(filename)
+        if content_disposition_type:
+            self.headers["content-disposition"] = content_disposition(download_name, content_disposition_type)
+
+
+class VideoStreamResponse(Response):
+    """Serves a video file with validators, conditional requests and byte ranges.
+
+    Handles single and multi-range (multipart/byteranges) 206 responses, suffix
+    ranges, If-Range, and 304 via If-None-Match / If-Modified-Since. The file
+    is opened and stat'ed before the status line goes out. Bytes go out through
+    the ASGI ``pathsend``/``zerocopysend`` extensions (sendfile) when the server
+    offers them. uvicorn, which this app ships with, offers neither, so there
+    every byte passes through Python in 1 MiB positioned reads in a worker
+    thread; for zero-copy serving put nginx in front (``AccelRedirectResponse``).
+    """
+
+    def __init__(self, path: str, filename: str = None, media_type: str = None,
+                 content_disposition_type: str = "attachment", headers: dict = None):
+        self.path = path
+        self.status_code = 200
+        self.media_type = media_type or guess_media_type(filename or path)
+        self.background = None
+        self.init_headers(headers)
+        if filename is not None:
+            self.headers["content-disposition"] = content_disposition(filename, content_disposition_type)
+
+    @staticmethod
+    def make_etag(stat_result: os.stat_result) -> str:
+        """Strong validator from size and nanosecond mtime"""
+        return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+    def _not_modified(self, request_headers: Headers, etag: str, mtime: float) -> bool:
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            # Weak comparison is allowed for If-None-Match
+            return "*" in tags or etag in tags or f"W/{etag}" in tags
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _if_range_matches(self, if_range: str, etag: str, last_modified: str) -> bool:
+        # If-Range requires a strong comparison
+        if if_range.startswith("W/"):
+            return False
+        return if_range == etag or if_range == last_modified
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # Opened before anything is sent: a file deleted or replaced since the caller looked it up
+        # (e.g. through the share cache) is a clean 404, never a 200 whose body breaks off
+        try:
+            fd = await anyio.to_thread.run_sync(os.open, self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Not found")
+        try:
+            await self._serve(scope, receive, send, fd)
+        finally:
+            with anyio.CancelScope(shield=True):
+                await anyio.to_thread.run_sync(os.close, fd)
+
+    async def _serve(self, scope: Scope, receive: Receive, send: Send, fd: int) -> None:
+        spec_version = tuple(map(int, scope.get("asgi", {}).get("spec_version", "2.0").split(".")))
+        if spec_version >= (2, 4):
+            # The server raises OSError from send() once the client is gone
+            await self._respond(scope, send, fd)
+            return
+        # Older servers keep accepting send() after a disconnect; stop reading the file ourselves
+        async with anyio.create_task_group() as task_group:
+            async def respond():
+                await self._respond(scope, send, fd)
+                task_group.cancel_scope.cancel()
+
+            task_group.start_soon(respond)
+            while True:
+                if (await receive())["type"] == "http.disconnect":
+                    task_group.cancel_scope.cancel()
+                    break
+
+    async def _respond(self, scope: Scope, send: Send, fd: int) -> None:
+        # Validators and lengths describe the file that is actually open
+        stat_result = await anyio.to_thread.run_sync(os.fstat, fd)
+        if not stat.S_ISREG(stat_result.st_mode):
+            raise RuntimeError(f"File at path {self.path} is not a file.")
+        size = stat_result.st_size
+        etag = self.make_etag(stat_result)
+        last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+        self.headers["etag"] = etag
+        self.headers["last-modified"] = last_modified
+        self.headers["accept-ranges"] = "bytes"
+
+        request_headers = Headers(scope=scope)
+        head_only = scope["method"].upper() == "HEAD"
+
+        if self._not_modified(request_headers, etag, stat_result.st_mtime):
+            await self._send_headers(send, 304, drop=("content-length", "content-type", "content-disposition"))
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        ranges = []
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if range_header and (if_range is None or self._if_range_matches(if_range, etag, last_modified)):
+            try:
+                ranges = parse_range_header(range_header, size)
+            except RangeNotSatisfiable:
+                self.headers["content-range"] = f"bytes */{size}"
+                await self._send_headers(send, 416, content_length=0, drop=("content-type",))
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+        if not ranges:
+            await self._send_headers(send, 200, content_length=size)
+            if not head_only:
+                await self._send_file_range(scope, send, fd, 0, size, more_body=False, whole_file=True)
+            else:
+                await send({"type": "http.response.body", "body": b""})
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            self.headers["content-range"] = f"bytes {start}-{end - 1}/{size}"
+            await self._send_headers(send, 206, content_length=end - start)
+            if not head_only:
+                await self._send_file_range(scope, send, fd, start, end, more_body=False)
+            else:
+                await send({"type": "http.response.body", "body": b""})
+        else:
+            await self._send_multipart(scope, send, fd, ranges, size, head_only)
+
+    async def _send_headers(self, send: Send, status: int, content_length: int = None, drop: tuple = ()):
+        for name in drop:
+            if name in self.headers:
+                del self.headers[name]
+        if content_length is not None:
+            self.headers["content-length"] = str(content_length)
+        await send({"type": "http.response.start", "status": status, "headers": self.raw_headers})
+
+    async def _send_multipart(self, scope: Scope, send: Send, fd: int, ranges: list, size: int, head_only: bool):
+        boundary = token_hex(13)
+        part_headers = [
+            (f"--{boundary}\r\nContent-Type: {self.media_type}\r\n"
+             f"Content-Range: bytes {start}-{end - 1}/{size}\r\n\r\n").encode("latin-1")
+            for start, end in ranges
+        ]
+        trailer = f"--{boundary}--\r\n".encode("latin-1")
+        content_length = sum(len(h) + (end - start) + 2 for h, (start, end) in zip(part_headers, ranges)) + len(trailer)
+        self.headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+        await self._send_headers(send, 206, content_length=content_length)
+        if head_only:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        for header, (start, end) in zip(part_headers, ranges):
+            await send({"type": "http.response.body", "body": header, "more_body": True})
+            await self._send_file_range(scope, send, fd, start, end, more_body=True)
+            await send({"type": "http.response.body", "body": b"\r\n", "more_body": True})
+        await send({"type": "http.response.body", "body": trailer, "more_body": False})
+
+    async def _send_file_range(self, scope: Scope, send: Send, fd: int, start: int, end: int,
+                               more_body: bool, whole_file: bool = False):
+        extensions = scope.get("extensions") or {}
+        if whole_file and not more_body and "http.response.pathsend" in extensions:
+            await send({"type": "http.response.pathsend", "path": str(self.path)})
+            # The message has no byte count, so report it for the metrics middleware
+            scope[SENT_BYTES_SCOPE_KEY] = scope.get(SENT_BYTES_SCOPE_KEY, 0) + end - start
+            return
+        if "http.response.zerocopysend" in extensions:
+            # The server calls os.sendfile on our descriptor
+            with os.fdopen(fd, "rb", closefd=False) as file:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file,
+                    "offset": start,
+                    "count": end - start,
+                    "more_body": more_body,
+                })
+            return
+        # uvicorn and hypercorn offer neither extension, so this is the path they take
+        position = start
+        while position < end:
+            data = await anyio.to_thread.run_sync(os.pread, fd, min(STREAM_READ_SIZE, end - position), position)
+            if not data:
+                raise RuntimeError(f"File at path {self.path} is shorter than expected.")
+            position += len(data)
+            await send({"type": "http.response.body", "body": data, "more_body": more_body or position < end})
+        if start == end and not more_body:
+            await send({"type": "http.response.body", "body": b""})
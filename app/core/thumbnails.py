@@ -0,0 +1,211 @@
+import os
+import math
+import time
+import logging
+import threading
+from collections import OrderedDict
+from app.core.config import get_config
+
+POSTER = "poster.jpg"
+SPRITE = "sprite.jpg"
+SPRITE_VTT = "sprite.vtt"
+# Only these names are ever served for a video
+THUMBNAIL_FILES = (POSTER, SPRITE, SPRITE_VTT)
+THUMBNAIL_MEDIA_TYPES = {".jpg": "image/jpeg", ".vtt": "text/vtt"}
+POSTER_MAX_HEIGHT = 720
+# Seek previews: at most SPRITE_COLUMNS x SPRITE_ROWS tiles, no closer together than one second
+SPRITE_TILE_WIDTH = 160
+SPRITE_COLUMNS = 10
+SPRITE_ROWS = 10
+SPRITE_MIN_INTERVAL = 1.0
+# A hit only rewrites the file's atime once it is older than this (seconds); the in-memory
+# index orders hits in between, so a popular thumbnail does not cost a metadata write per view
+ATIME_RESOLUTION = 3600
+
+
+def thumbnail_name(video_id: int, name: str) -> str:
+    """Flat cache file name of one of a video's thumbnail files"""
+    return f"{video_id}-{name}"
+
+
+def poster_seek(source: dict) -> float:
+    """A tenth into the video, at most ten seconds, to skip black lead-in frames"""
+    return round(min(source["duration"] / 10, 10.0), 3)
+
+
+def poster_command(ffmpeg_path: str, source_path: str, target: str, source: dict) -> list:
+    return [
+        ffmpeg_path, "-hide_banner", "-nostdin", "-y",
+        "-ss", str(poster_seek(source)),
+        "-i", source_path,
+        "-frames:v", "1",
+        "-vf", f"scale=-2:'min({POSTER_MAX_HEIGHT},ih)'",
+        "-q:v", "3",
+        "-f", "mjpeg", target,
+    ]
+
+
+def sprite_layout(source: dict) -> dict:
+    """Tile size, grid and seconds between tiles for a video's seek preview sheet"""
+    max_tiles = SPRITE_COLUMNS * SPRITE_ROWS
+    interval = max(source["duration"] / max_tiles, SPRITE_MIN_INTERVAL)
+    count = max(1, min(max_tiles, math.ceil(source["duration"] / interval)))
+    columns = min(SPRITE_COLUMNS, count)
+    return {
+        "interval": interval,
+        "count": count,
+        "columns": columns,
+        "rows": math.ceil(count / columns),
+        "width": SPRITE_TILE_WIDTH,
+        "height": max(2, round(SPRITE_TILE_WIDTH * source["height"] / source["width"] / 2) * 2),
+    }
+
+
+def sprite_command(ffmpeg_path: str, source_path: str, target: str, layout: dict) -> list:
+    """One frame every ``interval`` seconds, tiled into a single JPEG"""
+    return [
+        ffmpeg_path, "-hide_banner", "-nostdin", "-y",
+        "-i", source_path,
+        "-an",
+        "-vf", (
+            f"fps=1/{layout['interval']:.3f},scale={layout['width']}:{layout['height']},"
+            f"tile={layout['columns']}x{layout['rows']}"
+        ),
+        "-frames:v", "1",
+        "-q:v", "5",
+        "-f", "mjpeg", target,
+    ]
+
+
+def _timestamp(seconds: float) -> str:
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:06.3f}"
+
+
+def sprite_vtt(layout: dict, duration: float) -> str:
+    """WebVTT mapping time ranges to tiles of the sprite sheet (``sprite.jpg#xywh=...``)"""
+    lines = ["WEBVTT", ""]
+    for i in range(layout["count"]):
+        start = i * layout["interval"]
+        end = max(min(start + layout["interval"], duration), start + 0.001)
+        x = (i % layout["columns"]) * layout["width"]
+        y = (i // layout["columns"]) * layout["height"]
+        lines += [
+            f"{_timestamp(start)} --> {_timestamp(end)}",
+            f"{SPRITE}#xywh={x},{y},{layout['width']},{layout['height']}",
+            "",
+        ]
+    return "\n".join(lines)
+
+
+class ThumbnailCache:
+    """Size-bounded directory of generated thumbnails with least-recently-used eviction.
+
+    Recency is kept in memory and, to the nearest ``ATIME_RESOLUTION``, in the
+    file's atime, which ``lookup`` sets explicitly (mtime is left alone so ETags
+    stay stable), so the order survives restarts and is shared with other worker
+    processes. Each process keeps its own index of the
+    directory; a file evicted by another process is simply a miss here.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = None  # name -> size, least recently used first
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                # Dot files are generations in progress
+                if entry.is_file() and not entry.name.startswith("."):
+                    stat_result = entry.stat()
+                    found.append((stat_result.st_atime_ns, entry.name, stat_result.st_size))
+        self._entries = OrderedDict((name, size) for _, name, size in sorted(found))
+        self._size = sum(self._entries.values())
+
+    def lookup(self, name: str) -> os.stat_result:
+        """Stat of the cached file, marked as just used; None on a miss"""
+        with self._lock:
+            self._load()
+            path = self.path(name)
+            try:
+                stat_result = os.stat(path)
+            except FileNotFoundError:
+                self._size -= self._entries.pop(name, 0)
+                self.misses += 1
+                return None
+            now = time.time_ns()
+            if stat_result.st_atime_ns < now - ATIME_RESOLUTION * 1_000_000_000:
+                os.utime(path, ns=(now, stat_result.st_mtime_ns))
+            if name not in self._entries:
+                self._size += stat_result.st_size
+            self._entries[name] = stat_result.st_size
+            self._entries.move_to_end(name)
+            self.hits += 1
+            return stat_result
+
+    def store(self, name: str, source_path: str):
+        """Move a finished file into the cache, evicting the least recently used files over the limit"""
+        with self._lock:
+            self._load()
+            size = os.path.getsize(source_path)
+            os.replace(source_path, self.path(name))
+            self._size += size - self._entries.pop(name, 0)
+            self._entries[name] = size
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                oldest, oldest_size = self._entries.popitem(last=False)
+                self._size -= oldest_size
+                self.evictions += 1
+                try:
+                    os.remove(self.path(oldest))
+                except FileNotFoundError:
+                    pass
+                logging.info(f"🧹 Evicted thumbnail {oldest} ({oldest_size} bytes)")
+
+    def discard(self, video_id: int):
+        """Drop every thumbnail of a deleted video"""
+        with self._lock:
+            self._load()
+            for name in THUMBNAIL_FILES:
+                name = thumbnail_name(video_id, name)
+                self._size -= self._entries.pop(name, 0)
+                try:
+                    os.remove(self.path(name))
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._load()
+            return {
+                "files": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_thumbnail_cache = None
+
+def get_thumbnail_cache() -> ThumbnailCache:
+    """Get the process-wide thumbnail cache for dependency injection"""
+    global _thumbnail_cache
+    if _thumbnail_cache is None:
+        config = get_config()
+        _thumbnail_cache = ThumbnailCache(config.thumbnails_dir, config.thumbnail_cache_bytes)
+    return _thumbnail_cache
@@ -0,0 +1,83 @@
+import os
+import hmac
+import json
+import base64
+import hashlib
+from typing import Callable
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+NONCE_SIZE = 12
+
+
+def b64url_encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def b64url_decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _mac(secret: str, payload: bytes, context: str = None) -> bytes:
+    message = payload if context is None else payload + b"\0" + context.encode()
+    return hmac.new(secret.encode(), message, hashlib.sha256).digest()
+
+
+def encode_token(secret: str, claims: dict, context: str = None) -> str:
+    """``<payload>.<mac>``: base64url JSON claims and their HMAC-SHA256 under ``secret``.
+
+    ``context`` is covered by the MAC without being carried in the token, so the
+    verifier must supply the same value (e.g. the client address) to accept it.
+    """
+    payload = json.dumps(claims, separators=(",", ":")).encode()
+    return f"{b64url_encode(payload)}.{b64url_encode(_mac(secret, payload, context))}"
+
+
+def decode_token(secret: str, token: str, context: Callable[[dict], str] = None) -> dict:
+    """Claims of a token made by ``encode_token``; ValueError when it is malformed or forged.
+
+    ``context`` maps the (not yet trusted) claims to the context the token must
+    have been signed with. Expiry is left to the caller.
+    """
+    encoded_payload, _, encoded_signature = token.partition(".")
+    try:
+        payload, signature = b64url_decode(encoded_payload), b64url_decode(encoded_signature)
+        claims = json.loads(payload)
+        expected = _mac(secret, payload, context(claims) if context else None)
+    except (ValueError, TypeError, AttributeError):
+        raise ValueError("malformed token")
+    if not isinstance(claims, dict) or not hmac.compare_digest(expected, signature):
+        raise ValueError("bad signature")
+    return claims
+
+
+def _seal_key(secret: str) -> AESGCM:
+    # Derived, so the same secret never keys both the MAC and the cipher
+    return AESGCM(hashlib.sha256(b"vide0 sealed token\0" + secret.encode()).digest())
+
+
+def seal_token(secret: str, claims: dict, context: str = None) -> str:
+    """base64url of a random nonce and the claims encrypted with AES-256-GCM.
+
+    Like ``encode_token``, but the claims can only be read with the secret, for
+    tokens that end up in URLs. ``context`` is authenticated as associated data
+    without being carried in the token.
+    """
+    nonce = os.urandom(NONCE_SIZE)
+    payload = json.dumps(claims, separators=(",", ":")).encode()
+    return b64url_encode(nonce + _seal_key(secret).encrypt(nonce, payload, (context or "").encode()))
+
+
+def open_token(secret: str, token: str, context: str = None) -> dict:
+    """Claims of a token made by ``seal_token``; ValueError when it is malformed, forged or for another context"""
+    try:
+        data = b64url_decode(token)
+        if len(data) <= NONCE_SIZE:
+            raise ValueError("short token")
+        payload = _seal_key(secret).decrypt(data[:NONCE_SIZE], data[NONCE_SIZE:], (context or "").encode())
+        claims = json.loads(payload)
+    except (ValueError, TypeError, InvalidTag):
+        raise ValueError("malformed or forged token")
+    if not isinstance(claims, dict):
+        raise ValueError("malformed token")
+    return claims
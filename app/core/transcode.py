@@ -0,0 +1,357 @@
+import os
+import uuid
+import shutil
+import asyncio
+import logging
+import anyio
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.models import AsyncSessionLocal, TranscodeJob, Video
+from app.core.config import get_config
+from app.core.blobs import TRANSCODED_DIR, blob_rendition_name, find_blob, video_storage_name
+from app.core.page_cache import page_cache, play_page_key
+from app.core.share_cache import share_cache
+from app.core.hls import (
+    MASTER_PLAYLIST, ffmpeg_hls_command, ffprobe_command, hls_dir_name, master_playlist, parse_probe, select_ladder
+)
+from app.core.thumbnails import (
+    POSTER, SPRITE, SPRITE_VTT, ThumbnailCache, get_thumbnail_cache, poster_command, sprite_command, sprite_layout,
+    sprite_vtt, thumbnail_name
+)
+
+# Enough of ffmpeg's stderr to explain a failure without filling the jobs table
+ERROR_TAIL = 2000
+
+
+def transcoded_name(video: Video) -> str:
+    """Path of a video's web rendition relative to videos_dir; videos with the same bytes share it"""
+    if video.blob_id is not None:
+        return blob_rendition_name(video.digest)
+    return os.path.join(TRANSCODED_DIR, f"{video.id}.mp4")
+
+
+def transcoded_download_name(video: Video) -> str:
+    return os.path.splitext(video.filename)[0] + ".mp4"
+
+
+def ffmpeg_command(ffmpeg_path: str, source: str, target: str) -> list:
+    """H.264/AAC in MP4 with the moov atom up front, at most 1080p, playable by every browser"""
+    return [
+        ffmpeg_path, "-hide_banner", "-nostdin", "-y",
+        "-i", source,
+        "-map", "0:v:0", "-map", "0:a:0?",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "23",
+        "-profile:v", "high", "-pix_fmt", "yuv420p",
+        "-vf", "scale=-2:'min(1080,ih)'",
+        "-c:a", "aac", "-b:a", "128k", "-ac", "2",
+        "-movflags", "+faststart",
+        "-f", "mp4", target,
+    ]
+
+
+class TranscodeQueue:
+    """Transcodes videos in the background with at most ``transcode_workers`` ffmpeg processes.
+
+    Each video gets an ``mp4`` job (web rendition), a ``thumbnails`` job (poster
+    and seek-preview sprite, into the thumbnail cache) and, with ``HLS_LADDER``
+    set, an ``hls`` job packaging an adaptive ladder under ``hls/<video id>/``.
+
+    Jobs live in the DB so queued and interrupted work is picked up again at startup.
+    """
+
+    def __init__(self, session_factory, config=None, thumbnail_cache: ThumbnailCache = None):
+        self.session_factory = session_factory
+        self._config = config
+        self._thumbnail_cache = thumbnail_cache
+        self._slots = None
+        self._tasks = set()
+
+    @property
+    def config(self):
+        # Follow reload_config() unless a config was given explicitly
+        return self._config or get_config()
+
+    @property
+    def thumbnail_cache(self) -> ThumbnailCache:
+        return self._thumbnail_cache or get_thumbnail_cache()
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.transcode_workers > 0
+
+    def kinds(self) -> list:
+        """Job kinds every new video gets"""
+        kinds = ["mp4"]
+        if self.config.thumbnails:
+            kinds.append("thumbnails")
+        if self.config.hls_ladder:
+            kinds.append("hls")
+        return kinds
+
+    async def enqueue(self, session: AsyncSession, video_id: int, kinds: list = None) -> list:
+        """Persist queued jobs for a video (by default every kind in ``kinds()``) and start them"""
+        if not self.enabled:
+            return []
+        kinds = self.kinds() if kinds is None else kinds
+        jobs = [TranscodeJob(job_id=str(uuid.uuid4()), video_id=video_id, kind=kind, status="queued") for kind in kinds]
+        session.add_all(jobs)
+        await session.commit()
+        for job in jobs:
+            self.schedule(job.job_id)
+        return jobs
+
+    def schedule(self, job_id: str):
+        task = asyncio.create_task(self._run(job_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def regenerate_thumbnails(self, session: AsyncSession, video_id: int):
+        """Queue a thumbnails job for a video whose thumbnails were evicted.
+
+        Nothing is queued while one is pending, or once one failed (a video without
+        a decodable frame would otherwise be retried on every page view).
+        """
+        if not self.enabled or not self.config.thumbnails:
+            return
+        result = await session.execute(
+            select(TranscodeJob.id).where(
+                TranscodeJob.video_id == video_id,
+                TranscodeJob.kind == "thumbnails",
+                TranscodeJob.status.in_(("queued", "running", "failed")),
+            )
+        )
+        if result.first() is None:
+            await self.enqueue(session, video_id, ["thumbnails"])
+
+    async def resume_pending(self):
+        """Re-schedule jobs that were queued or running when the server stopped"""
+        if not self.enabled:
+            return
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(TranscodeJob.job_id).where(TranscodeJob.status.in_(("queued", "running")))
+            )
+            job_ids = result.scalars().all()
+        for job_id in job_ids:
+            self.schedule(job_id)
+        if job_ids:
+            logging.info(f"🔄 Resumed {len(job_ids)} transcode job(s)")
+
+    async def shutdown(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _slot(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.config.transcode_workers)
+        return self._slots
+
+    async def _set_status(self, session: AsyncSession, job: TranscodeJob, status: str, error: str = None):
+        job.status = status
+        job.error = error
+        await session.commit()
+
+    async def _run(self, job_id: str):
+        try:
+            await self._process(job_id)
+        except Exception as e:
+            # Whatever step failed, the job must not stay queued and be retried on every restart
+            await self._fail(job_id, e)
+
+    async def _fail(self, job_id: str, error: Exception):
+        """Mark a job failed after an error outside its ffmpeg work"""
+        try:
+            async with self.session_factory() as session:
+                result = await session.execute(select(TranscodeJob).where(TranscodeJob.job_id == job_id))
+                job = result.scalar_one()
+                if job.status == "done":
+                    return
+                logging.error(f"❌ Transcode job {job_id} failed: {error}")
+                await self._set_status(session, job, "failed", str(error)[-ERROR_TAIL:])
+        except Exception as e:
+            logging.error(f"❌ Could not record the failure of transcode job {job_id} ({error}): {e}")
+
+    async def _process(self, job_id: str):
+        async with self.session_factory() as session:
+            result = await session.execute(select(TranscodeJob).where(TranscodeJob.job_id == job_id))
+            job = result.scalar_one()
+            if job.status in ("done", "failed"):
+                return
+            result = await session.execute(select(Video).where(Video.id == job.video_id))
+            video = result.scalar_one_or_none()
+            if video is None:
+                await self._set_status(session, job, "failed", "Video was deleted")
+                return
+            source = os.path.join(self.config.videos_dir, video_storage_name(video))
+            # Kept as plain values: a failed commit below expires the ORM objects
+            kind, video_id, share_token = job.kind, video.id, video.share_token
+            outputs = self._outputs(job.kind, video)
+            error = None
+            async with self._slot():
+                await self._set_status(session, job, "running")
+                try:
+                    if job.kind == "hls":
+                        await self._package_hls(session, video, source)
+                    elif job.kind == "thumbnails":
+                        await self._thumbnails(job, video, source)
+                    else:
+                        await self._transcode(job, video, source)
+                except Exception as e:
+                    error = e
+            try:
+                await self._finish(session, job_id, kind, video_id, outputs, error)
+            except Exception as e:
+                logging.error(f"❌ Recording the {kind} job for video {video_id} failed: {e}")
+                await session.rollback()
+                result = await session.execute(select(TranscodeJob).where(TranscodeJob.job_id == job_id))
+                await self._set_status(session, result.scalar_one(), "failed", str(e)[-ERROR_TAIL:])
+            page_cache.invalidate(play_page_key(share_token))
+            share_cache.invalidate(share_token)
+
+    def _outputs(self, kind: str, video: Video) -> dict:
+        """What a job writes, so it can be removed if the video is deleted while the job runs"""
+        if kind == "hls":
+            return {"dir": os.path.join(self.config.videos_dir, hls_dir_name(video))}
+        if kind == "mp4":
+            # A blob's rendition stays while another video still references the blob
+            return {"file": os.path.join(self.config.videos_dir, transcoded_name(video)),
+                    "digest": video.digest if video.blob_id is not None else None}
+        return {}
+
+    async def _finish(self, session: AsyncSession, job_id: str, kind: str, video_id: int, outputs: dict,
+                      error: Exception = None):
+        """Record a job's outcome against the rows as they are now, not as they were when it started"""
+        # Drop whatever a failed step left pending (e.g. a commit on a video deleted meanwhile)
+        await session.rollback()
+        result = await session.execute(select(TranscodeJob).where(TranscodeJob.job_id == job_id))
+        job = result.scalar_one()
+        result = await session.execute(select(Video).where(Video.id == video_id))
+        video = result.scalar_one_or_none()
+        if video is None:
+            logging.info(f"🗑️ Video {video_id} was deleted during its {kind} job; discarding the output")
+            await self._discard_outputs(session, kind, video_id, outputs)
+            await self._set_status(session, job, "failed", "Video was deleted")
+            return
+        if error is not None:
+            logging.error(f"❌ {kind} job for video {video_id} failed: {error}")
+            if kind == "hls":
+                video.hls_status = "failed"
+            await self._set_status(session, job, "failed", str(error)[-ERROR_TAIL:])
+            return
+        if kind == "hls":
+            video.hls_status = "ready"
+        elif kind == "mp4":
+            video.transcoded = True
+        # The player page links the new rendition or stream, and /videos serves the new rendition
+        await self._set_status(session, job, "done")
+        logging.info(f"✅ {kind} job for video {video_id} done")
+
+    async def _discard_outputs(self, session: AsyncSession, kind: str, video_id: int, outputs: dict):
+        if kind == "hls":
+            await anyio.to_thread.run_sync(lambda: shutil.rmtree(outputs["dir"], ignore_errors=True))
+        elif kind == "thumbnails":
+            await anyio.to_thread.run_sync(self.thumbnail_cache.discard, video_id)
+        elif kind == "mp4":
+            blob = await find_blob(session, outputs["digest"]) if outputs["digest"] else None
+            if blob is None or blob.ref_count <= 0:
+                await self._discard(outputs["file"])
+
+    async def _transcode(self, job: TranscodeJob, video: Video, source: str):
+        target = os.path.join(self.config.videos_dir, transcoded_name(video))
+        if await anyio.to_thread.run_sync(os.path.exists, target):
+            # Another upload of the same bytes was transcoded already
+            return
+        partial = os.path.join(os.path.dirname(target), f".{job.job_id}.mp4")
+        await anyio.to_thread.run_sync(lambda: os.makedirs(os.path.dirname(target), exist_ok=True))
+        try:
+            await self._ffmpeg(source, partial)
+            await anyio.to_thread.run_sync(os.replace, partial, target)
+        except BaseException:
+            await self._discard(partial)
+            raise
+
+    async def _package_hls(self, session: AsyncSession, video: Video, source_path: str):
+        """Write the master playlist, mark the video playable, then let ffmpeg fill in segments"""
+        source = parse_probe(await self._exec(ffprobe_command(self.config.ffprobe_path, source_path)))
+        ladder = select_ladder(self.config.hls_ladder, source["height"])
+        output_dir = os.path.join(self.config.videos_dir, hls_dir_name(video))
+
+        def prepare():
+            # A retried job starts from scratch
+            shutil.rmtree(output_dir, ignore_errors=True)
+            for height, _ in ladder:
+                os.makedirs(os.path.join(output_dir, f"{height}p"))
+            with open(os.path.join(output_dir, MASTER_PLAYLIST), "w") as f:
+                f.write(master_playlist(ladder, source))
+
+        await anyio.to_thread.run_sync(prepare)
+        video.hls_status = "packaging"
+        await session.commit()
+        page_cache.invalidate(play_page_key(video.share_token))
+        await self._exec(ffmpeg_hls_command(
+            self.config.ffmpeg_path, source_path, output_dir, ladder, source, self.config.hls_segment_seconds
+        ))
+
+    async def _thumbnails(self, job: TranscodeJob, video: Video, source_path: str):
+        """Poster frame and seek-preview sprite with its WebVTT index, stored in the thumbnail cache"""
+        cache = self.thumbnail_cache
+        source = parse_probe(await self._exec(ffprobe_command(self.config.ffprobe_path, source_path)))
+        layout = sprite_layout(source)
+        partials = {name: cache.path(f".{job.job_id}-{name}") for name in (POSTER, SPRITE, SPRITE_VTT)}
+
+        def write_vtt():
+            os.makedirs(cache.directory, exist_ok=True)
+            with open(partials[SPRITE_VTT], "w") as f:
+                f.write(sprite_vtt(layout, source["duration"]))
+
+        try:
+            await anyio.to_thread.run_sync(write_vtt)
+            await self._exec(poster_command(self.config.ffmpeg_path, source_path, partials[POSTER], source))
+            await self._exec(sprite_command(self.config.ffmpeg_path, source_path, partials[SPRITE], layout))
+            for name, partial in partials.items():
+                await anyio.to_thread.run_sync(cache.store, thumbnail_name(video.id, name), partial)
+        except BaseException:
+            for partial in partials.values():
+                await self._discard(partial)
+            raise
+
+    async def _ffmpeg(self, source: str, target: str):
+        await self._exec(ffmpeg_command(self.config.ffmpeg_path, source, target))
+
+    async def _exec(self, command: list) -> bytes:
+        """Run ffmpeg/ffprobe; returns stdout, raises with the end of stderr on failure"""
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await process.communicate()
+        except BaseException:
+            # Cancelled (shutdown): don't leave ffmpeg running
+            process.kill()
+            await process.wait()
+            raise
+        if process.returncode != 0:
+            raise RuntimeError(
+                f"{os.path.basename(command[0])} exited with {process.returncode}: "
+                f"{stderr.decode('utf-8', 'replace')[-ERROR_TAIL:]}"
+            )
+        return stdout
+
+    async def _discard(self, path: str):
+        try:
+            await anyio.to_thread.run_sync(os.remove, path)
+        except FileNotFoundError:
+            pass
+
+
+_transcode_queue = None
+
+def get_transcode_queue() -> TranscodeQueue:
+    """Get the process-wide transcode queue for dependency injection"""
+    global _transcode_queue
+    if _transcode_queue is None:
+        _transcode_queue = TranscodeQueue(AsyncSessionLocal)
+    return _transcode_queue
@@ -0,0 +1,53 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable
+
+
+class TTLCache:
+    """Bounded in-process LRU whose entries expire after ``ttl`` seconds.
+
+    It backs the keyring, page and share caches. Changes made through this
+    process invalidate the affected entries immediately; the TTL is what lets
+    changes made by another worker process show up, so it bounds how stale an
+    entry can be. An entry can record a version (e.g. ``Config.version``) and is
+    ignored once looked up under another one. ``max_size=0`` disables caching.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key: Hashable, version=None):
+        """Return the cached value, or None when it is missing, expired or from another version"""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic() or entry[1] != version:
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self._count_hit(entry[2])
+        return entry[2]
+
+    def put(self, key: Hashable, value, version=None, ttl: float = None):
+        if self.max_size <= 0:
+            return
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), version, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable = None):
+        """Drop one entry, or every entry when key is None"""
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def _count_hit(self, value):
+        self.hits += 1
+
+    def stats(self) -> Dict[str, float]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
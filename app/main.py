@@ -1,10 +1,18 @@
 from fastapi import FastAPI
+from fastapi.staticfiles import StaticFiles
 from app.api.upload import router as upload_router
-from app.api.play import router as play_router
+from app.api.play import STATIC_DIR, router as play_router
 from app.api.auth import router as auth_router
 from app.api.setup import router as setup_router
-from app.models import init_db
-from app.startup import startup_event
+from app.api.metrics import router as metrics_router
+from app.models import configure_database, init_db
+from app.core.config import reload_config
+from app.core.db_stats import DBStatsMiddleware
+from app.core.metrics import MetricsMiddleware
+from app.startup import startup_event, stop_library_maintenance
+from app.core.assembly import get_assembly_queue
+from app.core.reaper import get_upload_reaper
+from app.core.transcode import get_transcode_queue
 from contextlib import asynccontextmanager
 import logging
 
@@ -13,7 +21,11 @@ import logging
 async def lifespan(app):
     try:
         logging.info("🔄 Starting video server...")
+        # Build the config once for the lifetime of the process
+        config = reload_config()
+        config.ensure_directories()
         logging.info("🔄 About to initialize database...")
+        engine = configure_database(config)
         await init_db()
         logging.info("🔄 Database initialized successfully")
         logging.info("🔄 About to run startup event...")
@@ -21,15 +33,25 @@ async def lifespan(app):
         logging.info("🔄 Startup event completed")
         yield
         logging.info("🔄 Shutting down...")
+        await stop_library_maintenance()
+        await get_upload_reaper().stop()
+        await get_assembly_queue().shutdown()
+        await get_transcode_queue().shutdown()
+        await engine.dispose()
     except Exception as e:
         logging.error(f"❌ Error in lifespan: {e}")
         raise
 
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(DBStatsMiddleware)
+# Outermost, so its latency covers the other middleware too
+app.add_middleware(MetricsMiddleware)
 app.include_router(upload_router)
 app.include_router(play_router)
 app.include_router(auth_router)
 app.include_router(setup_router)
+app.include_router(metrics_router)
+app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
 # Routers will be included here 
\ No newline at end of file
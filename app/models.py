@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, Index, Float
 from sqlalchemy.orm import declarative_base
 from datetime import datetime
 
@@ -13,7 +13,27 @@ class Video(Base):
     password = Column(String, nullable=True)
     share_token = Column(String, unique=True, index=True)
     transcoded = Column(Boolean, default=False)
-    uploader_key_id = Column(String, nullable=True)
+    uploader_key_id = Column(String, nullable=True, index=True)
+    digest = Column(String, nullable=True)  # SHA-256 of the uploaded bytes, see ingest.file_digest
+    blob_id = Column(Integer, nullable=True, index=True)  # shared content blob; None = file stored under filename
+    hls_status = Column(String, nullable=True)  # None, packaging, ready, failed
+    # Media metadata of the upload, read from its headers once (see media.probe_media); None = not probed yet
+    container = Column(String, nullable=True)  # mp4, mov, mkv, webm, ... or unknown
+    mime_type = Column(String, nullable=True)
+    duration = Column(Float, nullable=True)  # seconds
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    video_codec = Column(String, nullable=True)
+    audio_codec = Column(String, nullable=True)
+    bitrate = Column(Integer, nullable=True)  # bits per second, over the whole file
+
+class Blob(Base):
+    __tablename__ = 'blobs'
+    id = Column(Integer, primary_key=True, index=True)
+    digest = Column(String, unique=True, index=True)  # file digest; the blob lives at blobs.blob_name(digest)
+    file_size = Column(Integer)
+    ref_count = Column(Integer, default=0, index=True)  # Video rows pointing at this blob
+    created_at = Column(DateTime, default=datetime.utcnow)
 
 class ChunkUpload(Base):
     __tablename__ = 'chunk_uploads'
@@ -23,8 +43,39 @@ class ChunkUpload(Base):
     chunk_number = Column(Integer)
     total_chunks = Column(Integer)
     received = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.now())
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)  # the reaper expires sessions by age
+    uploader_key_id = Column(String, nullable=True)
+    digest = Column(String, nullable=True)  # SHA-256 of the chunk as stored, computed during ingest
+    upload_length = Column(Integer, nullable=True)  # declared size of a raw (PATCH) upload; None for multipart
+    __table_args__ = (
+        # Per-chunk lookups and updates hit exactly one row regardless of upload size
+        Index('ix_chunk_uploads_upload_chunk', 'upload_id', 'chunk_number', unique=True),
+    )
+
+class AssemblyJob(Base):
+    __tablename__ = 'assembly_jobs'
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String, unique=True, index=True)
+    upload_id = Column(String, unique=True, index=True)
+    filename = Column(String)
+    total_chunks = Column(Integer)
+    status = Column(String, default="queued", index=True)  # queued, assembling, done, failed
+    share_token = Column(String, nullable=True)  # set once the Video row exists
+    error = Column(Text, nullable=True)
     uploader_key_id = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class TranscodeJob(Base):
+    __tablename__ = 'transcode_jobs'
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String, unique=True, index=True)
+    video_id = Column(Integer, index=True)
+    kind = Column(String, default="mp4")  # mp4 (web rendition) or hls (adaptive ladder)
+    status = Column(String, default="queued", index=True)  # queued, running, done, failed
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class PublicKey(Base):
     __tablename__ = 'public_keys'
@@ -37,18 +88,94 @@ class PublicKey(Base):
     domain = Column(String, nullable=True)  # Domain this key was created for
 
 # Helper for DB setup
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from app.core.db_stats import count_session
+
+# Applied to every new SQLite connection. WAL lets readers run alongside the
+# single writer and, with synchronous=NORMAL, turns each chunk commit into an
+# append to the WAL instead of a rollback-journal fsync dance.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,  # ms to wait for the write lock instead of failing
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,  # negative = KiB, so 64 MiB of page cache
+    "temp_store": "MEMORY",
+}
+
+def create_engine_from_config(config, pragmas: dict = None):
+    """Create the async engine for ``config.database_url``.
+
+    SQLite connections get ``SQLITE_PRAGMAS`` (or ``pragmas``) applied on
+    connect; any other backend URL (e.g. postgresql+asyncpg://...) is used as is.
+    """
+    url = make_url(config.database_url)
+    options = {"echo": config.database_echo}
+    if issubclass(url.get_dialect().get_pool_class(url), QueuePool):
+        # Every request takes exactly one pooled connection through get_db; the pool
+        # only needs to cover concurrent requests plus background jobs. In-memory
+        # SQLite uses a StaticPool, which takes no sizing.
+        options.update(pool_size=config.database_pool_size, max_overflow=config.database_max_overflow, pool_timeout=30)
+    if url.get_backend_name() != "sqlite":
+        # A server can drop idle connections; SQLite files never go stale, so no SELECT 1 per checkout
+        options["pool_pre_ping"] = True
+    engine = create_async_engine(url, **options)
+    if url.get_backend_name() == "sqlite":
+        pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
 
-DATABASE_URL = 'sqlite+aiosqlite:////nas/videos/vide0db.sqlite3'
+        @event.listens_for(engine.sync_engine, "connect")
+        def apply_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+    return engine
 
-main_engine = create_async_engine(DATABASE_URL, echo=True)
-AsyncSessionLocal = sessionmaker(
-    bind=main_engine, class_=AsyncSession, expire_on_commit=False
-)
+# Bound to an engine by configure_database() at startup
+main_engine = None
+AsyncSessionLocal = sessionmaker(class_=AsyncSession, expire_on_commit=False)
+
+def configure_database(config):
+    """Create the main engine from config and bind AsyncSessionLocal to it"""
+    global main_engine
+    main_engine = create_engine_from_config(config)
+    AsyncSessionLocal.configure(bind=main_engine)
+    return main_engine
+
+async def get_db():
+    """Request-scoped session shared by every router and security dependency.
+
+    FastAPI caches a dependency per request by identity, so as long as every
+    Depends(get_db) points at this one function a request opens one session.
+    """
+    count_session()
+    async with AsyncSessionLocal() as session:
+        yield session
 
 async def init_db(engine=None):
     if engine is None:
         engine = main_engine
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all) 
\ No newline at end of file
+        await conn.run_sync(Base.metadata.create_all)
+        # create_all skips tables that already exist, so add columns and indexes introduced later
+        await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_create_missing_indexes)
+
+def _add_missing_columns(conn):
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                # Only nullable, default-less columns are added this way
+                column_type = column.type.compile(dialect=conn.dialect)
+                conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+
+def _create_missing_indexes(conn):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True) 
\ No newline at end of file
@@ -3,6 +3,11 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.models import AsyncSessionLocal
 from app.core.config import get_config
 from app.core.security import get_admin_keys, add_public_key_to_db
+from app.core.assembly import get_assembly_queue
+from app.core.blobs import collect_garbage
+from app.core.media import backfill_media_info
+from app.core.reaper import get_upload_reaper
+from app.core.transcode import get_transcode_queue
 
 # Configure logging to output to stdout
 logging.basicConfig(level=logging.INFO, format='%(message)s')
@@ -42,8 +47,38 @@ async def create_initial_admin_key():
         except Exception as e:
             logging.error(f"❌ Failed to create initial admin key: {e}")
 
+_maintenance_task = None
+
+async def library_maintenance():
+    """Blob GC and the metadata backfill; both scan the whole library, so one failing does not stop the other"""
+    config = get_config()
+    for name, step in (("Blob GC", collect_garbage), ("Media metadata backfill", backfill_media_info)):
+        try:
+            async with AsyncSessionLocal() as session:
+                await step(session, config)
+        except Exception as e:
+            logging.error(f"❌ {name} after startup failed: {e}")
+
+def start_library_maintenance():
+    """Run library_maintenance in the background, so the server does not wait for it to serve"""
+    global _maintenance_task
+    if _maintenance_task is None or _maintenance_task.done():
+        _maintenance_task = asyncio.create_task(library_maintenance())
+
+async def stop_library_maintenance():
+    """Cancel library_maintenance if it is still running"""
+    global _maintenance_task
+    if _maintenance_task is not None:
+        _maintenance_task.cancel()
+        await asyncio.gather(_maintenance_task, return_exceptions=True)
+        _maintenance_task = None
+
 async def startup_event():
     """Run startup tasks"""
     logging.info("🚀 Starting video server...")
     await create_initial_admin_key()
+    await get_assembly_queue().resume_pending()
+    await get_transcode_queue().resume_pending()
+    start_library_maintenance()
+    get_upload_reaper().start()
     logging.info("✅ Startup complete") 
\ No newline at end of file
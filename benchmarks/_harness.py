@@ -0,0 +1,135 @@
+"""
+Shared setup for the benchmarks: runs the app in a real uvicorn server against
+a throwaway NAS directory and SQLite database.
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BENCH_KEY_ID = "bench"
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def report(label, samples):
+    print(
+        f"{label}: n={len(samples)} "
+        f"p50={percentile(samples, 50) * 1000:.1f}ms "
+        f"p99={percentile(samples, 99) * 1000:.1f}ms "
+        f"max={max(samples, default=0) * 1000:.1f}ms"
+    )
+
+
+class BenchServer:
+    """The vide0 app on a random local port, with a temporary NAS mount"""
+
+    def __init__(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="vide0-bench-")
+        os.environ["NAS_MOUNT_PATH"] = self.tmpdir
+
+        from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+        from sqlalchemy.orm import sessionmaker
+        from sqlalchemy.pool import NullPool
+        from app.main import app
+        from app.models import get_db, init_db
+        from app.core.config import reload_config
+        from app.core.assembly import AssemblyQueue, get_assembly_queue
+        from app.core.transcode import TranscodeQueue, get_transcode_queue
+        from app.core import security
+
+        self.app = app
+        self.config = reload_config()
+        self.config.ensure_directories()
+        # NullPool: seeding and serving run on different event loops
+        self.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.tmpdir, 'bench.sqlite3')}",
+            poolclass=NullPool,
+        )
+        self.session_factory = sessionmaker(bind=self.engine, class_=AsyncSession, expire_on_commit=False)
+        asyncio.run(init_db(self.engine))
+
+        async def get_bench_db():
+            async with self.session_factory() as session:
+                yield session
+
+        app.dependency_overrides[get_db] = get_bench_db
+        app.dependency_overrides[security.require_signature] = lambda: BENCH_KEY_ID
+        app.dependency_overrides[security.require_upload_auth] = lambda: security.UploadCredentials(BENCH_KEY_ID)
+        # On the bench database, and off: the benchmarks time uploads and serving, not ffmpeg
+        self.transcode_queue = TranscodeQueue(self.session_factory, self.config.replace(transcode_workers=0))
+        app.dependency_overrides[get_transcode_queue] = lambda: self.transcode_queue
+        self.assembly_queue = AssemblyQueue(self.session_factory, self.config, transcode_queue=self.transcode_queue)
+        app.dependency_overrides[get_assembly_queue] = lambda: self.assembly_queue
+
+        self.port = self._free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self._server = None
+        self._thread = None
+
+    @staticmethod
+    def _free_port():
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            return s.getsockname()[1]
+
+    def seed_video(self, size: int, sparse: bool = False) -> str:
+        """Write a video of ``size`` bytes and its Video row; returns the share token
+
+        ``sparse`` creates a hole-filled file instantly, for multi-GB seek tests.
+        """
+        from app.models import Video
+
+        filename = f"bench_{uuid.uuid4().hex[:8]}.mp4"
+        with open(os.path.join(self.config.videos_dir, filename), "wb") as f:
+            if sparse:
+                f.truncate(size)
+            else:
+                block = os.urandom(1024 * 1024)
+                remaining = size
+                while remaining > 0:
+                    f.write(block[:remaining])
+                    remaining -= len(block)
+        share_token = str(uuid.uuid4())
+
+        async def insert():
+            async with self.session_factory() as session:
+                session.add(Video(filename=filename, file_size=size, share_token=share_token,
+                                  transcoded=False, uploader_key_id=BENCH_KEY_ID))
+                await session.commit()
+
+        asyncio.run(insert())
+        return share_token
+
+    def start(self):
+        import uvicorn
+
+        config = uvicorn.Config(self.app, host="127.0.0.1", port=self.port, lifespan="off", log_level="warning")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
@@ -0,0 +1,84 @@
+"""
+Cost of chunk bookkeeping as uploads grow to thousands of chunks.
+
+For each upload size, times /upload/initiate, a sample of /upload/chunk
+posts (first and last chunks, tiny bodies) and /upload/complete. Chunks
+that are not posted are marked received directly in the database so a
+10k-chunk upload does not need 10k HTTP round trips. The background
+assembly jobs this enqueues fail on the missing chunk files; only the
+request path is measured.
+
+    python benchmarks/bench_chunk_bookkeeping.py --sizes 100 1000 10000
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+from sqlalchemy import update
+
+from _harness import BenchServer, report
+from app.models import ChunkUpload
+
+
+async def mark_received(server, upload_id):
+    async with server.session_factory() as session:
+        await session.execute(update(ChunkUpload).where(ChunkUpload.upload_id == upload_id).values(received=True))
+        await session.commit()
+
+
+async def run_size(server, client, total_chunks, sample):
+    started = time.perf_counter()
+    resp = await client.post("/upload/initiate", data={"filename": "bench.mp4", "total_chunks": total_chunks})
+    resp.raise_for_status()
+    initiate = time.perf_counter() - started
+    upload_id = resp.json()["upload_id"]
+
+    sampled = sorted(set(range(1, min(sample, total_chunks) + 1))
+                     | set(range(max(1, total_chunks - sample + 1), total_chunks + 1)))
+    chunk_latencies = []
+    for chunk_number in sampled:
+        started = time.perf_counter()
+        resp = await client.post(
+            "/upload/chunk",
+            data={"upload_id": upload_id, "chunk_number": chunk_number, "total_chunks": total_chunks},
+            files={"file": ("chunk", b"x")},
+        )
+        resp.raise_for_status()
+        chunk_latencies.append(time.perf_counter() - started)
+
+    await mark_received(server, upload_id)
+    started = time.perf_counter()
+    resp = await client.post("/upload/complete", data={"upload_id": upload_id})
+    resp.raise_for_status()
+    complete = time.perf_counter() - started
+
+    print(f"--- {total_chunks} chunks ---")
+    print(f"initiate: {initiate * 1000:.1f}ms")
+    report("chunk", chunk_latencies)
+    print(f"complete (validate + enqueue): {complete * 1000:.1f}ms")
+
+
+async def run(args, server):
+    async with httpx.AsyncClient(base_url=server.base_url, timeout=300) as client:
+        for total_chunks in args.sizes:
+            await run_size(server, client, total_chunks, args.sample)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="chunks per upload")
+    parser.add_argument("--sample", type=int, default=50, help="chunks posted at each end of the upload")
+    args = parser.parse_args()
+
+    server = BenchServer()
+    server.start()
+    try:
+        asyncio.run(run(args, server))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Playback latency while chunk uploads are in flight.
+
+Runs many concurrent /upload/chunk POSTs against a live server and, at the
+same time, a steady stream of small Range requests to /videos/{share_token}.
+If chunk ingest blocks the event loop, the playback p99 jumps to roughly the
+time it takes to write one chunk.
+
+    python benchmarks/bench_chunk_ingest.py --uploads 8 --chunks 4 --chunk-mb 10
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+from _harness import BenchServer, report
+
+
+async def upload_one(client, chunks, chunk_bytes, latencies):
+    resp = await client.post("/upload/initiate", data={"filename": "bench.mp4", "total_chunks": chunks})
+    resp.raise_for_status()
+    upload_id = resp.json()["upload_id"]
+    for chunk_number in range(1, chunks + 1):
+        started = time.perf_counter()
+        resp = await client.post(
+            "/upload/chunk",
+            data={"upload_id": upload_id, "chunk_number": chunk_number, "total_chunks": chunks},
+            files={"file": (f"chunk{chunk_number}", chunk_bytes)},
+        )
+        resp.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+
+
+async def play_loop(client, share_token, stop, latencies):
+    while not stop.is_set():
+        started = time.perf_counter()
+        resp = await client.get(f"/videos/{share_token}", headers={"Range": "bytes=0-65535"})
+        resp.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.005)
+
+
+async def run(args, server, share_token):
+    chunk_bytes = os.urandom(args.chunk_mb * 1024 * 1024)
+    limits = httpx.Limits(max_connections=args.uploads + args.players)
+    async with httpx.AsyncClient(base_url=server.base_url, limits=limits, timeout=300) as client:
+        stop = asyncio.Event()
+        play_latencies, chunk_latencies = [], []
+        players = [asyncio.create_task(play_loop(client, share_token, stop, play_latencies))
+                   for _ in range(args.players)]
+        started = time.perf_counter()
+        await asyncio.gather(*(upload_one(client, args.chunks, chunk_bytes, chunk_latencies)
+                               for _ in range(args.uploads)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await asyncio.gather(*players)
+
+    total_mb = args.uploads * args.chunks * args.chunk_mb
+    print(f"ingested {total_mb} MB in {elapsed:.2f}s ({total_mb / elapsed:.1f} MB/s)")
+    report("chunk upload", chunk_latencies)
+    report("playback (/videos range)", play_latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=8, help="concurrent uploads")
+    parser.add_argument("--chunks", type=int, default=4, help="chunks per upload")
+    parser.add_argument("--chunk-mb", type=int, default=10, help="chunk size in MB")
+    parser.add_argument("--players", type=int, default=4, help="concurrent playback clients")
+    args = parser.parse_args()
+
+    server = BenchServer()
+    share_token = server.seed_video(8 * 1024 * 1024)
+    server.start()
+    try:
+        asyncio.run(run(args, server, share_token))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
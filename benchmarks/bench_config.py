@@ -0,0 +1,46 @@
+"""
+Per-request cost of resolving the config dependency.
+
+Before, every Depends(get_config) built a new Config: a dozen environment
+lookups plus two os.makedirs calls against the NAS. Now the config is built
+once at startup and get_config() returns the cached instance.
+
+    python benchmarks/bench_config.py --iterations 100000
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import timeit
+
+import _harness  # noqa: F401  (puts the repo on sys.path)
+
+from app.core.config import Config, get_config, reload_config
+
+
+def per_request_config():
+    # What get_config() used to do on every call
+    config = Config()
+    config.ensure_directories()
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="vide0-bench-")
+    os.environ["NAS_MOUNT_PATH"] = tmpdir
+    reload_config().ensure_directories()
+    try:
+        for label, func in (("Config() + makedirs", per_request_config), ("cached get_config()", get_config)):
+            seconds = timeit.timeit(func, number=args.iterations)
+            print(f"{label:>20}: {seconds / args.iterations * 1e6:8.3f} µs/call")
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Per-request cost of MetricsMiddleware.
+
+Drives a minimal ASGI app directly, with and without the middleware, so the
+difference is what the metrics add to every request: two clock reads, the
+send wrapper, and a counter plus a histogram update.
+
+    python benchmarks/bench_metrics.py --iterations 100000
+"""
+
+import argparse
+import asyncio
+import time
+
+import _harness  # noqa: F401  (puts the repo on sys.path)
+
+from app.core.metrics import MetricsMiddleware
+
+
+class Route:
+    path = "/videos/{share_token}"
+
+
+async def endpoint(scope, receive, send):
+    scope["route"] = Route
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-length", b"2")]})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def receive():
+    return {"type": "http.request", "body": b""}
+
+
+async def send(message):
+    pass
+
+
+async def run(app, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await app({"type": "http", "method": "GET", "path": "/videos/x"}, receive, send)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+
+    for label, app in (("bare app", endpoint), ("MetricsMiddleware", MetricsMiddleware(endpoint))):
+        seconds = asyncio.run(run(app, args.iterations))
+        print(f"{label:>20}: {seconds / args.iterations * 1e6:8.3f} µs/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Requests per second for the /play and /setup pages, with and without the page cache.
+
+Uncached, every /play view runs a DB query, a stat against the NAS and a Jinja2
+render, and every /setup view also draws the QR code PNG. Cached, both are
+rendered once; browsers revalidating with If-None-Match get a 304.
+
+    python benchmarks/bench_pages.py --clients 8 --seconds 5
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from _harness import BenchServer, report
+
+
+async def page_loop(client, path, headers, deadline, latencies):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        resp = await client.get(path, headers=headers)
+        assert resp.status_code in (200, 304), resp.status_code
+        latencies.append(time.perf_counter() - started)
+
+
+async def measure(server, label, path, args, headers=None):
+    latencies = []
+    limits = httpx.Limits(max_connections=args.clients)
+    async with httpx.AsyncClient(base_url=server.base_url, limits=limits, timeout=60) as client:
+        started = time.perf_counter()
+        deadline = started + args.seconds
+        await asyncio.gather(*(page_loop(client, path, headers or {}, deadline, latencies)
+                               for _ in range(args.clients)))
+        elapsed = time.perf_counter() - started
+    print(f"{label}: {len(latencies) / elapsed:,.0f} req/s")
+    report(f"  {label}", latencies)
+
+
+async def run(args, server, share_token):
+    from app.api import setup
+    from app.core.page_cache import page_cache
+
+    memoized_qr = setup.qr_code_png
+    for path in (f"/play/{share_token}", "/setup"):
+        # Before: render on every request
+        page_cache.max_size, max_size = 0, page_cache.max_size
+        setup.qr_code_png = memoized_qr.__wrapped__
+        await measure(server, f"{path.split('/')[1]} uncached", path, args)
+        page_cache.max_size = max_size
+        setup.qr_code_png = memoized_qr
+        # After: rendered once, then served from memory or revalidated
+        await measure(server, f"{path.split('/')[1]} cached", path, args)
+        async with httpx.AsyncClient(base_url=server.base_url) as client:
+            etag = (await client.get(path)).headers["etag"]
+        await measure(server, f"{path.split('/')[1]} revalidated (304)", path, args, {"If-None-Match": etag})
+    print(f"page cache stats: {page_cache.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=8, help="concurrent browsers")
+    parser.add_argument("--seconds", type=float, default=5, help="duration of each measurement")
+    args = parser.parse_args()
+
+    server = BenchServer()
+    share_token = server.seed_video(1024 * 1024)
+    server.start()
+    try:
+        asyncio.run(run(args, server, share_token))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Upload throughput: multipart /upload/chunk versus raw-body PATCH /upload/raw.
+
+Each upload sends the same bytes both ways: as multipart chunks of --chunk-mb
+(one POST per chunk, parsed by the multipart streamer) and as PATCH bodies of
+--chunk-mb written straight into the file at Upload-Offset. Reports wall-clock
+MB/s and the CPU seconds the process spent per GB ingested.
+
+    python benchmarks/bench_raw_upload.py --uploads 4 --upload-mb 200 --chunk-mb 10
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+from _harness import BenchServer, report
+
+
+async def multipart_upload(client, data, chunk_bytes, latencies):
+    chunks = [data[i:i + chunk_bytes] for i in range(0, len(data), chunk_bytes)]
+    resp = await client.post("/upload/initiate", data={"filename": "bench.mp4", "total_chunks": len(chunks)})
+    resp.raise_for_status()
+    upload_id = resp.json()["upload_id"]
+    for chunk_number, chunk in enumerate(chunks, 1):
+        started = time.perf_counter()
+        resp = await client.post(
+            "/upload/chunk",
+            data={"upload_id": upload_id, "chunk_number": chunk_number, "total_chunks": len(chunks)},
+            files={"file": (f"chunk{chunk_number}", chunk)},
+        )
+        resp.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+
+
+async def raw_upload(client, data, chunk_bytes, latencies):
+    resp = await client.post("/upload/raw", data={"filename": "bench.mp4", "upload_length": len(data)})
+    resp.raise_for_status()
+    upload_url = resp.json()["upload_url"]
+    offset = 0
+    while offset < len(data):
+        started = time.perf_counter()
+        resp = await client.patch(upload_url, content=data[offset:offset + chunk_bytes], headers={
+            "content-type": "application/offset+octet-stream", "upload-offset": str(offset)
+        })
+        resp.raise_for_status()
+        offset = int(resp.headers["upload-offset"])
+        latencies.append(time.perf_counter() - started)
+
+
+async def measure(server, label, upload, data, args):
+    latencies = []
+    limits = httpx.Limits(max_connections=args.uploads)
+    async with httpx.AsyncClient(base_url=server.base_url, limits=limits, timeout=300) as client:
+        cpu_started, started = time.process_time(), time.perf_counter()
+        await asyncio.gather(*(upload(client, data, args.chunk_mb * 1024 * 1024, latencies)
+                               for _ in range(args.uploads)))
+        elapsed, cpu = time.perf_counter() - started, time.process_time() - cpu_started
+    total_mb = args.uploads * args.upload_mb
+    print(f"{label}: {total_mb / elapsed:,.1f} MB/s, {cpu / (total_mb / 1024):.1f} CPU s/GB (client and server)")
+    report(f"  {label} request", latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=4, help="concurrent uploads")
+    parser.add_argument("--upload-mb", type=int, default=200, help="size of each upload in MB")
+    parser.add_argument("--chunk-mb", type=int, default=10, help="multipart chunk / PATCH body size in MB")
+    args = parser.parse_args()
+
+    server = BenchServer()
+    server.start()
+    try:
+        data = os.urandom(args.upload_mb * 1024 * 1024)
+        asyncio.run(measure(server, "multipart /upload/chunk", multipart_upload, data, args))
+        asyncio.run(measure(server, "raw PATCH /upload/raw", raw_upload, data, args))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Signature checks per second with and without the keyring cache.
+
+Calls require_signature (and require_admin_auth) directly against a SQLite
+database, the way every authenticated request does, with the cache enabled
+and then disabled.
+
+    python benchmarks/bench_signature_cache.py --iterations 5000
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import shutil
+import tempfile
+import time
+
+import _harness  # noqa: F401  (puts the repo on sys.path)
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.models import init_db
+from app.core.security import add_public_key_to_db, keyring_cache, require_admin_auth, require_signature
+
+
+async def measure(session, check, key_id, headers, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await check(key_id=key_id, signature=headers["signature"], message=headers["message"], session=session)
+    return iterations / (time.perf_counter() - started)
+
+
+async def run(args):
+    tmpdir = tempfile.mkdtemp(prefix="vide0-bench-")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmpdir, 'bench.sqlite3')}")
+    await init_db(engine)
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    private_key = Ed25519PrivateKey.generate()
+    public_key_pem = private_key.public_key().public_bytes(Encoding.PEM, PublicFormat.SubjectPublicKeyInfo).decode()
+    key_id = "bench_admin"
+    message = key_id.encode()
+    headers = {
+        "signature": base64.b64encode(private_key.sign(message)).decode(),
+        "message": base64.b64encode(message).decode(),
+    }
+
+    async with session_factory() as session:
+        await add_public_key_to_db(session, key_id, public_key_pem, is_admin=True,
+                                   created_by="bench", domain="bench.local")
+        for label, check in (("require_signature", require_signature), ("require_admin_auth", require_admin_auth)):
+            max_size = keyring_cache.max_size
+            keyring_cache.max_size = 0
+            keyring_cache.invalidate()
+            uncached = await measure(session, check, key_id, headers, args.iterations)
+            keyring_cache.max_size = max_size
+            cached = await measure(session, check, key_id, headers, args.iterations)
+            print(f"{label}: {uncached:,.0f}/s without cache, {cached:,.0f}/s with cache "
+                  f"({cached / uncached:.1f}x)")
+    print(f"cache stats: {keyring_cache.stats()}")
+    await engine.dispose()
+    shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Concurrent chunk-commit throughput: the old SQLite profile against the tuned one.
+
+Simulates many in-flight chunk uploads, each marking its chunks received
+one commit at a time. The "legacy" profile is the engine as it used to be
+created (default rollback journal, no pragmas); "tuned" is
+create_engine_from_config with SQLITE_PRAGMAS. Echo is off for both unless
+--legacy-echo is given, since its cost depends on where stdout goes.
+
+    python benchmarks/bench_sqlite_profile.py --workers 16 --commits 200
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+from _harness import percentile
+from sqlalchemy import insert, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import Config
+from app.models import ChunkUpload, create_engine_from_config, init_db
+
+
+async def worker(session_factory, commits, latencies, errors):
+    upload_id = str(uuid.uuid4())
+    async with session_factory() as session:
+        await session.execute(insert(ChunkUpload), [
+            {"upload_id": upload_id, "filename": "bench.mp4", "chunk_number": n,
+             "total_chunks": commits, "received": False, "uploader_key_id": "bench"}
+            for n in range(1, commits + 1)
+        ])
+        await session.commit()
+    for chunk_number in range(1, commits + 1):
+        started = time.perf_counter()
+        try:
+            async with session_factory() as session:
+                await session.execute(
+                    update(ChunkUpload)
+                    .where(ChunkUpload.upload_id == upload_id, ChunkUpload.chunk_number == chunk_number)
+                    .values(received=True)
+                )
+                await session.commit()
+        except OperationalError:
+            errors.append(chunk_number)
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+async def run_profile(label, engine, args):
+    await init_db(engine)
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    latencies, errors = [], []
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(session_factory, args.commits, latencies, errors) for _ in range(args.workers)))
+    elapsed = time.perf_counter() - started
+    await engine.dispose()
+    print(f"{label}: {len(latencies) / elapsed:,.0f} commits/s, "
+          f"p50={percentile(latencies, 50) * 1000:.1f}ms p99={percentile(latencies, 99) * 1000:.1f}ms, "
+          f"{len(errors)} lock errors")
+
+
+async def run(args):
+    tmpdir = tempfile.mkdtemp(prefix="vide0-bench-")
+    try:
+        legacy = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmpdir, 'legacy.sqlite3')}",
+                                     echo=args.legacy_echo)
+        await run_profile("legacy", legacy, args)
+
+        os.environ["NAS_MOUNT_PATH"] = tmpdir
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tmpdir, 'tuned.sqlite3')}"
+        tuned = create_engine_from_config(Config())
+        await run_profile("tuned", tuned, args)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=16, help="concurrent uploads")
+    parser.add_argument("--commits", type=int, default=200, help="chunk commits per upload")
+    parser.add_argument("--legacy-echo", action="store_true", help="log every statement in the legacy profile")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Throughput and latency of concurrent seeks on a multi-GB video.
+
+Each client repeatedly requests a random byte range of /videos/{share_token},
+the way a player does when the user scrubs. Reports per-request latency
+percentiles and aggregate throughput.
+
+    python benchmarks/bench_video_seeks.py --size-gb 4 --clients 16 --range-mb 2
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+
+from _harness import BenchServer, report
+
+
+async def seek_loop(client, share_token, size, range_bytes, deadline, latencies, counters):
+    while time.perf_counter() < deadline:
+        start = random.randrange(0, size - range_bytes)
+        started = time.perf_counter()
+        resp = await client.get(f"/videos/{share_token}",
+                                headers={"Range": f"bytes={start}-{start + range_bytes - 1}"})
+        assert resp.status_code == 206, resp.status_code
+        latencies.append(time.perf_counter() - started)
+        counters["bytes"] += len(resp.content)
+
+
+async def run(args, server, share_token, size):
+    range_bytes = args.range_mb * 1024 * 1024
+    latencies, counters = [], {"bytes": 0}
+    limits = httpx.Limits(max_connections=args.clients)
+    async with httpx.AsyncClient(base_url=server.base_url, limits=limits, timeout=300) as client:
+        started = time.perf_counter()
+        deadline = started + args.seconds
+        await asyncio.gather(*(seek_loop(client, share_token, size, range_bytes, deadline, latencies, counters)
+                               for _ in range(args.clients)))
+        elapsed = time.perf_counter() - started
+    print(f"{len(latencies)} seeks in {elapsed:.1f}s ({len(latencies) / elapsed:.1f} req/s, "
+          f"{counters['bytes'] / elapsed / 1024 / 1024:.1f} MB/s)")
+    report("seek", latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-gb", type=float, default=4, help="video size in GB (sparse file)")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent players")
+    parser.add_argument("--range-mb", type=int, default=2, help="bytes per range request, in MB")
+    parser.add_argument("--seconds", type=float, default=10, help="test duration")
+    args = parser.parse_args()
+
+    size = int(args.size_gb * 1024 ** 3)
+    server = BenchServer()
+    share_token = server.seed_video(size, sparse=True)
+    server.start()
+    try:
+        asyncio.run(run(args, server, share_token, size))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
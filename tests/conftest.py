@@ -6,11 +6,23 @@ import pytest
 import asyncio
 import logging
 import os
+import sys
+import uuid
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from fastapi.testclient import TestClient
 
-from app.models import AsyncSessionLocal, init_db
-from app.core.security import remove_public_key_from_db
+from app.main import app
+from app.models import AsyncSessionLocal, Video, get_db, init_db
+from app.core.config import Config, get_config
+from app.core.db_stats import DBStatsMiddleware, count_session
+from app.core.assembly import AssemblyQueue, get_assembly_queue
+from app.core.transcode import TranscodeQueue, get_transcode_queue
+from app.core.page_cache import page_cache
+from app.core.security import add_public_key_to_db, keyring_cache, remove_public_key_from_db
+from app.core.share_cache import share_cache
+import upload_client
 
 
 # Configure logging for tests
@@ -53,4 +65,164 @@ async def cleanup_test_keys():
             try:
                 await remove_public_key_from_db(session, key_id)
             except Exception:
-                pass  # Key might not exist, that's fine 
\ No newline at end of file
+                pass  # Key might not exist, that's fine 
+
+@pytest.fixture
+def nas_config(tmp_path, monkeypatch):
+    """Config pointing at a throwaway NAS mount."""
+    monkeypatch.setenv("NAS_MOUNT_PATH", str(tmp_path))
+    # Transcoding needs ffmpeg; tests that want it use transcode_config
+    monkeypatch.setenv("TRANSCODE_WORKERS", "0")
+    config = Config()
+    config.ensure_directories()
+    return config
+
+@pytest.fixture
+def app_client(nas_config, tmp_path):
+    """TestClient for the app backed by a file database in the throwaway NAS mount."""
+    # NullPool: the test and the app run on different event loops
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/test.sqlite3", poolclass=NullPool)
+    asyncio.run(init_db(engine))
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def get_test_db():
+        count_session()
+        async with session_factory() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = get_test_db
+    app.dependency_overrides[get_config] = lambda: nas_config
+    client = TestClient(app)
+    client.session_factory = session_factory
+    yield client
+    app.dependency_overrides.clear()
+    asyncio.run(engine.dispose())
+
+@pytest.fixture
+def make_video(app_client, nas_config):
+    """Create a video file and its row; returns the Video."""
+    def make(data: bytes = b"video bytes", filename: str = None):
+        filename = filename or f"clip_{uuid.uuid4().hex[:8]}.mp4"
+        with open(os.path.join(nas_config.videos_dir, filename), "wb") as f:
+            f.write(data)
+        video = Video(filename=filename, file_size=len(data), share_token=str(uuid.uuid4()), transcoded=False)
+
+        async def insert():
+            async with app_client.session_factory() as session:
+                session.add(video)
+                await session.commit()
+
+        asyncio.run(insert())
+        return video
+    return make
+
+
+@pytest.fixture
+def signing_key(app_client):
+    """Whitelisted (non-admin) key in the app database; returns (key_id, private_key)."""
+    from tests.test_key_verification import generate_key_pair
+
+    key_id = "test_client_key"
+    private_key, public_key_pem = generate_key_pair(key_id)
+
+    async def add_key():
+        async with app_client.session_factory() as session:
+            await add_public_key_to_db(session, key_id, public_key_pem, domain="test.local")
+
+    asyncio.run(add_key())
+    keyring_cache.invalidate()
+    return key_id, private_key
+
+@pytest.fixture
+def signed_headers(signing_key):
+    from tests.test_key_verification import key_headers
+
+    key_id, private_key = signing_key
+    return key_headers(key_id, key_id, private_key)
+
+class InlineAssemblyQueue(AssemblyQueue):
+    """Finishes assembly inside the /upload/complete request, so TestClient sees the result."""
+
+    async def enqueue(self, session, **kwargs):
+        job = await super().enqueue(session, **kwargs)
+        await asyncio.gather(*self._tasks)
+        await session.refresh(job)
+        return job
+
+    async def retry(self, session, job):
+        job = await super().retry(session, job)
+        await asyncio.gather(*self._tasks)
+        await session.refresh(job)
+        return job
+
+@pytest.fixture
+def transcode_queue(app_client, nas_config):
+    """Transcode queue on the test database; disabled unless a test passes its own config."""
+    queue = TranscodeQueue(app_client.session_factory, nas_config)
+    app.dependency_overrides[get_transcode_queue] = lambda: queue
+    return queue
+
+@pytest.fixture
+def inline_assembly(app_client, nas_config, transcode_queue):
+    queue = InlineAssemblyQueue(app_client.session_factory, nas_config, transcode_queue=transcode_queue)
+    app.dependency_overrides[get_assembly_queue] = lambda: queue
+    return queue
+
+
+# Copies its input with an "H264:" prefix; a "fail" file next to it makes it exit like a bad input
+STUB_FFMPEG = """#!{python}
+import os, sys
+args = sys.argv[1:]
+with open(os.path.join(os.path.dirname(sys.argv[0]), "ffmpeg-args.txt"), "w") as log:
+    log.write("\\n".join(args))
+if os.path.exists(os.path.join(os.path.dirname(sys.argv[0]), "fail")):
+    sys.stderr.write("Invalid data found when processing input\\n")
+    sys.exit(1)
+with open(args[args.index("-i") + 1], "rb") as source, open(args[-1], "wb") as target:
+    target.write(b"H264:" + source.read())
+"""
+
+STUB_FFPROBE = """#!{python}
+print('{probe}')
+"""
+
+
+def stub(path, source, **values):
+    """Write an executable Python script standing in for ffmpeg/ffprobe; returns its path"""
+    path.write_text(source.format(python=sys.executable, **values))
+    path.chmod(0o755)
+    return str(path)
+
+
+@pytest.fixture
+def stub_ffmpeg(tmp_path):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    path = bin_dir / "ffmpeg"
+    stub(path, STUB_FFMPEG)
+    return path
+
+
+@pytest.fixture
+def transcode_env(test_engine, nas_config, stub_ffmpeg):
+    """Session factory on the shared test engine and a config that transcodes with the stub ffmpeg."""
+    session_factory = sessionmaker(bind=test_engine, class_=AsyncSession, expire_on_commit=False)
+    config = nas_config.replace(transcode_workers=1, ffmpeg_path=str(stub_ffmpeg), thumbnails=False)
+    return session_factory, config
+
+
+@pytest.fixture
+def stats_client(app_client):
+    """Client whose responses carry X-DB-* counters, with the in-memory caches emptied."""
+    page_cache.invalidate()
+    share_cache.invalidate()
+    return TestClient(DBStatsMiddleware(app, expose_headers=True))
+
+
+@pytest.fixture
+def client_keys(signing_key, tmp_path):
+    """Write the test key where upload_client expects it"""
+    key_id, private_key = signing_key
+    keys_dir = tmp_path / "keys"
+    upload_client.save_keypair(str(keys_dir), private_key, key_id)
+    return str(keys_dir), key_id
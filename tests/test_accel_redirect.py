@@ -0,0 +1,75 @@
+"""
+Tests for the X-Accel-Redirect offload mode.
+"""
+
+import os
+import pytest
+
+from app.main import app
+from app.core.config import get_config
+
+
+@pytest.fixture
+def accel_config(app_client, nas_config):
+    """Switch the app into X-Accel-Redirect mode."""
+    config = nas_config.replace(accel_redirect_prefix="/_accel/videos/")
+    app.dependency_overrides[get_config] = lambda: config
+    return config
+
+
+def test_share_video_offloads_to_nginx(app_client, accel_config, make_video):
+    """With a prefix configured, /videos returns only headers pointing nginx at the file."""
+    video = make_video(b"x" * 1000, filename="holiday clip.mov")
+
+    resp = app_client.get(f"/videos/{video.share_token}")
+
+    assert resp.status_code == 200
+    assert resp.headers["x-accel-redirect"] == "/_accel/videos/holiday%20clip.mov"
+    assert resp.headers["content-type"] == "video/quicktime"
+    assert resp.headers["content-disposition"] == "attachment; filename*=utf-8''holiday%20clip.mov"
+    assert resp.content == b""
+
+
+def test_offload_points_at_shared_blob(app_client, accel_config, signed_headers, inline_assembly):
+    """Deduplicated videos redirect to their blob but keep their own download name."""
+    from tests.test_dedup import upload
+
+    job = upload(app_client, signed_headers, [b"shared bytes"])
+
+    resp = app_client.get(job["video_link"])
+
+    digest = resp.headers["x-accel-redirect"].rsplit("/", 1)[1]
+    assert resp.headers["x-accel-redirect"] == f"/_accel/videos/blobs/{digest[:2]}/{digest}"
+    assert resp.headers["content-type"] == "video/mp4"
+    assert resp.headers["content-disposition"].startswith('attachment; filename="clip_')
+
+
+def test_offload_still_checks_share_token(app_client, accel_config):
+    """Unknown share tokens are rejected by the app, never redirected."""
+
+    resp = app_client.get("/videos/does-not-exist")
+
+    assert resp.status_code == 404
+    assert "x-accel-redirect" not in resp.headers
+
+
+def test_player_skips_file_check_in_offload_mode(app_client, accel_config, make_video):
+    """The player page does not touch the NAS when nginx serves the bytes."""
+    video = make_video()
+    os.remove(os.path.join(accel_config.videos_dir, video.filename))
+
+    resp = app_client.get(f"/play/{video.share_token}")
+
+    assert resp.status_code == 200
+    assert f"/videos/{video.share_token}" in resp.text
+
+
+def test_streams_from_app_without_prefix(app_client, make_video):
+    """Without a prefix the app streams the file itself."""
+    video = make_video(b"y" * 1000)
+
+    resp = app_client.get(f"/videos/{video.share_token}")
+
+    assert resp.status_code == 200
+    assert "x-accel-redirect" not in resp.headers
+    assert resp.content == b"y" * 1000
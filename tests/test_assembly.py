@@ -0,0 +1,159 @@
+"""
+Tests for chunk assembly.
+"""
+
+import os
+import errno
+import asyncio
+import hashlib
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+
+from app.core import filecopy
+from app.core.assembly import AssemblyQueue, assemble_chunks, chunk_file_path
+from app.core.transcode import TranscodeQueue
+from app.core.config import Config
+from app.core.metrics import ASSEMBLY_SECONDS
+from app.models import AssemblyJob, ChunkUpload, Video
+from tests.test_integrity import post_chunk
+from tests.test_upload_resume import initiate
+
+
+def write_chunks(chunks_dir, upload_id, sizes):
+    """Write random chunks and return their paths plus the expected file contents"""
+    paths = []
+    expected = b""
+    for i, size in enumerate(sizes, 1):
+        data = os.urandom(size)
+        path = chunk_file_path(str(chunks_dir), upload_id, i)
+        with open(path, "wb") as f:
+            f.write(data)
+        paths.append(path)
+        expected += data
+    return paths, expected
+
+
+@pytest.mark.parametrize("method", filecopy.COPY_METHODS, ids=lambda m: m.__name__)
+def test_assembled_file_is_byte_identical(tmp_path, monkeypatch, method):
+    """Each copy method produces exactly the concatenation of the chunks."""
+    monkeypatch.setattr(filecopy, "COPY_METHODS", [method])
+    paths, expected = write_chunks(tmp_path, "upload", [1024 * 1024, 3 * 1024 * 1024 + 17, 0, 12345])
+    dest = tmp_path / "video.mp4"
+
+    size = assemble_chunks(paths, str(dest))
+
+    assert size == len(expected)
+    assert hashlib.sha256(dest.read_bytes()).digest() == hashlib.sha256(expected).digest()
+    assert not any(os.path.exists(p) for p in paths)
+
+
+def test_falls_back_when_kernel_copy_unsupported(tmp_path, monkeypatch):
+    """An 'unsupported' error from a copy primitive falls through to the next one."""
+    def unsupported(src_fd, dst_fd, offset, count, src_offset=0):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(filecopy, "COPY_METHODS", [unsupported, filecopy._buffered_copy])
+    paths, expected = write_chunks(tmp_path, "upload", [4096, 5000])
+    dest = tmp_path / "video.mp4"
+
+    assemble_chunks(paths, str(dest))
+
+    assert dest.read_bytes() == expected
+
+
+def test_failed_assembly_keeps_chunks(tmp_path):
+    """Chunks survive a failed assembly so it can be retried."""
+    paths, expected = write_chunks(tmp_path, "upload", [4096, 4096])
+    os.remove(paths[1])
+
+    with pytest.raises(FileNotFoundError):
+        assemble_chunks(paths, str(tmp_path / "video.mp4"))
+
+    assert os.path.exists(paths[0])
+
+
+@pytest.mark.asyncio
+async def test_assembly_job_creates_video(test_engine, tmp_path, monkeypatch):
+    """A queued job assembles the file, creates the Video and clears chunk bookkeeping."""
+    monkeypatch.setenv("NAS_MOUNT_PATH", str(tmp_path))
+    monkeypatch.setenv("TRANSCODE_WORKERS", "0")
+    config = Config()
+    config.ensure_directories()
+    session_factory = sessionmaker(bind=test_engine, class_=AsyncSession, expire_on_commit=False)
+    paths, expected = write_chunks(config.chunks_dir, "job-upload", [4096, 100])
+    async with session_factory() as session:
+        session.add_all([
+            ChunkUpload(upload_id="job-upload", filename="job_clip.mp4", chunk_number=i,
+                        total_chunks=2, received=True, uploader_key_id="job_key")
+            for i in (1, 2)
+        ])
+        await session.commit()
+        queue = AssemblyQueue(session_factory, config, transcode_queue=TranscodeQueue(session_factory, config))
+        job = await queue.enqueue(session, "job-upload", "job_clip.mp4", 2, "job_key")
+        assert job.status == "queued"
+
+    await asyncio.gather(*queue._tasks)
+
+    async with session_factory() as session:
+        job = (await session.execute(select(AssemblyJob).where(AssemblyJob.job_id == job.job_id))).scalar_one()
+        assert job.status == "done"
+        video = (await session.execute(select(Video).where(Video.share_token == job.share_token))).scalar_one()
+        assert video.file_size == len(expected)
+        remaining = (await session.execute(select(ChunkUpload).where(ChunkUpload.upload_id == "job-upload"))).scalars().all()
+        assert remaining == []
+    with open(os.path.join(config.videos_dir, "job_clip.mp4"), "rb") as f:
+        assert f.read() == expected
+    assert not any(os.path.exists(p) for p in paths)
+
+
+@pytest.mark.asyncio
+async def test_assembly_job_failing_outside_the_copy_is_marked_failed(test_engine, tmp_path, monkeypatch):
+    """An error in any step (here the media probe) fails the job instead of leaving it queued."""
+    monkeypatch.setenv("NAS_MOUNT_PATH", str(tmp_path))
+    monkeypatch.setenv("TRANSCODE_WORKERS", "0")
+    config = Config()
+    config.ensure_directories()
+    session_factory = sessionmaker(bind=test_engine, class_=AsyncSession, expire_on_commit=False)
+    paths, _ = write_chunks(config.chunks_dir, "probe-upload", [100])
+    failed = ASSEMBLY_SECONDS.count(outcome="failed")
+
+    def broken_probe(path):
+        raise OSError("NAS went away")
+
+    queue = AssemblyQueue(session_factory, config, transcode_queue=TranscodeQueue(session_factory, config))
+    monkeypatch.setattr(queue, "_probe", broken_probe)
+    async with session_factory() as session:
+        job = await queue.enqueue(session, "probe-upload", "probe_clip.mp4", 1, "job_key")
+    await asyncio.gather(*queue._tasks)
+
+    async with session_factory() as session:
+        job = (await session.execute(select(AssemblyJob).where(AssemblyJob.job_id == job.job_id))).scalar_one()
+    assert (job.status, job.error) == ("failed", "NAS went away")
+    assert ASSEMBLY_SECONDS.count(outcome="failed") == failed + 1
+    assert all(os.path.exists(p) for p in paths)
+
+
+def test_completing_a_failed_upload_again_retries_it(app_client, signed_headers, inline_assembly, monkeypatch):
+    """The chunks outlive a failed assembly, and /upload/complete runs the same job again."""
+    upload_id = initiate(app_client, signed_headers, 2)
+    for n, chunk in enumerate((b"first ", b"second"), 1):
+        assert post_chunk(app_client, signed_headers, upload_id, n, 2, chunk, hashlib.sha256(chunk).hexdigest()).status_code == 200
+    probe = inline_assembly._probe
+    outages = [OSError("NAS went away")]
+
+    def flaky_probe(path):
+        if outages:
+            raise outages.pop()
+        return probe(path)
+
+    monkeypatch.setattr(inline_assembly, "_probe", flaky_probe)
+    failed = app_client.post("/upload/complete", data={"upload_id": upload_id}, headers=signed_headers).json()
+    assert (failed["status"], failed["error"]) == ("failed", "NAS went away")
+
+    retried = app_client.post("/upload/complete", data={"upload_id": upload_id}, headers=signed_headers).json()
+
+    assert retried["job_id"] == failed["job_id"]
+    assert retried["status"] == "done"
+    assert app_client.get(retried["video_link"]).content == b"first second"
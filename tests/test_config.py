@@ -0,0 +1,40 @@
+import os
+import pytest
+
+from app.core import config as config_module
+from app.core.config import Config, get_config, reload_config
+
+
+def test_config_is_immutable(nas_config):
+    with pytest.raises(AttributeError):
+        nas_config.domain = "elsewhere.example"
+
+
+def test_replace_returns_modified_copy(nas_config):
+    changed = nas_config.replace(accel_redirect_prefix="/_accel/videos/")
+    assert changed.accel_redirect_prefix == "/_accel/videos/"
+    assert changed.videos_dir == nas_config.videos_dir
+    assert nas_config.accel_redirect_prefix is None
+    with pytest.raises(TypeError):
+        nas_config.replace(no_such_setting=1)
+
+
+def test_get_config_is_cached_until_reload(tmp_path, monkeypatch):
+    monkeypatch.setattr(config_module, "_config", None)
+    monkeypatch.setenv("NAS_MOUNT_PATH", str(tmp_path))
+    first = get_config()
+    assert get_config() is first
+
+    monkeypatch.setenv("DOMAIN", "reloaded.example")
+    assert get_config().domain == first.domain
+    reloaded = reload_config()
+    assert reloaded.domain == "reloaded.example"
+    assert get_config() is reloaded
+
+
+def test_directories_created_only_on_request(tmp_path, monkeypatch):
+    monkeypatch.setenv("NAS_MOUNT_PATH", str(tmp_path / "nas"))
+    config = Config()
+    assert not os.path.exists(config.chunks_dir)
+    config.ensure_directories()
+    assert os.path.isdir(config.chunks_dir) and os.path.isdir(config.videos_dir)
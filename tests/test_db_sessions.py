@@ -0,0 +1,67 @@
+"""
+Tests for the database engine profile and per-request session handling.
+"""
+
+import pytest
+
+from sqlalchemy import text
+
+from app.models import create_engine_from_config
+
+
+def test_authenticated_request_uses_one_session(stats_client, signed_headers):
+    """require_signature and the handler share the request's session and connection."""
+    resp = stats_client.post("/upload/initiate", data={"filename": "a.mp4", "total_chunks": 3}, headers=signed_headers)
+
+    assert resp.status_code == 200
+    assert resp.headers["x-db-sessions"] == "1"
+    assert resp.headers["x-db-connections"] == "1"
+    # Key lookup on a cold keyring, then the bulk insert
+    assert resp.headers["x-db-queries"] == "2"
+
+    resp = stats_client.post("/upload/initiate", data={"filename": "b.mp4", "total_chunks": 3}, headers=signed_headers)
+    assert resp.headers["x-db-queries"] == "1"
+
+
+def test_share_video_query_count(stats_client, make_video):
+    """Serving a video costs a single query."""
+    video = make_video()
+
+    resp = stats_client.get(f"/videos/{video.share_token}")
+
+    assert resp.status_code == 200
+    assert resp.headers["x-db-sessions"] == "1"
+    assert resp.headers["x-db-queries"] == "1"
+
+
+@pytest.mark.asyncio
+async def test_sqlite_engine_profile(nas_config):
+    """The engine factory reads the URL from Config and tunes SQLite on connect."""
+    engine = create_engine_from_config(nas_config)
+    try:
+        assert engine.url.database.startswith(nas_config.nas_mount_path)
+        assert engine.echo is False
+        async with engine.connect() as conn:
+            assert (await conn.execute(text("PRAGMA journal_mode"))).scalar() == "wal"
+            assert (await conn.execute(text("PRAGMA synchronous"))).scalar() == 1  # NORMAL
+            assert (await conn.execute(text("PRAGMA busy_timeout"))).scalar() == 5000
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_engine_pool_options_fit_the_backend(nas_config):
+    """File SQLite gets a sized pool without pre-ping; in-memory SQLite accepts the same config."""
+    engine = create_engine_from_config(nas_config)
+    try:
+        assert engine.pool.size() == nas_config.database_pool_size
+        assert engine.pool._pre_ping is False
+    finally:
+        await engine.dispose()
+
+    memory = create_engine_from_config(nas_config.replace(database_url="sqlite+aiosqlite:///:memory:"))
+    try:
+        async with memory.connect() as conn:
+            assert (await conn.execute(text("SELECT 1"))).scalar() == 1
+    finally:
+        await memory.dispose()
@@ -0,0 +1,136 @@
+"""
+Tests for content-addressed video storage: shared blobs, reference counts and garbage collection.
+"""
+
+import asyncio
+import hashlib
+import os
+
+from sqlalchemy.future import select
+
+import upload_client
+from app.models import Blob, Video
+from app.core import assembly
+from app.core.blobs import BLOBS_DIR, blob_name, collect_garbage
+from tests.test_integrity import fetch, post_chunk
+from tests.test_raw_upload import create, patch
+from tests.test_upload_resume import initiate
+
+
+def upload(app_client, headers, chunks):
+    upload_id = initiate(app_client, headers, len(chunks))
+    for n, chunk in enumerate(chunks, 1):
+        resp = post_chunk(app_client, headers, upload_id, n, len(chunks), chunk, hashlib.sha256(chunk).hexdigest())
+        assert resp.status_code == 200
+    job = app_client.post("/upload/complete", data={"upload_id": upload_id}, headers=headers).json()
+    assert job["status"] == "done"
+    return job
+
+
+def blob_files(nas_config):
+    root = os.path.join(nas_config.videos_dir, BLOBS_DIR)
+    return [os.path.join(d, f) for d, _, files in os.walk(root) for f in files]
+
+
+def run_gc(app_client, nas_config, grace=3600):
+    async def run():
+        async with app_client.session_factory() as session:
+            return await collect_garbage(session, nas_config, grace=grace)
+    return asyncio.run(run())
+
+
+def test_identical_uploads_share_one_blob(app_client, signed_headers, inline_assembly, nas_config):
+    chunks = [os.urandom(5000), os.urandom(10)]
+
+    first = upload(app_client, signed_headers, chunks)
+    second = upload(app_client, signed_headers, chunks)
+
+    assert len(blob_files(nas_config)) == 1
+    assert fetch(app_client, select(Blob.ref_count)) == [2]
+    for job in (first, second):
+        resp = app_client.get(job["video_link"])
+        assert resp.content == b"".join(chunks)
+        assert 'filename="clip_' in resp.headers["content-disposition"]
+
+
+def test_same_content_dedups_across_chunkings_and_raw(app_client, signed_headers, inline_assembly, nas_config):
+    data = os.urandom(6000)
+    upload(app_client, signed_headers, [data[:4000], data[4000:]])
+    upload(app_client, signed_headers, [data[:1000], data[1000:3000], data[3000:]])
+    raw = create(app_client, signed_headers, len(data))
+    token = {"authorization": f"Bearer {raw['upload_token']}"}
+    assert patch(app_client, token, raw["upload_url"], 0, data).status_code == 204
+    job = app_client.post("/upload/complete", data={"upload_id": raw["upload_id"]}, headers=token).json()
+
+    assert job["status"] == "done"
+    assert len(blob_files(nas_config)) == 1
+    assert fetch(app_client, select(Blob.digest)) == [hashlib.sha256(data).hexdigest()]
+    assert fetch(app_client, select(Blob.ref_count)) == [3]
+
+
+def test_blob_registered_by_another_worker_is_shared(app_client, signed_headers, inline_assembly, nas_config,
+                                                     monkeypatch):
+    """Another process's blob is invisible to both lookups here; the unique digest still dedups it."""
+    chunks = [os.urandom(5000), os.urandom(10)]
+    first = upload(app_client, signed_headers, chunks)
+    misses = [None, None]
+    real_find_blob = assembly.find_blob
+
+    async def racing_find_blob(session, digest):
+        return misses.pop() if misses else await real_find_blob(session, digest)
+
+    monkeypatch.setattr(assembly, "find_blob", racing_find_blob)
+    second = upload(app_client, signed_headers, chunks)
+
+    assert len(blob_files(nas_config)) == 1
+    assert fetch(app_client, select(Blob.ref_count)) == [2]
+    assert app_client.get(second["video_link"]).content == app_client.get(first["video_link"]).content
+
+
+def test_client_skips_upload_of_known_file(app_client, signed_headers, client_keys, inline_assembly,
+                                           nas_config, tmp_path):
+    keys_dir, key_id = client_keys
+    source = tmp_path / "clip.mp4"
+    source.write_bytes(os.urandom(3000))
+    first = upload_client.upload_file_parallel("http://testserver", keys_dir, str(source), key_id,
+                                               chunk_size=1024, session=app_client)
+
+    second = upload_client.upload_file_parallel("http://testserver", keys_dir, str(source), key_id,
+                                                chunk_size=1024, session=app_client)
+
+    assert second["duplicate"] is True
+    assert second["share_token"] != first["share_token"]
+    assert app_client.get(second["video_link"]).content == source.read_bytes()
+    assert fetch(app_client, select(Blob.ref_count)) == [2]
+
+
+def test_blob_collected_after_last_reference(app_client, signed_headers, inline_assembly, nas_config):
+    chunks = [os.urandom(2000)]
+    first = upload(app_client, signed_headers, chunks)
+    second = upload(app_client, signed_headers, chunks)
+
+    assert app_client.delete(f"/videos/{first['share_token']}", headers=signed_headers).status_code == 200
+    assert run_gc(app_client, nas_config)["blobs_removed"] == 0
+    assert app_client.get(second["video_link"]).content == chunks[0]
+
+    assert app_client.delete(f"/videos/{second['share_token']}", headers=signed_headers).status_code == 200
+    stats = run_gc(app_client, nas_config)
+
+    assert stats["blobs_removed"] == 1 and stats["bytes_freed"] == 2000
+    assert blob_files(nas_config) == []
+    assert fetch(app_client, select(Blob)) == []
+    assert fetch(app_client, select(Video)) == []
+
+
+def test_gc_removes_old_orphan_files_only(app_client, nas_config):
+    digest = "ab" * 32
+    orphan = os.path.join(nas_config.videos_dir, blob_name(digest))
+    os.makedirs(os.path.dirname(orphan))
+    with open(orphan, "wb") as f:
+        f.write(b"left behind")
+
+    assert run_gc(app_client, nas_config)["orphans_removed"] == 0
+    stats = run_gc(app_client, nas_config, grace=-1)
+
+    assert stats["orphans_removed"] == 1
+    assert not os.path.exists(orphan)
@@ -0,0 +1,125 @@
+"""
+Tests for moving the MP4 moov box ahead of the media data.
+"""
+
+import os
+import struct
+import pytest
+
+from app.core import faststart
+from app.core.faststart import FaststartError, faststart_in_place, top_level_boxes
+
+
+def box(box_type: bytes, body: bytes) -> bytes:
+    return struct.pack(">I4s", len(body) + 8, box_type) + body
+
+
+def full_box(box_type: bytes, body: bytes) -> bytes:
+    return box(box_type, b"\0\0\0\0" + body)
+
+
+def moov_with_offsets(offsets, table=b"stco") -> bytes:
+    fmt = "I" if table == b"stco" else "Q"
+    chunk_table = full_box(table, struct.pack(f">I{len(offsets)}{fmt}", len(offsets), *offsets))
+    stbl = box(b"stbl", full_box(b"stsz", b"\0" * 8) + chunk_table)
+    trak = box(b"trak", box(b"tkhd", b"\0" * 84) + box(b"mdia", box(b"minf", stbl)))
+    return box(b"moov", box(b"mvhd", b"\0" * 100) + trak)
+
+
+def trailing_moov_file(path, samples, table=b"stco"):
+    """ftyp + mdat(samples) + moov; returns the sample offsets as written"""
+    ftyp = box(b"ftyp", b"isom\0\0\2\0isomiso2")
+    mdat_start = len(ftyp) + 8
+    offsets = []
+    position = mdat_start
+    for sample in samples:
+        offsets.append(position)
+        position += len(sample)
+    path.write_bytes(ftyp + box(b"mdat", b"".join(samples)) + moov_with_offsets(offsets, table))
+    return offsets
+
+
+def read_offsets(path):
+    """Chunk offsets from the (single) chunk offset table, plus the top-level layout"""
+    data = path.read_bytes()
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        layout = [box_type for box_type, _, _ in top_level_boxes(fd, len(data))]
+    finally:
+        os.close(fd)
+    for table, fmt in ((b"stco", "I"), (b"co64", "Q")):
+        at = data.find(table)
+        if at != -1:
+            count = struct.unpack(">I", data[at + 8:at + 12])[0]
+            return table, list(struct.unpack(f">{count}{fmt}", data[at + 12:at + 12 + count * struct.calcsize(fmt)])), layout
+    raise AssertionError("no chunk offset table")
+
+
+def test_moov_moved_and_offsets_still_point_at_samples(tmp_path):
+    path = tmp_path / "video.mp4"
+    samples = [os.urandom(1000), os.urandom(37), os.urandom(4096)]
+    trailing_moov_file(path, samples)
+    size = path.stat().st_size
+
+    assert faststart_in_place(str(path)) is True
+
+    data = path.read_bytes()
+    table, offsets, layout = read_offsets(path)
+    assert layout == [b"ftyp", b"moov", b"mdat"]
+    assert table == b"stco"
+    assert [data[o:o + len(s)] for o, s in zip(offsets, samples)] == samples
+    assert len(data) == size
+    assert not os.path.exists(f"{path}.faststart")
+
+
+def test_already_faststart_file_untouched(tmp_path):
+    path = tmp_path / "video.mp4"
+    trailing_moov_file(path, [os.urandom(500)])
+    faststart_in_place(str(path))
+    before = path.read_bytes()
+    mtime = path.stat().st_mtime_ns
+
+    assert faststart_in_place(str(path)) is False
+    assert path.read_bytes() == before
+    assert path.stat().st_mtime_ns == mtime
+
+
+def test_stco_upgraded_to_co64_when_offsets_overflow(tmp_path, monkeypatch):
+    """Offsets past the 32-bit limit (lowered here) switch the table to co64."""
+    path = tmp_path / "video.mp4"
+    samples = [os.urandom(300), os.urandom(300)]
+    trailing_moov_file(path, samples)
+    monkeypatch.setattr(faststart, "STCO_MAX", 200)
+
+    faststart_in_place(str(path))
+
+    data = path.read_bytes()
+    table, offsets, layout = read_offsets(path)
+    assert table == b"co64"
+    assert layout == [b"ftyp", b"moov", b"mdat"]
+    assert [data[o:o + len(s)] for o, s in zip(offsets, samples)] == samples
+
+
+def test_co64_input_rewritten(tmp_path):
+    path = tmp_path / "video.mov"
+    samples = [os.urandom(64), os.urandom(64)]
+    trailing_moov_file(path, samples, table=b"co64")
+
+    faststart_in_place(str(path))
+
+    data = path.read_bytes()
+    table, offsets, _ = read_offsets(path)
+    assert table == b"co64"
+    assert [data[o:o + len(s)] for o, s in zip(offsets, samples)] == samples
+
+
+def test_non_mp4_rejected_and_left_alone(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(b"\x1aE\xdf\xa3" + os.urandom(2048))  # Matroska header
+    before = path.read_bytes()
+
+    with pytest.raises(FaststartError):
+        faststart_in_place(str(path))
+
+    assert path.read_bytes() == before
+    assert not os.path.exists(f"{path}.faststart")
@@ -0,0 +1,162 @@
+"""
+Tests for HLS ladder packaging and segment serving.
+"""
+
+import asyncio
+import json
+import os
+import uuid
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+
+from app.models import TranscodeJob, Video
+from app.core.hls import ffmpeg_hls_command, hls_dir_name, master_playlist, select_ladder
+from app.core.transcode import TranscodeQueue
+from tests.conftest import STUB_FFPROBE, stub
+
+LADDER = [(1080, 5000), (720, 2800), (480, 1400)]
+
+# Writes two segments and an ENDLIST playlist per rendition named in -var_stream_map
+STUB_FFMPEG = """#!{python}
+import os, sys
+args = sys.argv[1:]
+names = [part.split("name:")[1] for part in args[args.index("-var_stream_map") + 1].split() ]
+for name in names:
+    out = args[-1].replace("%v", name)
+    for n in range(2):
+        with open(os.path.join(os.path.dirname(out), "seg_%05d.ts" % n), "wb") as f:
+            f.write(b"segment")
+    with open(out, "w") as f:
+        f.write("#EXTM3U\\n#EXT-X-ENDLIST\\n")
+"""
+
+
+@pytest.fixture
+def hls_config(nas_config, tmp_path):
+    probe = json.dumps({"streams": [
+        {"codec_type": "video", "width": 1280, "height": 720},
+        {"codec_type": "audio"},
+    ]})
+    return nas_config.replace(
+        transcode_workers=1,
+        hls_ladder=LADDER,
+        ffmpeg_path=stub(tmp_path / "ffmpeg", STUB_FFMPEG),
+        ffprobe_path=stub(tmp_path / "ffprobe", STUB_FFPROBE, probe=probe),
+    )
+
+
+def test_ladder_skips_rungs_above_source():
+    assert select_ladder(LADDER, 720) == [(720, 2800), (480, 1400)]
+    assert select_ladder(LADDER, 240) == [(480, 1400)]
+
+
+def test_master_playlist_lists_renditions():
+    source = {"width": 1920, "height": 1080, "audio": True}
+
+    playlist = master_playlist(LADDER[1:], source)
+
+    assert playlist.splitlines()[3:] == [
+        "#EXT-X-STREAM-INF:BANDWIDTH=2928000,RESOLUTION=1280x720", "720p/index.m3u8",
+        "#EXT-X-STREAM-INF:BANDWIDTH=1528000,RESOLUTION=854x480", "480p/index.m3u8",
+    ]
+
+
+def test_ffmpeg_command_maps_audio_only_when_present():
+    with_audio = ffmpeg_hls_command("ffmpeg", "in.mov", "out", LADDER[1:], {"audio": True}, 6)
+    silent = ffmpeg_hls_command("ffmpeg", "in.mov", "out", LADDER[1:], {"audio": False}, 6)
+
+    assert with_audio[with_audio.index("-var_stream_map") + 1] == "v:0,a:0,name:720p v:1,a:1,name:480p"
+    assert silent[silent.index("-var_stream_map") + 1] == "v:0,name:720p v:1,name:480p"
+    assert "-c:a" not in silent
+    assert with_audio[with_audio.index("-hls_playlist_type") + 1] == "event"
+
+
+@pytest.mark.asyncio
+async def test_hls_job_packages_ladder(test_engine, hls_config):
+    session_factory = sessionmaker(bind=test_engine, class_=AsyncSession, expire_on_commit=False)
+    video = Video(filename=f"clip_{uuid.uuid4().hex[:8]}.mp4", file_size=3, share_token=str(uuid.uuid4()))
+    async with session_factory() as session:
+        session.add(video)
+        await session.commit()
+    with open(os.path.join(hls_config.videos_dir, video.filename), "wb") as f:
+        f.write(b"raw")
+    queue = TranscodeQueue(session_factory, hls_config)
+    # Only the HLS job is under test here
+    async with session_factory() as session:
+        session.add(TranscodeJob(job_id=str(uuid.uuid4()), video_id=video.id, kind="hls", status="queued"))
+        await session.commit()
+    await queue.resume_pending()
+    await asyncio.gather(*queue._tasks)
+
+    async with session_factory() as session:
+        video = (await session.execute(select(Video).where(Video.id == video.id))).scalar_one()
+    assert video.hls_status == "ready"
+    output = os.path.join(hls_config.videos_dir, hls_dir_name(video))
+    assert sorted(os.listdir(output)) == ["480p", "720p", "master.m3u8"]
+    assert sorted(os.listdir(os.path.join(output, "720p"))) == ["index.m3u8", "seg_00000.ts", "seg_00001.ts"]
+
+
+@pytest.fixture
+def packaging_video(app_client, nas_config, make_video):
+    """A video whose packaging has written the master playlist and one 720p segment"""
+    video = make_video()
+
+    async def mark():
+        async with app_client.session_factory() as session:
+            row = (await session.execute(select(Video).where(Video.id == video.id))).scalar_one()
+            row.hls_status = "packaging"
+            await session.commit()
+
+    asyncio.run(mark())
+    output = os.path.join(nas_config.videos_dir, hls_dir_name(video))
+    os.makedirs(os.path.join(output, "720p"))
+    with open(os.path.join(output, "master.m3u8"), "w") as f:
+        f.write(master_playlist([(720, 2800)], {"width": 1280, "height": 720, "audio": False}))
+    with open(os.path.join(output, "720p", "seg_00000.ts"), "wb") as f:
+        f.write(b"segment")
+    return video
+
+
+def test_serves_segments_while_packaging(app_client, packaging_video):
+    base = f"/videos/{packaging_video.share_token}/hls"
+
+    master = app_client.get(f"{base}/master.m3u8")
+    assert master.status_code == 200
+    assert master.headers["content-type"] == "application/vnd.apple.mpegurl"
+    assert "720p/index.m3u8" in master.text
+
+    playlist = app_client.get(f"{base}/720p/index.m3u8")
+    assert playlist.text.startswith("#EXTM3U")
+    assert "#EXT-X-PLAYLIST-TYPE:EVENT" in playlist.text
+    assert playlist.headers["cache-control"] == "no-cache"
+
+    segment = app_client.get(f"{base}/720p/seg_00000.ts")
+    assert segment.content == b"segment"
+    assert segment.headers["content-type"] == "video/mp2t"
+    assert segment.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert "content-disposition" not in segment.headers
+
+    assert app_client.get(f"{base}/720p/seg_00001.ts").status_code == 404
+    assert app_client.get(f"{base}/../../test.sqlite3").status_code == 404
+
+    page = app_client.get(f"/play/{packaging_video.share_token}").text
+    assert f"{base}/master.m3u8" in page
+
+
+def test_no_hls_routes_without_packaging(app_client, make_video):
+    video = make_video()
+
+    assert app_client.get(f"/videos/{video.share_token}/hls/master.m3u8").status_code == 404
+    assert "hls.min.js" not in app_client.get(f"/play/{video.share_token}").text
+
+
+def test_player_loads_self_hosted_hls_js(app_client, packaging_video, tmp_path, monkeypatch):
+    (tmp_path / "hls.min.js").write_text("/* hls.js */")
+    monkeypatch.setattr("app.api.play.STATIC_DIR", str(tmp_path))
+
+    page = app_client.get(f"/play/{packaging_video.share_token}").text
+
+    assert '<script src="/static/hls.min.js"></script>' in page
+    assert "cdn.jsdelivr.net" not in page
@@ -0,0 +1,110 @@
+"""
+Tests for writing chunk bodies to disk in aligned blocks while hashing them.
+"""
+
+import asyncio
+import hashlib
+import os
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app.core.ingest import ChunkFileWriter, stream_chunk_to_disk
+
+
+def recording_writer(path, monkeypatch, **kwargs):
+    """ChunkFileWriter that records the size of every block it hands to the write thread"""
+    writer = ChunkFileWriter(str(path), **kwargs)
+    blocks = []
+    write_all = writer._write_all
+    monkeypatch.setattr(writer, "_write_all", lambda block: blocks.append(len(block)) or write_all(block))
+    return writer, blocks
+
+
+def test_writer_flushes_aligned_blocks_and_partial_tail(tmp_path, monkeypatch):
+    writer, blocks = recording_writer(tmp_path / "chunk", monkeypatch, buffer_size=4)
+
+    async def run():
+        await writer.open()
+        for piece in (b"abc", b"def", b"ghi", b"jk"):
+            await writer.write(piece)
+        await writer.close()
+
+    asyncio.run(run())
+
+    # Whole multiples of the block size while streaming, the remainder on close
+    assert blocks == [4, 4, 3]
+    assert (tmp_path / "chunk").read_bytes() == b"abcdefghijk"
+    assert writer.bytes_written == 11
+    assert writer.digest == hashlib.sha256(b"abcdefghijk").hexdigest()
+
+
+def test_writer_continues_at_offset_and_running_hash(tmp_path):
+    path = tmp_path / "upload"
+    first = ChunkFileWriter(str(path), buffer_size=4)
+    second = None
+
+    async def run():
+        nonlocal second
+        await first.open()
+        await first.write(b"hello ")
+        await first.close()
+        second = ChunkFileWriter(str(path), buffer_size=4, offset=6, running_hash=first.running_hash)
+        await second.open()
+        await second.write(b"world")
+        await second.close()
+
+    asyncio.run(run())
+
+    assert path.read_bytes() == b"hello world"
+    assert second.bytes_written == 5
+    assert second.digest == hashlib.sha256(b"hello world").hexdigest()
+
+
+def multipart_request(body: bytes, boundary: str = "xyz", piece_size: int = 5) -> Request:
+    """Request whose body arrives in small pieces, so parts straddle receive() calls"""
+    pieces = [body[i:i + piece_size] for i in range(0, len(body), piece_size)]
+    messages = iter([{"type": "http.request", "body": piece, "more_body": True} for piece in pieces]
+                    + [{"type": "http.request", "body": b"", "more_body": False}])
+
+    async def receive():
+        return next(messages)
+
+    scope = {"type": "http", "method": "POST", "path": "/upload/chunk",
+             "headers": [(b"content-type", f"multipart/form-data; boundary={boundary}".encode())]}
+    return Request(scope, receive)
+
+
+def form(*parts) -> bytes:
+    body = b""
+    for disposition, value in parts:
+        body += b"--xyz\r\nContent-Disposition: form-data; " + disposition + b"\r\n\r\n" + value + b"\r\n"
+    return body + b"--xyz--\r\n"
+
+
+def test_stream_chunk_to_disk_writes_file_part(tmp_path, monkeypatch):
+    data = os.urandom(21)
+    body = form((b'name="file"; filename="chunk"', data), (b'name="chunk_number"', b"3"))
+    # Small blocks so the 21 bytes end in a partial one
+    monkeypatch.setattr(ChunkFileWriter.__init__, "__defaults__", (8, 0, None))
+
+    chunk = asyncio.run(stream_chunk_to_disk(multipart_request(body), str(tmp_path)))
+
+    # The fields may follow the file part, so it is written under a temporary name
+    assert os.path.dirname(chunk.path) == str(tmp_path)
+    assert os.path.basename(chunk.path).startswith(".incoming-")
+    with open(chunk.path, "rb") as f:
+        assert f.read() == data
+    assert chunk.size == 21
+    assert chunk.digest == hashlib.sha256(data).hexdigest()
+    assert chunk.field("chunk_number") == "3"
+
+
+def test_stream_chunk_to_disk_without_file_part(tmp_path):
+    body = form((b'name="chunk_number"', b"1"))
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(stream_chunk_to_disk(multipart_request(body), str(tmp_path)))
+
+    assert exc_info.value.status_code == 422
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,84 @@
+"""
+Tests for chunk digests computed during ingest and the file digest derived from them.
+"""
+
+import asyncio
+import hashlib
+import os
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.future import select
+
+from app.models import ChunkUpload, Video, init_db
+from app.core.assembly import chunk_file_path
+from tests.test_upload_resume import initiate
+
+
+def post_chunk(app_client, headers, upload_id, chunk_number, total_chunks, data, digest):
+    return app_client.post("/upload/chunk", data={
+        "upload_id": upload_id, "chunk_number": chunk_number, "total_chunks": total_chunks, "chunk_digest": digest
+    }, files={"file": ("chunk", data)}, headers=headers)
+
+
+def fetch(app_client, statement):
+    async def run():
+        async with app_client.session_factory() as session:
+            return (await session.execute(statement)).scalars().all()
+    return asyncio.run(run())
+
+
+def test_chunk_digest_mismatch_is_rejected(app_client, signed_headers, nas_config):
+    upload_id = initiate(app_client, signed_headers, 1)
+
+    resp = post_chunk(app_client, signed_headers, upload_id, 1, 1, b"damaged", hashlib.sha256(b"original").hexdigest())
+
+    assert resp.status_code == 400
+    assert not os.path.exists(chunk_file_path(nas_config.chunks_dir, upload_id, 1))
+    assert os.listdir(nas_config.chunks_dir) == []
+    assert fetch(app_client, select(ChunkUpload.received).where(ChunkUpload.upload_id == upload_id)) == [False]
+
+
+def test_video_digest_is_sha256_of_content(app_client, signed_headers, inline_assembly):
+    chunks = [os.urandom(3 * 1024 * 1024 + 17), os.urandom(1000)]
+    digests = [hashlib.sha256(chunk).hexdigest() for chunk in chunks]
+    upload_id = initiate(app_client, signed_headers, 2)
+    for n, (chunk, digest) in enumerate(zip(chunks, digests), 1):
+        resp = post_chunk(app_client, signed_headers, upload_id, n, 2, chunk, digest.upper())
+        assert resp.status_code == 200
+        assert resp.json()["digest"] == digest
+
+    job = app_client.post("/upload/complete", data={"upload_id": upload_id}, headers=signed_headers).json()
+
+    assert job["status"] == "done"
+    stored = fetch(app_client, select(Video.digest).where(Video.share_token == job["share_token"]))
+    assert stored == [hashlib.sha256(b"".join(chunks)).hexdigest()]
+
+
+def test_chunk_changed_on_disk_fails_assembly(app_client, signed_headers, inline_assembly, nas_config):
+    chunks = [b"first chunk", b"second chunk"]
+    upload_id = initiate(app_client, signed_headers, 2)
+    for n, chunk in enumerate(chunks, 1):
+        assert post_chunk(app_client, signed_headers, upload_id, n, 2, chunk, hashlib.sha256(chunk).hexdigest()).status_code == 200
+    with open(chunk_file_path(nas_config.chunks_dir, upload_id, 2), "r+b") as f:
+        f.write(b"S")
+
+    job = app_client.post("/upload/complete", data={"upload_id": upload_id}, headers=signed_headers).json()
+
+    assert job["status"] == "failed"
+    assert "changed on disk" in job["error"]
+
+
+def test_init_db_adds_new_columns(tmp_path):
+    """Databases created before the digest columns existed are upgraded in place."""
+    async def run():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/old.sqlite3")
+        async with engine.begin() as conn:
+            await conn.execute(text("CREATE TABLE chunk_uploads (id INTEGER PRIMARY KEY, upload_id VARCHAR)"))
+        await init_db(engine)
+        async with engine.connect() as conn:
+            columns = [row[1] for row in await conn.execute(text("PRAGMA table_info(chunk_uploads)"))]
+        await engine.dispose()
+        return columns
+
+    assert "digest" in asyncio.run(run())
@@ -14,7 +14,10 @@ from app.core.security import (
     add_public_key_to_db, 
     require_signature, 
     get_public_key_by_id,
-    require_admin_auth
+    require_admin_auth,
+    remove_public_key_from_db,
+    keyring_cache,
+    KeyringCache
 )
 
 logger = logging.getLogger(__name__)
@@ -245,4 +248,48 @@ async def test_non_admin_key_admin_verification_fails(db_session, cleanup_test_k
         )
     
     assert exc_info.value.status_code == 401
-    assert "not admin key" in str(exc_info.value.detail) 
\ No newline at end of file
+    assert "not admin key" in str(exc_info.value.detail)
+
+
+@pytest.mark.asyncio
+async def test_keyring_cache_hit_and_invalidation(db_session):
+    """Repeated verifications use the cached key until the key is removed."""
+    test_key_id = "test_key_cached"
+    private_key, public_key_pem = generate_key_pair(test_key_id)
+    await add_public_key_to_db(
+        session=db_session,
+        key_id=test_key_id,
+        public_key_pem=public_key_pem,
+        is_admin=True,
+        created_by="test_script",
+        domain="test.local"
+    )
+    headers = key_headers(test_key_id, test_key_id, private_key)
+
+    await require_signature(key_id=test_key_id, signature=headers['signature'], message=headers['message'], session=db_session)
+    hits = keyring_cache.hits
+    await require_admin_auth(key_id=test_key_id, signature=headers['signature'], message=headers['message'], session=db_session)
+    # One hit for the signature check, one for the admin flag
+    assert keyring_cache.hits == hits + 2
+
+    await remove_public_key_from_db(db_session, test_key_id)
+    assert keyring_cache.get(test_key_id) is None
+    with pytest.raises(HTTPException) as exc_info:
+        await require_signature(key_id=test_key_id, signature=headers['signature'], message=headers['message'], session=db_session)
+    assert "Key not found" in str(exc_info.value.detail)
+
+def test_keyring_cache_is_bounded_and_expires():
+    """The cache evicts least recently used keys and honours its TTL."""
+    cache = KeyringCache(max_size=2, ttl=60)
+    cache.put("a", None, False)
+    cache.put("b", None, False)
+    cache.get("a")
+    cache.put("c", None, True)
+    assert cache.get("b") is None
+    assert cache.get("a") == (None, False)
+    assert cache.get("c") == (None, True)
+
+    expired = KeyringCache(ttl=-1)
+    expired.put("a", None, False)
+    assert expired.get("a") is None
+    assert expired.stats()["misses"] == 1
@@ -0,0 +1,121 @@
+"""
+Tests for container sniffing and header-only media metadata.
+"""
+
+import struct
+
+import pytest
+
+from app.core.media import probe_media, sniff_container
+from tests.test_dedup import upload
+from tests.test_faststart import box, full_box
+
+
+def mp4_file(path, moov_first=False, duration=90, timescale=1000):
+    """ftyp + mdat + moov with an H.264 1920x1080 track and an AAC track"""
+    def trak(handler, fourcc, width=0, height=0):
+        tkhd = full_box(b"tkhd", b"\0" * 72 + struct.pack(">II", width << 16, height << 16))
+        hdlr = full_box(b"hdlr", b"\0" * 4 + handler + b"\0" * 12 + b"\0")
+        stsd = full_box(b"stsd", struct.pack(">I", 1) + box(fourcc, b"\0" * 70))
+        stbl = box(b"stbl", stsd + full_box(b"stco", struct.pack(">I", 0)))
+        return box(b"trak", tkhd + box(b"mdia", hdlr + box(b"minf", stbl)))
+
+    mvhd = full_box(b"mvhd", struct.pack(">IIII", 0, 0, timescale, duration * timescale) + b"\0" * 80)
+    moov = box(b"moov", mvhd + trak(b"vide", b"avc1", 1920, 1080) + trak(b"soun", b"mp4a"))
+    ftyp = box(b"ftyp", b"isom\0\0\2\0isomavc1")
+    mdat = box(b"mdat", b"\0" * 10000)
+    path.write_bytes(ftyp + moov + mdat if moov_first else ftyp + mdat + moov)
+    return path
+
+
+def element(element_id: int, payload: bytes) -> bytes:
+    id_bytes = element_id.to_bytes((element_id.bit_length() + 7) // 8, "big")
+    # 8-byte size field for everything keeps the builder simple
+    return id_bytes + b"\x01" + len(payload).to_bytes(7, "big") + payload
+
+
+def matroska_file(path, doctype=b"webm"):
+    header = element(0x1A45DFA3, element(0x4282, doctype))
+    info = element(0x1549A966, element(0x2AD7B1, (1_000_000).to_bytes(3, "big")) + element(0x4489, struct.pack(">d", 12500.0)))
+    video = element(0xAE, element(0x83, b"\x01") + element(0x86, b"V_VP9") +
+                    element(0xE0, element(0xB0, (1280).to_bytes(2, "big")) + element(0xBA, (720).to_bytes(2, "big"))))
+    audio = element(0xAE, element(0x83, b"\x02") + element(0x86, b"A_OPUS"))
+    cluster = element(0x1F43B675, b"\0" * 100)
+    # Segment of unknown size, as live-muxed files have
+    segment = b"\x18\x53\x80\x67\x01\xff\xff\xff\xff\xff\xff\xff" + info + element(0x1654AE6B, video + audio) + cluster
+    path.write_bytes(header + segment)
+    return path
+
+
+@pytest.mark.parametrize("head, expected", [
+    (b"\0\0\0\x18ftypisom", ("mp4", "video/mp4")),
+    (b"\0\0\0\x14ftypqt  ", ("mov", "video/quicktime")),
+    (b"RIFF\0\0\0\0AVI LIST", ("avi", "video/x-msvideo")),
+    (b"OggS\0\2", ("ogg", "video/ogg")),
+    (b"\x47" + b"\0" * 187 + b"\x47\0", ("mpegts", "video/mp2t")),
+    (b"not a video at all", (None, None)),
+])
+def test_sniff_container(head, expected):
+    assert sniff_container(head) == expected
+
+
+@pytest.mark.parametrize("moov_first", [False, True])
+def test_mp4_metadata_from_headers(tmp_path, moov_first):
+    path = mp4_file(tmp_path / "clip.bin", moov_first=moov_first)
+
+    media = probe_media(str(path))
+
+    assert media["container"] == "mp4" and media["mime_type"] == "video/mp4"
+    assert media["duration"] == 90
+    assert (media["width"], media["height"]) == (1920, 1080)
+    assert (media["video_codec"], media["audio_codec"]) == ("h264", "aac")
+    assert media["bitrate"] == path.stat().st_size * 8 // 90
+
+
+@pytest.mark.parametrize("doctype, container", [(b"webm", "webm"), (b"matroska", "mkv")])
+def test_matroska_metadata_from_headers(tmp_path, doctype, container):
+    media = probe_media(str(matroska_file(tmp_path / "clip.mp4", doctype)))
+
+    assert media["container"] == container
+    assert media["duration"] == 12.5
+    assert (media["width"], media["height"]) == (1280, 720)
+    assert (media["video_codec"], media["audio_codec"]) == ("vp9", "opus")
+
+
+def test_unknown_file_has_no_metadata(tmp_path):
+    path = tmp_path / "notes.mp4"
+    path.write_bytes(b"hello")
+
+    media = probe_media(str(path))
+
+    assert media["container"] == "unknown"
+    assert media["mime_type"] is None and media["duration"] is None
+
+
+def test_upload_stores_metadata_and_serves_sniffed_type(app_client, signed_headers, inline_assembly, tmp_path):
+    """A WebM uploaded as .mp4 is served as video/webm, and listed with its metadata."""
+    data = matroska_file(tmp_path / "clip.webm").read_bytes()
+    job = upload(app_client, signed_headers, [data[:50], data[50:]])
+
+    resp = app_client.get(job["video_link"])
+    assert resp.headers["content-type"] == "video/webm"
+
+    [video] = [v for v in app_client.get("/upload/videos", headers=signed_headers).json()["videos"]
+               if v["share_token"] == job["share_token"]]
+    assert video["container"] == "webm"
+    assert video["duration"] == 12.5
+    assert (video["width"], video["height"], video["video_codec"]) == (1280, 720, "vp9")
+
+    page = app_client.get(f"/play/{job['share_token']}").text
+    assert f'<source src="/videos/{job["share_token"]}" type="video/webm">' in page
+    assert "1280×720" in page and "0:12" in page
+
+
+def test_untranscoded_quicktime_source_has_no_type(app_client, make_video):
+    """Browsers skip a <source> typed video/quicktime, although most .mov files play."""
+    video = make_video(b"mov bytes", filename="phone.mov")
+
+    page = app_client.get(f"/play/{video.share_token}").text
+
+    assert f'<source src="/videos/{video.share_token}">' in page
+    assert '<meta name="og:video:type" content="video/quicktime">' in page
@@ -0,0 +1,125 @@
+"""
+Tests for the in-process metrics and their /metrics exposition.
+"""
+
+import asyncio
+import os
+import pytest
+
+from app.core.metrics import (
+    ASSEMBLY_SECONDS, HTTP_REQUESTS, HTTP_RESPONSE_BYTES, SIGNATURE_VERIFY_SECONDS, UPLOAD_BYTES, Counter, Histogram,
+    MetricsMiddleware, Registry
+)
+from app.core.streaming import STREAM_READ_SIZE, VideoStreamResponse
+from tests.test_raw_upload import create, patch
+
+
+def test_exposition_format():
+    registry = Registry()
+    requests = Counter("demo_requests_total", "Requests.", ("route",), registry=registry)
+    latency = Histogram("demo_seconds", "Latency.", buckets=(0.1, 1.0), registry=registry)
+    requests.inc(route='/a"b')
+    requests.inc(2, route='/a"b')
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value)
+
+    assert registry.render().splitlines() == [
+        "# HELP demo_requests_total Requests.",
+        "# TYPE demo_requests_total counter",
+        'demo_requests_total{route="/a\\"b"} 3',
+        "# HELP demo_seconds Latency.",
+        "# TYPE demo_seconds histogram",
+        'demo_seconds_bucket{le="0.1"} 1',
+        'demo_seconds_bucket{le="1"} 2',
+        'demo_seconds_bucket{le="+Inf"} 3',
+        "demo_seconds_sum 5.55",
+        "demo_seconds_count 3",
+    ]
+
+
+def test_requests_labelled_by_route_template(app_client, make_video):
+    video = make_video(b"x" * 1000)
+    route = "/videos/{share_token}"
+    before = HTTP_REQUESTS.value(method="GET", route=route, status=200), HTTP_RESPONSE_BYTES.value(route=route)
+
+    app_client.get(f"/videos/{video.share_token}")
+    app_client.get(f"/videos/{video.share_token}", headers={"range": "bytes=0-99"})
+    app_client.get("/no/such/path")
+
+    assert HTTP_REQUESTS.value(method="GET", route=route, status=200) == before[0] + 1
+    assert HTTP_RESPONSE_BYTES.value(route=route) == before[1] + 1100
+    body = app_client.get("/metrics")
+    assert body.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'route="/videos/{share_token}",status="206"' in body.text
+    assert 'route="unmatched",status="404"' in body.text
+    # Share tokens never become label values
+    assert video.share_token not in body.text
+
+
+def serve_file(path, send, extensions=None):
+    """Run a VideoStreamResponse for GET ``path`` through the middleware, outside any route"""
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [], "asgi": {"spec_version": "2.4"},
+             "extensions": extensions or {}}
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    asyncio.run(MetricsMiddleware(VideoStreamResponse(str(path)))(scope, receive, send))
+
+
+def test_response_bytes_count_only_what_was_sent(tmp_path):
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(os.urandom(3 * STREAM_READ_SIZE))
+    before = HTTP_RESPONSE_BYTES.value(route="unmatched")
+
+    bodies = []
+
+    async def disconnecting_send(message):
+        if message["type"] == "http.response.body":
+            bodies.append(message)
+            if len(bodies) > 1:
+                raise OSError("client went away")
+
+    with pytest.raises(OSError):
+        serve_file(path, disconnecting_send)
+
+    # The first block went out; the declared Content-Length did not
+    assert HTTP_RESPONSE_BYTES.value(route="unmatched") == before + STREAM_READ_SIZE
+
+
+def test_response_bytes_include_path_sends(tmp_path):
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(b"x" * 1234)
+    before = HTTP_RESPONSE_BYTES.value(route="unmatched")
+    messages = []
+
+    async def send(message):
+        messages.append(message["type"])
+
+    serve_file(path, send, extensions={"http.response.pathsend": {}})
+
+    assert messages == ["http.response.start", "http.response.pathsend"]
+    assert HTTP_RESPONSE_BYTES.value(route="unmatched") == before + 1234
+
+
+def test_upload_assembly_and_signature_metrics(app_client, signed_headers, inline_assembly):
+    verified = SIGNATURE_VERIFY_SECONDS.count(result="valid")
+    ingested = UPLOAD_BYTES.value(protocol="raw")
+    assembled = ASSEMBLY_SECONDS.count(outcome="assembled")
+    data = os.urandom(3000)
+
+    upload = create(app_client, signed_headers, len(data))
+    token = {"authorization": f"Bearer {upload['upload_token']}"}
+    patch(app_client, token, upload["upload_url"], 0, data)
+    app_client.post("/upload/complete", data={"upload_id": upload["upload_id"]}, headers=token)
+    forged = {**signed_headers, "signature": "A" * len(signed_headers["signature"])}
+    assert app_client.post("/upload/raw", data={"filename": "x.mp4", "upload_length": 1}, headers=forged).status_code == 401
+
+    assert UPLOAD_BYTES.value(protocol="raw") == ingested + len(data)
+    assert ASSEMBLY_SECONDS.count(outcome="assembled") == assembled + 1
+    # Token-authenticated PATCH and complete skip the signature check
+    assert SIGNATURE_VERIFY_SECONDS.count(result="valid") == verified + 1
+    text = app_client.get("/metrics").text
+    for name in ("vide0_db_query_duration_seconds_count", 'vide0_signature_verify_duration_seconds_count{result="invalid"}',
+                 'vide0_upload_requests_in_progress{protocol="raw"} 0'):
+        assert name in text
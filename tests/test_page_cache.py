@@ -0,0 +1,121 @@
+"""
+Tests for cached rendering of the /play and /setup pages.
+"""
+
+import asyncio
+
+import pytest
+from sqlalchemy.future import select
+
+from app.main import app
+from app.models import Video
+from app.api import setup
+from app.core.config import get_config
+from app.core.page_cache import PageCache, page_cache, play_page_key
+from app.core.security import add_public_key_to_db
+from tests.test_key_verification import generate_key_pair
+from tests.test_transcode import add_video, run_job
+
+
+def test_play_page_rendered_once_and_revalidated(stats_client, make_video):
+    video = make_video()
+    url = f"/play/{video.share_token}"
+
+    first = stats_client.get(url)
+    assert first.status_code == 200
+    assert first.headers["cache-control"] == "no-cache"
+    assert first.headers["x-db-queries"] == "1"
+
+    second = stats_client.get(url)
+    assert second.text == first.text
+    assert second.headers["etag"] == first.headers["etag"]
+    assert second.headers["x-db-queries"] == "0"
+
+    revalidated = stats_client.get(url, headers={"If-None-Match": first.headers["etag"]})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+
+
+@pytest.mark.asyncio
+async def test_finished_transcode_drops_play_page(transcode_env, stub_ffmpeg):
+    session_factory, config = transcode_env
+    video = await add_video(session_factory, config)
+    page_cache.put(play_page_key(video.share_token), b"links the original", config.version)
+
+    await run_job(session_factory, config, video)
+
+    assert page_cache.get(play_page_key(video.share_token), config.version) is None
+
+
+def test_deleted_video_page_is_dropped(app_client, stats_client, make_video, signed_headers, signing_key):
+    video = make_video()
+
+    async def own():
+        async with app_client.session_factory() as session:
+            row = (await session.execute(select(Video).where(Video.id == video.id))).scalar_one()
+            row.uploader_key_id = signing_key[0]
+            await session.commit()
+
+    asyncio.run(own())
+    assert stats_client.get(f"/play/{video.share_token}").status_code == 200
+    assert app_client.delete(f"/videos/{video.share_token}", headers=signed_headers).status_code == 200
+
+    assert stats_client.get(f"/play/{video.share_token}").status_code == 404
+
+
+def test_page_keyed_by_config_version(app_client, stats_client, nas_config, make_video):
+    video = make_video()
+    assert "test.local" not in stats_client.get(f"/play/{video.share_token}").text
+
+    app.dependency_overrides[get_config] = lambda: nas_config.replace(domain="test.local")
+    page = stats_client.get(f"/play/{video.share_token}")
+
+    assert page.headers["x-db-queries"] == "1"
+    assert "test.local" in page.text
+
+
+def test_setup_page_cached_until_keys_change(app_client, stats_client, monkeypatch):
+    renders = []
+    monkeypatch.setattr(setup, "qr_code_png", lambda payload: renders.append(payload) or "")
+
+    first = stats_client.get("/setup")
+    second = stats_client.get("/setup")
+    assert second.headers["etag"] == first.headers["etag"]
+    assert second.headers["x-db-queries"] == "0"
+    assert len(renders) == 1
+    assert '"has_admin_keys": false' in renders[0]
+
+    async def add_admin():
+        _, public_key_pem = generate_key_pair("page_cache_admin")
+        async with app_client.session_factory() as session:
+            await add_public_key_to_db(session, "page_cache_admin", public_key_pem, is_admin=True, domain="test.local")
+
+    asyncio.run(add_admin())
+    third = stats_client.get("/setup")
+
+    assert third.headers["etag"] != first.headers["etag"]
+    assert '"has_admin_keys": true' in renders[1]
+
+
+def test_qr_code_png_memoized():
+    setup.qr_code_png.cache_clear()
+    setup.generate_qr_code({"domain": "a.example"})
+    setup.generate_qr_code({"domain": "a.example"})
+
+    assert setup.qr_code_png.cache_info().hits == 1
+
+
+def test_page_cache_bounded_and_expiring(monkeypatch):
+    cache = PageCache(max_size=2, ttl=10)
+    for key in ("a", "b", "c"):
+        cache.put(key, key.encode(), "v1")
+
+    assert cache.get("a", "v1") is None
+    assert cache.get("c", "v1").body == b"c"
+    assert cache.get("c", "v2") is None  # rendered with an older config
+
+    now = [0.0]
+    monkeypatch.setattr("app.core.ttl_cache.time.monotonic", lambda: now[0])
+    cache.put("d", b"d", "v1")
+    now[0] = 11
+    assert cache.get("d", "v1") is None
@@ -0,0 +1,93 @@
+"""
+Tests for expiring signed playback URLs.
+"""
+
+import re
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.core.config import get_config
+from app.core.db_stats import DBStatsMiddleware
+from app.core.page_cache import page_cache
+from app.core.playback_urls import sign_playback_url, verify_playback_token
+from app.core.share_cache import SharedFile
+from app.core.tokens import seal_token
+
+
+@pytest.fixture
+def signed_config(app_client, nas_config):
+    config = nas_config.replace(playback_url_secret="s3cret")
+    app.dependency_overrides[get_config] = lambda: config
+    page_cache.invalidate()
+    return config
+
+
+def player_source(page: str) -> str:
+    return re.search(r'<source src="([^"]+)"', page).group(1)
+
+
+def test_play_page_embeds_signed_url_served_without_db(app_client, signed_config, make_video):
+    video = make_video(b"0123456789" * 10)
+    client = TestClient(DBStatsMiddleware(app, expose_headers=True))
+
+    url = player_source(client.get(f"/play/{video.share_token}").text)
+    assert url.startswith("/videos/signed/")
+
+    resp = client.get(url, headers={"Range": "bytes=10-19"})
+    assert resp.status_code == 206
+    assert resp.content == b"0123456789"
+    assert resp.headers["x-db-queries"] == "0"
+    assert resp.headers["x-db-sessions"] == "0"
+    assert video.filename in resp.headers["content-disposition"]
+
+
+def test_tampered_or_expired_url_rejected(signed_config):
+    shared = SharedFile(1, "blobs/ab/abcdef", "clip.mp4", "video/mp4", "")
+    token = sign_playback_url(signed_config, shared).rsplit("/", 1)[1]
+    scope, sealed = token.split(".")
+
+    assert verify_playback_token(signed_config, token, "10.0.0.1")["p"] == "blobs/ab/abcdef"
+    # The storage path is not readable from the URL
+    assert "abcdef" not in token
+    forged = sign_playback_url(signed_config.replace(playback_url_secret="guess"), shared).rsplit("/", 1)[1]
+    flipped = sealed[:-2] + ("AA" if not sealed.endswith("AA") else "BB")
+    for bad in (forged, f"{scope}.{flipped}", "garbage", f"c.{sealed}", f"x.{sealed}"):
+        with pytest.raises(Exception) as excinfo:
+            verify_playback_token(signed_config, bad, "10.0.0.1")
+        assert excinfo.value.status_code == 403
+
+    expired = sign_playback_url(signed_config, shared, now=0).rsplit("/", 1)[1]
+    with pytest.raises(Exception) as excinfo:
+        verify_playback_token(signed_config, expired, "10.0.0.1")
+    assert excinfo.value.detail == "Playback URL expired"
+
+
+def test_valid_token_with_other_claims_rejected(app_client, signed_config):
+    # Sealed with the right secret, but not a playback token (e.g. another token format)
+    other = seal_token(signed_config.playback_url_secret, {"u": "upload-id", "k": "key", "e": 2 ** 40})
+
+    assert app_client.get(f"/videos/signed/a.{other}").status_code == 403
+
+
+def test_client_bound_url_only_works_from_that_address(app_client, nas_config, make_video):
+    config = nas_config.replace(playback_url_secret="s3cret", playback_url_bind_client=True)
+    app.dependency_overrides[get_config] = lambda: config
+    video = make_video()
+
+    url = player_source(app_client.get(f"/play/{video.share_token}", headers={"X-Real-IP": "10.0.0.1"}).text)
+
+    assert app_client.get(url, headers={"X-Real-IP": "10.0.0.1"}).status_code == 200
+    assert app_client.get(url, headers={"X-Real-IP": "10.0.0.2"}).status_code == 403
+    # Pages are per viewer, so another viewer gets a URL of their own
+    other = player_source(app_client.get(f"/play/{video.share_token}", headers={"X-Real-IP": "10.0.0.2"}).text)
+    assert app_client.get(other, headers={"X-Real-IP": "10.0.0.2"}).status_code == 200
+
+
+def test_signed_urls_disabled_without_secret(app_client, make_video):
+    video = make_video()
+    page_cache.invalidate()
+
+    assert player_source(app_client.get(f"/play/{video.share_token}").text) == f"/videos/{video.share_token}"
+    assert app_client.get("/videos/signed/anything.at-all").status_code == 404
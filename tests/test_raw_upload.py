@@ -0,0 +1,137 @@
+"""
+Tests for the raw-body upload protocol: offset-based PATCH, HEAD for resume, and the client mode.
+"""
+
+import hashlib
+import os
+
+import pytest
+from sqlalchemy.future import select
+from starlette.requests import ClientDisconnect
+
+import upload_client
+from app.models import Video
+from app.core.assembly import assemble_chunks
+from app.core.raw_upload import append_body, raw_uploads
+from tests.test_integrity import fetch, post_chunk
+
+
+def create(app_client, headers, length):
+    resp = app_client.post("/upload/raw", data={"filename": "clip.mp4", "upload_length": length}, headers=headers)
+    assert resp.status_code == 200
+    return resp.json()
+
+
+def patch(app_client, headers, upload_url, offset, data, content_type="application/offset+octet-stream"):
+    return app_client.patch(upload_url, content=data, headers={
+        **headers, "content-type": content_type, "upload-offset": str(offset)
+    })
+
+
+def test_raw_upload_resumes_at_server_offset(app_client, signed_headers, inline_assembly):
+    data = os.urandom(5000)
+    upload = create(app_client, signed_headers, len(data))
+    url = upload["upload_url"]
+    headers = {"authorization": f"Bearer {upload['upload_token']}"}
+
+    first = patch(app_client, headers, url, 0, data[:2000])
+    assert first.status_code == 204
+    assert first.headers["upload-offset"] == "2000"
+    head = app_client.head(url, headers=headers)
+    assert (head.headers["upload-offset"], head.headers["upload-length"]) == ("2000", "5000")
+
+    stale = patch(app_client, headers, url, 1000, data[1000:])
+    assert stale.status_code == 409
+    assert stale.headers["upload-offset"] == "2000"
+    assert patch(app_client, headers, url, 2000, data[2000:] + b"extra").status_code == 413
+    assert app_client.head(url, headers=headers).headers["upload-offset"] == "2000"
+    assert patch(app_client, headers, url, 2000, data[2000:]).status_code == 204
+
+    job = app_client.post("/upload/complete", data={"upload_id": upload["upload_id"]}, headers=headers).json()
+    assert job["status"] == "done"
+    assert app_client.get(job["video_link"]).content == data
+    # The content digest, as for a multipart upload of the same file
+    [digest] = fetch(app_client, select(Video.digest).where(Video.share_token == job["share_token"]))
+    assert digest == hashlib.sha256(data).hexdigest()
+
+
+def test_digest_read_back_when_running_hash_is_lost(app_client, signed_headers, inline_assembly):
+    data = os.urandom(3000)
+    upload = create(app_client, signed_headers, len(data))
+    patch(app_client, signed_headers, upload["upload_url"], 0, data[:1000])
+    # e.g. the next PATCH is served by another worker
+    raw_uploads.forget(upload["upload_id"])
+    patch(app_client, signed_headers, upload["upload_url"], 1000, data[1000:])
+
+    job = app_client.post("/upload/complete", data={"upload_id": upload["upload_id"]}, headers=signed_headers).json()
+    [digest] = fetch(app_client, select(Video.digest).where(Video.share_token == job["share_token"]))
+    assert digest == hashlib.sha256(data).hexdigest()
+
+
+def test_raw_upload_rejects_other_uploads_and_bodies(app_client, signed_headers):
+    first, second = create(app_client, signed_headers, 10), create(app_client, signed_headers, 10)
+    token = {"authorization": f"Bearer {first['upload_token']}"}
+
+    assert patch(app_client, token, second["upload_url"], 0, b"0123456789").status_code == 403
+    assert patch(app_client, token, first["upload_url"], 0, b"0123456789", "multipart/form-data").status_code == 415
+    assert app_client.head("/upload/raw/missing", headers=signed_headers).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_interrupted_patch_keeps_received_bytes(tmp_path):
+    path = str(tmp_path / "upload.part")
+
+    class Request:
+        async def stream(self):
+            yield b"a" * 100
+            yield b"b" * 100
+            raise ClientDisconnect()
+
+    writer = await append_body(Request(), path, 0, 1000, hashlib.sha256())
+
+    assert writer.bytes_written == 200
+    assert os.path.getsize(path) == 200
+    assert writer.digest == hashlib.sha256(b"a" * 100 + b"b" * 100).hexdigest()
+
+
+def test_single_chunk_assembled_by_hard_link(tmp_path):
+    chunk = tmp_path / "upload_1.part"
+    chunk.write_bytes(b"whole file")
+
+    size = assemble_chunks([str(chunk)], str(tmp_path / "video.mp4"), remove_chunks=False)
+
+    assert size == 10
+    assert os.stat(chunk).st_ino == os.stat(tmp_path / "video.mp4").st_ino
+
+
+def test_client_raw_mode(app_client, client_keys, inline_assembly, tmp_path, monkeypatch):
+    keys_dir, key_id = client_keys
+    data = os.urandom(10 * 1024 + 7)
+    source = tmp_path / "clip.mp4"
+    source.write_bytes(data)
+    patched = []
+    real_patch = app_client.patch
+    monkeypatch.setattr(app_client, "patch", lambda url, **kw: patched.append(kw["headers"]["upload-offset"]) or real_patch(url, **kw))
+
+    job = upload_client.upload_file_raw("http://testserver", keys_dir, str(source), key_id,
+                                        patch_size=4096, session=app_client)
+
+    assert patched == ["0", "4096", "8192"]
+    assert app_client.get(job["video_link"]).content == data
+
+
+def test_raw_and_chunked_sessions_do_not_mix(app_client, signed_headers):
+    data = b"0123456789"
+    raw = create(app_client, signed_headers, len(data))
+    assert patch(app_client, signed_headers, raw["upload_url"], 0, data[:4]).status_code == 204
+    digest = hashlib.sha256(b"overwrite").hexdigest()
+
+    for headers in (signed_headers, {"authorization": f"Bearer {raw['upload_token']}"}):
+        assert post_chunk(app_client, headers, raw["upload_id"], 1, 1, b"overwrite", digest).status_code == 409
+    assert app_client.get(f"/upload/chunks/{raw['upload_id']}", headers=signed_headers).status_code == 409
+    # The PATCHed bytes are untouched
+    assert app_client.head(raw["upload_url"], headers=signed_headers).headers["upload-offset"] == "4"
+
+    chunked = app_client.post("/upload/initiate", data={"filename": "clip.mp4", "total_chunks": 1},
+                              headers=signed_headers).json()
+    assert patch(app_client, signed_headers, f"/upload/raw/{chunked['upload_id']}", 0, data).status_code == 409
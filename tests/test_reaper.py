@@ -0,0 +1,122 @@
+"""
+Tests for the background reaper of abandoned chunk uploads.
+"""
+
+import asyncio
+import os
+import time
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+
+from app.models import AssemblyJob, ChunkUpload, init_db
+from app.core.assembly import chunk_file_path
+from app.core.reaper import RateLimiter, UploadReaper
+
+
+@pytest.fixture
+def reaper_env(test_engine, nas_config):
+    session_factory = sessionmaker(bind=test_engine, class_=AsyncSession, expire_on_commit=False)
+    config = nas_config.replace(upload_ttl=3600, reaper_batch_size=2, reaper_files_per_second=0)
+    return session_factory, config
+
+
+async def add_upload(session_factory, config, upload_id, age, total_chunks=2):
+    created_at = datetime.utcnow() - timedelta(seconds=age)
+    async with session_factory() as session:
+        session.add_all([
+            ChunkUpload(upload_id=upload_id, filename="clip.mp4", chunk_number=n, total_chunks=total_chunks,
+                        received=True, created_at=created_at, uploader_key_id="reaper_key")
+            for n in range(1, total_chunks + 1)
+        ])
+        await session.commit()
+    paths = [chunk_file_path(config.chunks_dir, upload_id, n) for n in range(1, total_chunks + 1)]
+    for path in paths:
+        with open(path, "wb") as f:
+            f.write(b"x" * 100)
+    return paths
+
+
+async def upload_ids(session_factory):
+    async with session_factory() as session:
+        result = await session.execute(select(ChunkUpload.upload_id).distinct())
+        return set(result.scalars().all())
+
+
+def age_file(path, seconds):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+@pytest.mark.asyncio
+async def test_expires_only_stale_inactive_sessions(reaper_env):
+    session_factory, config = reaper_env
+    stale = [await add_upload(session_factory, config, f"stale-{i}", age=7200) for i in range(5)]
+    fresh = await add_upload(session_factory, config, "fresh", age=60)
+    assembling = await add_upload(session_factory, config, "assembling", age=7200)
+    async with session_factory() as session:
+        session.add(AssemblyJob(job_id="job-1", upload_id="assembling", filename="clip.mp4",
+                                total_chunks=2, status="assembling", uploader_key_id="reaper_key"))
+        await session.commit()
+
+    stats = await UploadReaper(session_factory, config).run_once()
+
+    assert await upload_ids(session_factory) == {"fresh", "assembling"}
+    assert not any(os.path.exists(p) for paths in stale for p in paths)
+    assert all(os.path.exists(p) for p in fresh + assembling)
+    assert stats["uploads_expired"] == 5
+    assert stats["rows_deleted"] == 10
+    assert stats["files_removed"] == 10
+    assert stats["bytes_freed"] == 1000
+
+
+@pytest.mark.asyncio
+async def test_removes_old_orphaned_files(reaper_env):
+    session_factory, config = reaper_env
+    live = await add_upload(session_factory, config, "live", age=60)
+    orphan = chunk_file_path(config.chunks_dir, "gone", 1)
+    young_orphan = chunk_file_path(config.chunks_dir, "gone", 2)
+    incoming = os.path.join(config.chunks_dir, ".incoming-1234")
+    for path in (orphan, young_orphan, incoming):
+        with open(path, "wb") as f:
+            f.write(b"y" * 10)
+    for path in live + [orphan, incoming]:
+        age_file(path, 7200)
+
+    stats = await UploadReaper(session_factory, config).run_once()
+
+    assert stats["orphans_removed"] == 2
+    assert not os.path.exists(orphan) and not os.path.exists(incoming)
+    assert os.path.exists(young_orphan)
+    assert all(os.path.exists(p) for p in live)
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_spaces_operations():
+    limiter = RateLimiter(100)
+    started = time.monotonic()
+    for _ in range(6):
+        await limiter.wait()
+    assert time.monotonic() - started >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_background_task_runs_on_interval(nas_config, tmp_path):
+    # Own file database: stopping the task may cancel it mid-query, which would
+    # discard the connection holding the shared in-memory test database
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/reaper.sqlite3")
+    await init_db(engine)
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    reaper = UploadReaper(session_factory, nas_config.replace(reaper_interval=0))
+    reaper.start()
+    try:
+        for _ in range(100):
+            if reaper.stats.runs:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await reaper.stop()
+        await engine.dispose()
+    assert reaper.stats.runs >= 1
@@ -0,0 +1,121 @@
+"""
+Tests for the share token resolution cache behind /videos and /play.
+"""
+
+import asyncio
+import os
+
+import pytest
+from sqlalchemy.future import select
+
+from app.models import Video
+from app.core.share_cache import NOT_FOUND, ShareCache, SharedFile, share_cache
+from tests.test_transcode import add_video, run_job
+
+
+def test_range_requests_resolve_token_once(stats_client, make_video):
+    video = make_video(b"0123456789" * 100)
+    url = f"/videos/{video.share_token}"
+    hits = share_cache.stats()["hits"]
+
+    first = stats_client.get(url, headers={"Range": "bytes=0-99"})
+    assert first.status_code == 206
+    assert first.headers["x-db-queries"] == "1"
+
+    for start in range(100, 1000, 100):
+        resp = stats_client.get(url, headers={"Range": f"bytes={start}-{start + 99}"})
+        assert resp.status_code == 206
+        assert resp.content == (b"0123456789" * 10)
+        assert resp.headers["x-db-queries"] == "0"
+        assert resp.headers["etag"] == first.headers["etag"]
+
+    # The original is a separate entry
+    assert stats_client.get(f"{url}?original=1").headers["x-db-queries"] == "1"
+    assert share_cache.stats()["hits"] - hits == 9
+
+
+def test_unknown_token_cached_negatively(stats_client):
+    negative_hits = share_cache.stats()["negative_hits"]
+    first = stats_client.get("/videos/not-a-token")
+    second = stats_client.get("/videos/not-a-token")
+    page = stats_client.get("/play/not-a-token")
+
+    assert first.status_code == second.status_code == page.status_code == 404
+    assert first.headers["x-db-queries"] == "1"
+    assert second.headers["x-db-queries"] == "0"
+    assert page.headers["x-db-queries"] == "0"
+    assert share_cache.stats()["negative_hits"] - negative_hits == 2
+
+
+def test_play_page_warms_the_cache(stats_client, make_video):
+    video = make_video()
+
+    assert stats_client.get(f"/play/{video.share_token}").status_code == 200
+
+    assert stats_client.get(f"/videos/{video.share_token}").headers["x-db-queries"] == "0"
+
+
+def test_deleted_video_is_dropped(app_client, stats_client, make_video, signed_headers, signing_key):
+    video = make_video()
+
+    async def own():
+        async with app_client.session_factory() as session:
+            row = (await session.execute(select(Video).where(Video.id == video.id))).scalar_one()
+            row.uploader_key_id = signing_key[0]
+            await session.commit()
+
+    asyncio.run(own())
+    assert stats_client.get(f"/videos/{video.share_token}").status_code == 200
+    assert app_client.delete(f"/videos/{video.share_token}", headers=signed_headers).status_code == 200
+
+    assert stats_client.get(f"/videos/{video.share_token}").status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_finished_transcode_drops_token(transcode_env, stub_ffmpeg):
+    session_factory, config = transcode_env
+    video = await add_video(session_factory, config)
+    share_cache.put(video.share_token, False, config.version, SharedFile(video.id, video.filename, video.filename, None, ""))
+
+    await run_job(session_factory, config, video)
+
+    assert share_cache.get(video.share_token, False, config.version) is None
+
+
+def test_share_cache_bounded_and_expiring(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("app.core.ttl_cache.time.monotonic", lambda: now[0])
+    cache = ShareCache(max_size=2, ttl=60, negative_ttl=10)
+    found = SharedFile(1, "a.mp4", "a.mp4", "video/mp4", "/nas/a.mp4")
+
+    cache.put("a", False, "v1", found)
+    cache.put("b", False, "v1", NOT_FOUND)
+    assert cache.get("a", False, "v1") is found
+    assert cache.get("a", False, "v2") is None  # resolved under an older config
+    cache.put("a", False, "v1", found)
+    cache.put("c", False, "v1", found)
+    assert cache.get("b", False, "v1") is None  # least recently used
+
+    cache.put("d", False, "v1", NOT_FOUND)
+    now[0] = 11
+    assert cache.get("d", False, "v1") is None
+    assert cache.get("c", False, "v1") is found
+    assert cache.stats()["hit_rate"] == pytest.approx(2 / 5)
+
+
+def test_cached_file_deleted_or_replaced_on_disk(stats_client, nas_config, make_video):
+    """Headers come from the opened file, not the cached stat."""
+    video = make_video(b"0123456789")
+    url = f"/videos/{video.share_token}"
+    assert stats_client.get(url).content == b"0123456789"
+    path = os.path.join(nas_config.videos_dir, video.filename)
+
+    with open(path, "wb") as f:
+        f.write(b"longer replacement")
+    resp = stats_client.get(url)
+    assert resp.headers["x-db-queries"] == "0"
+    assert resp.content == b"longer replacement"
+    assert resp.headers["content-length"] == "18"
+
+    os.remove(path)
+    assert stats_client.get(url).status_code == 404
@@ -0,0 +1,62 @@
+"""
+Tests for the library maintenance that runs in the background after startup.
+"""
+
+import asyncio
+import contextlib
+
+import pytest
+
+from app import startup
+
+
+@pytest.fixture
+def maintenance_steps(monkeypatch):
+    calls = []
+
+    @contextlib.asynccontextmanager
+    async def session_factory():
+        yield None
+
+    monkeypatch.setattr(startup, "AsyncSessionLocal", session_factory)
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_failing_step_does_not_stop_the_next(maintenance_steps, monkeypatch):
+    async def broken_gc(session, config):
+        raise OSError("NAS went away")
+
+    async def backfill(session, config):
+        maintenance_steps.append("backfill")
+
+    monkeypatch.setattr(startup, "collect_garbage", broken_gc)
+    monkeypatch.setattr(startup, "backfill_media_info", backfill)
+
+    await startup.library_maintenance()
+
+    assert maintenance_steps == ["backfill"]
+
+
+@pytest.mark.asyncio
+async def test_maintenance_runs_in_the_background(maintenance_steps, monkeypatch):
+    release = asyncio.Event()
+
+    async def slow_gc(session, config):
+        maintenance_steps.append("gc")
+        await release.wait()
+
+    async def backfill(session, config):
+        maintenance_steps.append("backfill")
+
+    monkeypatch.setattr(startup, "collect_garbage", slow_gc)
+    monkeypatch.setattr(startup, "backfill_media_info", backfill)
+
+    startup.start_library_maintenance()
+    await asyncio.sleep(0)
+    # Still scanning, and start_library_maintenance has already returned
+    assert maintenance_steps == ["gc"]
+    await startup.stop_library_maintenance()
+
+    assert maintenance_steps == ["gc"]
+    assert startup._maintenance_task is None
@@ -0,0 +1,110 @@
+"""
+Tests for the video streaming response.
+"""
+
+import os
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.core.streaming import RangeNotSatisfiable, VideoStreamResponse, parse_range_header
+
+
+@pytest.fixture
+def video(tmp_path):
+    data = os.urandom(100_000)
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(data)
+    return str(path), data
+
+
+@pytest.fixture
+def client(video):
+    path, _ = video
+    app = Starlette(routes=[
+        Route("/video", lambda request: VideoStreamResponse(path, filename="clip.mp4"), methods=["GET", "HEAD"])
+    ])
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("header,expected", [
+    ("bytes=0-99", [(0, 100)]),
+    ("bytes=99000-", [(99000, 100_000)]),
+    ("bytes=-500", [(99500, 100_000)]),
+    ("bytes=-200000", [(0, 100_000)]),
+    ("bytes=0-10,5-20,50-60", [(0, 21), (50, 61)]),
+    ("bytes=90000-200000", [(90000, 100_000)]),
+    ("items=0-10", []),
+    ("bytes=10-5", []),
+    ("bytes=abc", []),
+])
+def test_parse_range_header(header, expected):
+    """Single, open-ended, suffix and overlapping ranges parse and merge."""
+    assert parse_range_header(header, 100_000) == expected
+
+
+def test_parse_range_header_unsatisfiable():
+    """Ranges entirely past the end of the file are unsatisfiable."""
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range_header("bytes=100000-", 100_000)
+
+
+def test_full_response_has_validators(client, video):
+    """A plain GET returns the whole file with a strong ETag and Last-Modified."""
+    _, data = video
+    resp = client.get("/video")
+    assert resp.status_code == 200
+    assert resp.content == data
+    assert resp.headers["content-type"] == "video/mp4"
+    assert resp.headers["accept-ranges"] == "bytes"
+    assert resp.headers["etag"].startswith('"') and "last-modified" in resp.headers
+
+
+def test_single_range(client, video):
+    """A single range returns 206 with the matching bytes and Content-Range."""
+    _, data = video
+    resp = client.get("/video", headers={"Range": "bytes=-1000"})
+    assert resp.status_code == 206
+    assert resp.headers["content-range"] == "bytes 99000-99999/100000"
+    assert resp.content == data[-1000:]
+
+
+def test_multi_range(client, video):
+    """Several ranges come back as multipart/byteranges."""
+    _, data = video
+    resp = client.get("/video", headers={"Range": "bytes=0-9,200-209"})
+    assert resp.status_code == 206
+    assert resp.headers["content-type"].startswith("multipart/byteranges; boundary=")
+    assert int(resp.headers["content-length"]) == len(resp.content)
+    assert data[0:10] in resp.content and data[200:210] in resp.content
+    assert b"Content-Range: bytes 200-209/100000" in resp.content
+
+
+def test_unsatisfiable_range(client):
+    """A range past the end of the file is a 416 with the file size."""
+    resp = client.get("/video", headers={"Range": "bytes=500000-"})
+    assert resp.status_code == 416
+    assert resp.headers["content-range"] == "bytes */100000"
+
+
+def test_conditional_requests(client):
+    """Matching validators produce 304; a stale If-Range falls back to the full file."""
+    first = client.get("/video")
+    etag, last_modified = first.headers["etag"], first.headers["last-modified"]
+
+    assert client.get("/video", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/video", headers={"If-Modified-Since": last_modified}).status_code == 304
+
+    resp = client.get("/video", headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert resp.status_code == 206
+    resp = client.get("/video", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert resp.status_code == 200 and len(resp.content) == 100_000
+
+
+def test_head(client):
+    """HEAD returns headers only."""
+    resp = client.head("/video")
+    assert resp.status_code == 200
+    assert resp.headers["content-length"] == "100000"
+    assert resp.content == b""
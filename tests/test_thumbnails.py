@@ -0,0 +1,185 @@
+"""
+Tests for poster/sprite generation and the LRU thumbnail cache.
+"""
+
+import asyncio
+import json
+import os
+import uuid
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+
+from app.main import app
+from app.models import TranscodeJob, Video
+from app.core import thumbnails
+from app.core.config import get_config
+from app.core.thumbnails import (
+    POSTER, SPRITE, SPRITE_VTT, ThumbnailCache, get_thumbnail_cache, sprite_layout, sprite_vtt, thumbnail_name
+)
+from app.core.transcode import TranscodeQueue, get_transcode_queue
+from tests.conftest import STUB_FFPROBE, stub
+
+# Writes the ffmpeg arguments as the "image", so tests can see which command made which file
+STUB_FFMPEG = """#!{python}
+import sys
+with open(sys.argv[-1], "w") as f:
+    f.write(" ".join(sys.argv[1:]))
+"""
+
+
+@pytest.fixture
+def thumbnail_config(nas_config, tmp_path):
+    probe = json.dumps({
+        "streams": [{"codec_type": "video", "width": 1920, "height": 1080}],
+        "format": {"duration": "250.0"},
+    })
+    return nas_config.replace(
+        transcode_workers=1,
+        ffmpeg_path=stub(tmp_path / "ffmpeg", STUB_FFMPEG),
+        ffprobe_path=stub(tmp_path / "ffprobe", STUB_FFPROBE, probe=probe),
+    )
+
+
+def fill(tmp_path, name, size):
+    path = tmp_path / f".{name}"
+    path.write_bytes(b"x" * size)
+    return str(path)
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = ThumbnailCache(str(tmp_path / "cache"), max_bytes=250)
+    cache.store("a", fill(tmp_path, "a", 100))
+    cache.store("b", fill(tmp_path, "b", 100))
+    assert cache.lookup("a") is not None  # a is now more recent than b
+
+    cache.store("c", fill(tmp_path, "c", 100))
+
+    assert sorted(os.listdir(cache.directory)) == ["a", "c"]
+    assert cache.lookup("b") is None
+    assert cache.stats()["bytes"] == 200
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_order_survives_restart(tmp_path):
+    cache = ThumbnailCache(str(tmp_path / "cache"), max_bytes=250)
+    cache.store("a", fill(tmp_path, "a", 100))
+    cache.store("b", fill(tmp_path, "b", 100))
+    os.utime(cache.path("b"), ns=(1, os.stat(cache.path("b")).st_mtime_ns))  # b used long ago
+    mtime = os.stat(cache.path("a")).st_mtime_ns
+
+    restarted = ThumbnailCache(cache.directory, max_bytes=250)
+    assert restarted.lookup("a").st_mtime_ns == mtime  # marking as used keeps the ETag stable
+    restarted.store("c", fill(tmp_path, "c", 100))
+
+    assert sorted(os.listdir(cache.directory)) == ["a", "c"]
+
+
+def test_cache_hit_touches_file_only_when_atime_is_stale(tmp_path, monkeypatch):
+    cache = ThumbnailCache(str(tmp_path / "cache"), max_bytes=250)
+    cache.store("a", fill(tmp_path, "a", 100))
+    touched = []
+    real_utime = os.utime
+    monkeypatch.setattr(thumbnails.os, "utime", lambda path, **kw: touched.append(path) or real_utime(path, **kw))
+
+    cache.lookup("a")
+    assert touched == []  # just stored, so its atime is recent
+
+    real_utime(cache.path("a"), ns=(1, os.stat(cache.path("a")).st_mtime_ns))
+    cache.lookup("a")
+    cache.lookup("a")
+    assert touched == [cache.path("a")]
+
+
+def test_sprite_layout_and_vtt():
+    layout = sprite_layout({"width": 1920, "height": 1080, "duration": 250.0})
+    assert (layout["count"], layout["columns"], layout["rows"]) == (100, 10, 10)
+    assert (layout["width"], layout["height"], layout["interval"]) == (160, 90, 2.5)
+
+    short = sprite_layout({"width": 1080, "height": 1920, "duration": 4.5})
+    assert (short["count"], short["columns"], short["rows"], short["height"]) == (5, 5, 1, 284)
+
+    cues = sprite_vtt(layout, 250.0).split("\n\n")
+    assert cues[1] == "00:00:00.000 --> 00:00:02.500\nsprite.jpg#xywh=0,0,160,90"
+    assert cues[12] == "00:00:27.500 --> 00:00:30.000\nsprite.jpg#xywh=160,90,160,90"
+
+
+@pytest.mark.asyncio
+async def test_thumbnails_job_fills_cache(test_engine, thumbnail_config, tmp_path):
+    session_factory = sessionmaker(bind=test_engine, class_=AsyncSession, expire_on_commit=False)
+    video = Video(filename=f"clip_{uuid.uuid4().hex[:8]}.mp4", file_size=3, share_token=str(uuid.uuid4()))
+    async with session_factory() as session:
+        session.add(video)
+        await session.commit()
+    with open(os.path.join(thumbnail_config.videos_dir, video.filename), "wb") as f:
+        f.write(b"raw")
+    cache = ThumbnailCache(thumbnail_config.thumbnails_dir, thumbnail_config.thumbnail_cache_bytes)
+    queue = TranscodeQueue(session_factory, thumbnail_config, thumbnail_cache=cache)
+
+    async with session_factory() as session:
+        [job] = await queue.enqueue(session, video.id, ["thumbnails"])
+    await asyncio.gather(*queue._tasks)
+
+    async with session_factory() as session:
+        job = (await session.execute(select(TranscodeJob).where(TranscodeJob.job_id == job.job_id))).scalar_one()
+        video = (await session.execute(select(Video).where(Video.id == video.id))).scalar_one()
+    assert job.status == "done"
+    assert video.transcoded is False
+    assert sorted(os.listdir(cache.directory)) == sorted(thumbnail_name(video.id, n) for n in (POSTER, SPRITE, SPRITE_VTT))
+    with open(cache.path(thumbnail_name(video.id, POSTER))) as f:
+        assert "-ss 10.0" in f.read()
+    with open(cache.path(thumbnail_name(video.id, SPRITE))) as f:
+        assert "tile=10x10" in f.read()
+
+
+@pytest.fixture
+def thumbnail_cache(app_client, nas_config):
+    cache = ThumbnailCache(nas_config.thumbnails_dir, nas_config.thumbnail_cache_bytes)
+    app.dependency_overrides[get_thumbnail_cache] = lambda: cache
+    return cache
+
+
+def test_poster_served_with_etag(app_client, make_video, thumbnail_cache, transcode_queue, tmp_path):
+    video = make_video()
+    thumbnail_cache.store(thumbnail_name(video.id, POSTER), fill(tmp_path, "poster", 1234))
+
+    resp = app_client.get(f"/videos/{video.share_token}/poster.jpg")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "image/jpeg"
+    assert resp.headers["cache-control"] == "public, max-age=86400"
+    assert len(resp.content) == 1234
+
+    again = app_client.get(f"/videos/{video.share_token}/poster.jpg", headers={"If-None-Match": resp.headers["etag"]})
+    assert again.status_code == 304
+    assert app_client.get(f"/videos/{video.share_token}/movie.jpg").status_code == 404
+
+
+def test_missing_poster_queued_again(app_client, nas_config, make_video, thumbnail_cache):
+    queue = TranscodeQueue(app_client.session_factory, nas_config.replace(transcode_workers=1))
+    queue.schedule = lambda job_id: None  # only the bookkeeping is under test
+    app.dependency_overrides[get_transcode_queue] = lambda: queue
+    video = make_video()
+
+    for _ in range(2):
+        assert app_client.get(f"/videos/{video.share_token}/poster.jpg").status_code == 404
+
+    async def jobs():
+        async with app_client.session_factory() as session:
+            result = await session.execute(select(TranscodeJob.kind).where(TranscodeJob.video_id == video.id))
+            return result.scalars().all()
+
+    assert asyncio.run(jobs()) == ["thumbnails"]
+
+
+def test_player_uses_poster_instead_of_preloading(app_client, nas_config, make_video):
+    video = make_video()
+    # Transcoding (and so thumbnail generation) is off in nas_config
+    page = app_client.get(f"/play/{video.share_token}").text
+    assert "poster=" not in page and "autoplay" in page
+
+    app.dependency_overrides[get_config] = lambda: nas_config.replace(transcode_workers=1)
+    page = app_client.get(f"/play/{video.share_token}").text
+    assert f'poster="/videos/{video.share_token}/poster.jpg" preload="none"' in page
+    assert f'src="/videos/{video.share_token}/sprite.vtt"' in page
+    assert "autoplay" not in page
@@ -0,0 +1,174 @@
+"""
+Tests for the transcoding queue, using a stub ffmpeg executable.
+"""
+
+import asyncio
+import os
+import uuid
+import pytest
+from sqlalchemy.future import select
+
+from app.models import Blob, TranscodeJob, Video
+from app.core.transcode import TranscodeQueue, transcoded_name
+
+
+async def add_video(session_factory, config, data=b"raw hevc"):
+    # test_engine is shared by the whole session, so rows need unique keys
+    video = Video(filename=f"phone_{uuid.uuid4().hex[:8]}.mov", file_size=len(data),
+                  share_token=str(uuid.uuid4()), transcoded=False)
+    async with session_factory() as session:
+        session.add(video)
+        await session.commit()
+    with open(os.path.join(config.videos_dir, video.filename), "wb") as f:
+        f.write(data)
+    return video
+
+
+async def run_job(session_factory, config, video):
+    queue = TranscodeQueue(session_factory, config)
+    async with session_factory() as session:
+        [job] = await queue.enqueue(session, video.id)
+    await asyncio.gather(*queue._tasks)
+    async with session_factory() as session:
+        job = (await session.execute(select(TranscodeJob).where(TranscodeJob.job_id == job.job_id))).scalar_one()
+        video = (await session.execute(select(Video).where(Video.id == video.id))).scalar_one()
+    return job, video
+
+
+@pytest.mark.asyncio
+async def test_transcode_marks_video_transcoded(transcode_env, stub_ffmpeg):
+    session_factory, config = transcode_env
+    video = await add_video(session_factory, config)
+
+    job, video = await run_job(session_factory, config, video)
+
+    assert job.status == "done"
+    assert video.transcoded is True
+    with open(os.path.join(config.videos_dir, transcoded_name(video)), "rb") as f:
+        assert f.read() == b"H264:raw hevc"
+    args = (stub_ffmpeg.parent / "ffmpeg-args.txt").read_text().split("\n")
+    assert args[args.index("-c:v") + 1] == "libx264"
+    assert args[args.index("-c:a") + 1] == "aac"
+    assert args[args.index("-movflags") + 1] == "+faststart"
+
+
+@pytest.mark.asyncio
+async def test_failed_transcode_keeps_original(transcode_env, stub_ffmpeg):
+    session_factory, config = transcode_env
+    video = await add_video(session_factory, config)
+    (stub_ffmpeg.parent / "fail").touch()
+
+    job, video = await run_job(session_factory, config, video)
+
+    assert job.status == "failed"
+    assert "Invalid data found" in job.error
+    assert video.transcoded is False
+    assert os.listdir(os.path.join(config.videos_dir, "transcoded")) == []
+
+
+@pytest.mark.asyncio
+async def test_error_before_the_work_fails_the_job(transcode_env, monkeypatch):
+    session_factory, config = transcode_env
+    video = await add_video(session_factory, config)
+
+    def broken_outputs(queue, kind, video):
+        raise OSError("NAS went away")
+
+    monkeypatch.setattr(TranscodeQueue, "_outputs", broken_outputs)
+    job, video = await run_job(session_factory, config, video)
+
+    assert (job.status, job.error) == ("failed", "NAS went away")
+    assert video.transcoded is False
+
+
+@pytest.mark.asyncio
+async def test_video_deleted_during_transcode(transcode_env, monkeypatch):
+    session_factory, config = transcode_env
+    video = await add_video(session_factory, config)
+    real_ffmpeg = TranscodeQueue._ffmpeg
+
+    async def ffmpeg_then_delete(queue, source, target):
+        await real_ffmpeg(queue, source, target)
+        async with session_factory() as session:
+            await session.delete(await session.get(Video, video.id))
+            await session.commit()
+
+    monkeypatch.setattr(TranscodeQueue, "_ffmpeg", ffmpeg_then_delete)
+    queue = TranscodeQueue(session_factory, config)
+    async with session_factory() as session:
+        [job] = await queue.enqueue(session, video.id)
+    await asyncio.gather(*queue._tasks)
+
+    async with session_factory() as session:
+        job = (await session.execute(select(TranscodeJob).where(TranscodeJob.job_id == job.job_id))).scalar_one()
+        # test_engine is shared and SQLite reuses the deleted video's id
+        await session.delete(job)
+        await session.commit()
+    assert (job.status, job.error) == ("failed", "Video was deleted")
+    assert not os.path.exists(os.path.join(config.videos_dir, transcoded_name(video)))
+
+
+@pytest.mark.asyncio
+async def test_rendition_shared_by_videos_of_one_blob(transcode_env, stub_ffmpeg):
+    session_factory, config = transcode_env
+    digest = uuid.uuid4().hex
+    async with session_factory() as session:
+        blob = Blob(digest=digest, file_size=8, ref_count=2)
+        session.add(blob)
+        await session.commit()
+        videos = [Video(filename=f"clip_{uuid.uuid4().hex[:8]}.mov", file_size=8, share_token=str(uuid.uuid4()), transcoded=False,
+                        digest=digest, blob_id=blob.id) for _ in range(2)]
+        session.add_all(videos)
+        await session.commit()
+    os.makedirs(os.path.join(config.videos_dir, "blobs", digest[:2]))
+    with open(os.path.join(config.videos_dir, "blobs", digest[:2], digest), "wb") as f:
+        f.write(b"raw hevc")
+
+    first_job, first = await run_job(session_factory, config, videos[0])
+    (stub_ffmpeg.parent / "ffmpeg-args.txt").unlink()
+    second_job, second = await run_job(session_factory, config, videos[1])
+
+    assert first_job.status == second_job.status == "done"
+    assert first.transcoded and second.transcoded
+    assert transcoded_name(first) == transcoded_name(second)
+    # The second video reuses the rendition without running ffmpeg
+    assert not (stub_ffmpeg.parent / "ffmpeg-args.txt").exists()
+
+
+@pytest.mark.asyncio
+async def test_disabled_queue_creates_no_jobs(transcode_env):
+    session_factory, config = transcode_env
+    queue = TranscodeQueue(session_factory, config.replace(transcode_workers=0))
+    video = await add_video(session_factory, config)
+    async with session_factory() as session:
+        assert await queue.enqueue(session, video.id) == []
+        jobs = await session.execute(select(TranscodeJob).where(TranscodeJob.video_id == video.id))
+        assert jobs.scalars().all() == []
+
+
+def test_share_video_prefers_transcoded_rendition(app_client, nas_config, make_video):
+    video = make_video(b"original bytes", filename="phone.mov")
+
+    async def mark_transcoded():
+        async with app_client.session_factory() as session:
+            row = (await session.execute(select(Video).where(Video.id == video.id))).scalar_one()
+            row.transcoded = True
+            await session.commit()
+
+    asyncio.run(mark_transcoded())
+    target = os.path.join(nas_config.videos_dir, transcoded_name(video))
+    os.makedirs(os.path.dirname(target))
+    with open(target, "wb") as f:
+        f.write(b"web bytes")
+
+    resp = app_client.get(f"/videos/{video.share_token}")
+    assert resp.content == b"web bytes"
+    assert resp.headers["content-type"] == "video/mp4"
+    assert resp.headers["content-disposition"] == 'attachment; filename="phone.mp4"'
+
+    resp = app_client.get(f"/videos/{video.share_token}?original=1")
+    assert resp.content == b"original bytes"
+    assert resp.headers["content-type"] == "video/quicktime"
+
+    page = app_client.get(f"/play/{video.share_token}").text
+    assert f'href="/videos/{video.share_token}?original=1"' in page
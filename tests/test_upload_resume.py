@@ -0,0 +1,104 @@
+"""
+Tests for resumable uploads: the received-chunks endpoint and the parallel client mode.
+"""
+
+import asyncio
+import os
+
+import upload_client
+from app.core.security import add_public_key_to_db
+from tests.test_key_verification import generate_key_pair, key_headers
+
+
+def initiate(app_client, headers, total_chunks):
+    resp = app_client.post("/upload/initiate", data={"filename": "clip.mp4", "total_chunks": total_chunks}, headers=headers)
+    assert resp.status_code == 200
+    return resp.json()["upload_id"]
+
+
+def send_chunk(app_client, headers, upload_id, chunk_number, total_chunks, data):
+    resp = app_client.post("/upload/chunk", data={
+        "upload_id": upload_id, "chunk_number": chunk_number, "total_chunks": total_chunks
+    }, files={"file": ("chunk", data)}, headers=headers)
+    assert resp.status_code == 200
+
+
+def test_received_chunks_lists_stored_chunks(app_client, signed_headers):
+    upload_id = initiate(app_client, signed_headers, 3)
+    send_chunk(app_client, signed_headers, upload_id, 2, 3, b"two")
+
+    resp = app_client.get(f"/upload/chunks/{upload_id}", headers=signed_headers)
+
+    assert resp.status_code == 200
+    progress = resp.json()
+    # A resumed upload gets a fresh upload token
+    assert progress.pop("upload_token")
+    assert progress == {"upload_id": upload_id, "total_chunks": 3, "received": [2]}
+
+
+def test_received_chunks_checks_uploader(app_client, signed_headers):
+    private_key, public_key_pem = generate_key_pair("other_uploader")
+
+    async def add_key():
+        async with app_client.session_factory() as session:
+            await add_public_key_to_db(session, "other_uploader", public_key_pem, domain="test.local")
+
+    asyncio.run(add_key())
+    other_headers = key_headers("other_uploader", "other_uploader", private_key)
+    upload_id = initiate(app_client, other_headers, 2)
+
+    assert app_client.get(f"/upload/chunks/{upload_id}", headers=signed_headers).status_code == 403
+    assert app_client.get("/upload/chunks/missing", headers=signed_headers).status_code == 404
+
+
+def test_parallel_upload_resumes_missing_chunks(app_client, signed_headers, client_keys, inline_assembly,
+                                                nas_config, tmp_path, monkeypatch):
+    keys_dir, key_id = client_keys
+    data = os.urandom(10 * 1024 + 123)
+    source = tmp_path / "clip.mp4"
+    source.write_bytes(data)
+    chunk_size = 1024
+
+    # An earlier run got chunks 1 and 4 through before it was interrupted
+    upload_id = initiate(app_client, signed_headers, 11)
+    for n in (1, 4):
+        send_chunk(app_client, signed_headers, upload_id, n, 11, data[(n - 1) * chunk_size:n * chunk_size])
+
+    posted = []
+    post_chunk = upload_client.post_chunk
+    monkeypatch.setattr(upload_client, "post_chunk", lambda *args, **kw: posted.append(args[3]) or post_chunk(*args, **kw))
+
+    job = upload_client.upload_file_parallel(
+        "http://testserver", keys_dir, str(source), key_id, workers=3,
+        upload_id=upload_id, chunk_size=chunk_size, session=app_client,
+    )
+
+    assert sorted(posted) == [n for n in range(1, 12) if n not in (1, 4)]
+    assert job["status"] == "done"
+    resp = app_client.get(job["video_link"])
+    assert resp.content == data
+    # No temp chunk files next to the source
+    assert sorted(os.listdir(tmp_path)) == sorted(["clip.mp4", "keys", "chunks", "videos", "thumbnails", "test.sqlite3",
+                                                   ".upload_token_secret"])
+
+
+def test_chunk_retried_after_server_error(app_client, signed_headers, client_keys, monkeypatch):
+    keys_dir, key_id = client_keys
+    upload_id = initiate(app_client, signed_headers, 1)
+    responses = iter([503, None])
+    real_post = app_client.post
+
+    def flaky_post(url, **kwargs):
+        status = next(responses)
+        if status:
+            return type("Resp", (), {"status_code": status, "text": "unavailable"})()
+        return real_post(url, **kwargs)
+
+    monkeypatch.setattr(app_client, "post", flaky_post)
+    monkeypatch.setattr(upload_client.time, "sleep", lambda seconds: None)
+
+    upload_client.post_chunk(app_client, "http://testserver", upload_id, 1, 1, b"data",
+                             key_id, upload_client.load_private_key(keys_dir, key_id))
+
+    resp = app_client.get(f"/upload/chunks/{upload_id}", headers=signed_headers)
+    assert resp.json()["received"] == [1]
@@ -0,0 +1,115 @@
+"""
+Tests for upload-scoped bearer tokens used by the chunk and complete calls.
+"""
+
+import asyncio
+import hashlib
+import os
+
+
+import upload_client
+from app.core.config import Config
+from app.core.security import issue_upload_token, remove_public_key_from_db
+from tests.test_integrity import post_chunk
+
+
+def initiate(app_client, headers, total_chunks):
+    resp = app_client.post("/upload/initiate", data={"filename": "clip.mp4", "total_chunks": total_chunks}, headers=headers)
+    assert resp.status_code == 200
+    return resp.json()
+
+
+def bearer(token):
+    return {"authorization": f"Bearer {token}"}
+
+
+def test_chunks_and_complete_with_upload_token(app_client, stats_client, signed_headers, inline_assembly):
+    started = initiate(app_client, signed_headers, 2)
+    upload_id, headers = started["upload_id"], bearer(started["upload_token"])
+
+    signed = post_chunk(stats_client, signed_headers, upload_id, 1, 2, b"one", hashlib.sha256(b"one").hexdigest())
+    resp = post_chunk(stats_client, headers, upload_id, 2, 2, b"two", hashlib.sha256(b"two").hexdigest())
+
+    assert signed.status_code == resp.status_code == 200
+    # No ownership lookup: the token already names the uploader
+    assert int(resp.headers["x-db-queries"]) == int(signed.headers["x-db-queries"]) - 1
+    job = app_client.post("/upload/complete", data={"upload_id": upload_id}, headers=headers).json()
+    assert job["status"] == "done"
+    assert app_client.get(job["video_link"]).content == b"onetwo"
+
+
+def test_upload_token_is_scoped_to_its_upload(app_client, signed_headers, nas_config):
+    first, second = initiate(app_client, signed_headers, 2), initiate(app_client, signed_headers, 2)
+    digest = hashlib.sha256(b"data").hexdigest()
+
+    other = post_chunk(app_client, bearer(first["upload_token"]), second["upload_id"], 1, 2, b"data", digest)
+    beyond = post_chunk(app_client, bearer(first["upload_token"]), first["upload_id"], 3, 2, b"data", digest)
+    complete = app_client.post("/upload/complete", data={"upload_id": second["upload_id"]},
+                               headers=bearer(first["upload_token"]))
+
+    assert other.status_code == complete.status_code == 403
+    assert beyond.status_code == 404
+    assert os.listdir(nas_config.chunks_dir) == []
+
+
+def test_forged_or_expired_upload_token_rejected(app_client, signed_headers, signing_key, nas_config):
+    upload_id = initiate(app_client, signed_headers, 1)["upload_id"]
+    forged = issue_upload_token(nas_config.replace(upload_token_secret="guess"), upload_id, signing_key[0], 1)
+    expired = issue_upload_token(nas_config, upload_id, signing_key[0], 1, now=0)
+    digest = hashlib.sha256(b"data").hexdigest()
+
+    for token in (forged, expired, "not-a-token"):
+        assert post_chunk(app_client, bearer(token), upload_id, 1, 1, b"data", digest).status_code == 401
+    assert post_chunk(app_client, {}, upload_id, 1, 1, b"data", digest).status_code == 401
+
+
+def test_client_sends_token_and_falls_back_to_signing(app_client, signed_headers, client_keys, inline_assembly, tmp_path,
+                                                     monkeypatch):
+    keys_dir, key_id = client_keys
+    source = tmp_path / "clip.mp4"
+    source.write_bytes(os.urandom(3000))
+    sent = []
+    real_post = app_client.post
+
+    def recording_post(url, **kwargs):
+        sent.append((url.rsplit("/", 1)[1], "authorization" in kwargs["headers"]))
+        return real_post(url, **kwargs)
+
+    monkeypatch.setattr(app_client, "post", recording_post)
+    job = upload_client.upload_file_parallel("http://testserver", keys_dir, str(source), key_id, workers=2,
+                                             chunk_size=1024, session=app_client)
+
+    assert job["status"] == "done"
+    assert sent == [("initiate", False)] + [("chunk", True)] * 3 + [("complete", True)]
+
+    # A token the server no longer accepts (e.g. it restarted with a new secret)
+    upload_id = initiate(app_client, signed_headers, 1)["upload_id"]
+    sent.clear()
+    upload_client.post_chunk(app_client, "http://testserver", upload_id, 1, 1, b"data", key_id,
+                             upload_client.load_private_key(keys_dir, key_id), upload_token="stale")
+    assert sent == [("chunk", True), ("chunk", False)]
+
+
+def test_upload_token_revoked_with_its_key(app_client, signed_headers, signing_key):
+    started = initiate(app_client, signed_headers, 1)
+    digest = hashlib.sha256(b"data").hexdigest()
+
+    async def remove_key():
+        async with app_client.session_factory() as session:
+            await remove_public_key_from_db(session, signing_key[0])
+
+    asyncio.run(remove_key())
+
+    resp = post_chunk(app_client, bearer(started["upload_token"]), started["upload_id"], 1, 1, b"data", digest)
+    assert resp.status_code == 401
+    assert resp.json()["detail"] == "Key not found"
+
+
+def test_generated_secret_shared_by_workers(tmp_path, monkeypatch):
+    monkeypatch.delenv("UPLOAD_TOKEN_SECRET", raising=False)
+    monkeypatch.setenv("NAS_MOUNT_PATH", str(tmp_path))
+
+    first, second = Config(), Config()
+
+    assert first.upload_token_secret == second.upload_token_secret
+    assert oct(os.stat(tmp_path / ".upload_token_secret").st_mode & 0o777) == "0o600"
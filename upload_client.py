@@ -1,13 +1,23 @@
 import os
+import time
 import argparse
 import requests
 import base64
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat, PrivateFormat, NoEncryption
 from cryptography.hazmat.backends import default_backend
 
 CHUNK_SIZE = 10 * 1024 * 1024  # 10MB per chunk
+PARALLEL_UPLOADS = 4
+# Bytes per PATCH in raw upload mode; an interrupted PATCH resumes from what arrived
+RAW_PATCH_SIZE = 64 * 1024 * 1024
+MAX_RETRIES = 5
+# Detail the server returns when a chunk's bytes do not match its chunk_digest
+CHUNK_DIGEST_MISMATCH = "Chunk digest mismatch; resend the chunk"
 ADMIN_KEY_ID = "lucibit"
 
 
@@ -67,6 +77,12 @@ def key_headers(key_id, private_key):
         'message': base64.b64encode(message).decode()
     }
 
+def upload_headers(upload_token, key_id, private_key):
+    """Bearer upload token when there is one (one MAC check on the server), else a key signature"""
+    if upload_token:
+        return {'authorization': f"Bearer {upload_token}"}
+    return key_headers(key_id, private_key)
+
 def upload_key(server_url, keys_dir, key_id, is_admin=False):
     public_key_pem = load_public_key(keys_dir, key_id)
     private_key = load_private_key(keys_dir, ADMIN_KEY_ID)
@@ -78,6 +94,19 @@ def upload_key(server_url, keys_dir, key_id, is_admin=False):
     }, headers=headers)
     print(resp.status_code, resp.text)
 
+def wait_for_assembly(server_url, job, key_id, private_key, poll_interval=2, session=None):
+    """Poll the assembly job started by /upload/complete until it finishes"""
+    session = session or requests
+    while job['status'] in ('queued', 'assembling'):
+        print(f"Assembly {job['status']}...")
+        time.sleep(poll_interval)
+        resp = session.get(f"{server_url}{job['status_url']}", headers=key_headers(key_id, private_key))
+        resp.raise_for_status()
+        job = resp.json()
+    if job['status'] != 'done':
+        raise RuntimeError(f"Assembly failed: {job.get('error')}")
+    return job
+
 def upload_file(server_url, keys_dir, filepath, key_id):
     private_key = load_private_key(keys_dir, key_id)
     # Split file
@@ -93,32 +122,246 @@ def upload_file(server_url, keys_dir, filepath, key_id):
     }, headers=key_headers(key_id, private_key))
     resp.raise_for_status()
     upload_id = resp.json()['upload_id']
+    upload_token = resp.json().get('upload_token')
     print(f"Upload ID: {upload_id}")
 
     # Upload chunks
     for i, chunk_path in enumerate(chunks, 1):
         with open(chunk_path, 'rb') as f:
-            files = {'file': (os.path.basename(chunk_path), f)}
-            data = {
-                'upload_id': upload_id,
-                'chunk_number': i,
-                'total_chunks': total_chunks
-            }
-            resp = requests.post(f"{server_url}/upload/chunk", data=data, files=files, headers=key_headers(key_id, private_key))
-            resp.raise_for_status()
-            print(f"Uploaded chunk {i}/{total_chunks}")
+            chunk = f.read()
+        files = {'file': (os.path.basename(chunk_path), chunk)}
+        data = {
+            'upload_id': upload_id,
+            'chunk_number': i,
+            'total_chunks': total_chunks,
+            'chunk_digest': hashlib.sha256(chunk).hexdigest()
+        }
+        resp = requests.post(f"{server_url}/upload/chunk", data=data, files=files,
+                             headers=upload_headers(upload_token, key_id, private_key))
+        resp.raise_for_status()
+        print(f"Uploaded chunk {i}/{total_chunks}")
 
     # Complete upload
     resp = requests.post(f"{server_url}/upload/complete", data={
         'upload_id': upload_id
-    }, headers=key_headers(key_id, private_key))
+    }, headers=upload_headers(upload_token, key_id, private_key))
     resp.raise_for_status()
-    print("Upload complete! Video link:", resp.json().get('video_link'))
+    job = wait_for_assembly(server_url, resp.json(), key_id, private_key)
+    print("Upload complete! Video link:", job.get('video_link'))
 
     # Clean up chunk files
     for chunk_path in chunks:
         os.remove(chunk_path)
 
+def read_chunk(fd, chunk_number, file_size, chunk_size=CHUNK_SIZE):
+    """Read chunk ``chunk_number`` (1-based) straight from the file at its offset"""
+    offset = (chunk_number - 1) * chunk_size
+    return os.pread(fd, min(chunk_size, file_size - offset), offset)
+
+def file_digest(filepath):
+    """Whole-file digest the server stores: SHA-256 of the file's bytes"""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        while block := f.read(1024 * 1024):
+            digest.update(block)
+    return digest.hexdigest()
+
+def upload_session(pool_size=PARALLEL_UPLOADS):
+    """Keep-alive session with enough pooled connections for every worker"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def is_digest_mismatch(resp):
+    """True when the server rejected a chunk because it arrived damaged"""
+    if resp.status_code != 400:
+        return False
+    try:
+        return resp.json().get('detail') == CHUNK_DIGEST_MISMATCH
+    except ValueError:
+        return False
+
+def post_chunk(session, server_url, upload_id, chunk_number, total_chunks, data, key_id, private_key,
+               retries=MAX_RETRIES, backoff=1.0, upload_token=None):
+    """Post one chunk, retrying connection errors, 5xx responses and digest mismatches with exponential backoff"""
+    digest = hashlib.sha256(data).hexdigest()
+
+    def send(headers):
+        return session.post(f"{server_url}/upload/chunk", data={
+            'upload_id': upload_id,
+            'chunk_number': chunk_number,
+            'total_chunks': total_chunks,
+            'chunk_digest': digest
+        }, files={'file': (f"chunk{chunk_number}", data)}, headers=headers)
+
+    for attempt in range(retries + 1):
+        try:
+            resp = send(upload_headers(upload_token, key_id, private_key))
+            if resp.status_code == 401 and upload_token:
+                # Token expired, or the server restarted with a new secret: sign from now on
+                upload_token = None
+                resp = send(key_headers(key_id, private_key))
+            if resp.status_code < 500 and not is_digest_mismatch(resp):
+                resp.raise_for_status()
+                return
+            error = requests.HTTPError(f"{resp.status_code} {resp.text}", response=resp)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+        if attempt < retries:
+            delay = backoff * 2 ** attempt
+            print(f"Chunk {chunk_number} failed ({error}), retrying in {delay:.0f}s")
+            time.sleep(delay)
+    raise error
+
+def upload_file_parallel(server_url, keys_dir, filepath, key_id, workers=PARALLEL_UPLOADS, upload_id=None,
+                         chunk_size=CHUNK_SIZE, session=None, retries=MAX_RETRIES, backoff=1.0):
+    """Upload ``workers`` chunks at a time, reading them from the file at their offsets.
+
+    Pass the ``upload_id`` of an interrupted upload to resume it: only the
+    chunks the server has not received yet are sent.
+    """
+    private_key = load_private_key(keys_dir, key_id)
+    session = session or upload_session(workers)
+    file_size = os.path.getsize(filepath)
+    total_chunks = max(1, -(-file_size // chunk_size))
+    filename = os.path.basename(filepath)
+
+    if upload_id:
+        resp = session.get(f"{server_url}/upload/chunks/{upload_id}", headers=key_headers(key_id, private_key))
+        resp.raise_for_status()
+        progress = resp.json()
+        if progress['total_chunks'] != total_chunks:
+            raise ValueError(f"Upload {upload_id} has {progress['total_chunks']} chunks, "
+                             f"{filepath} splits into {total_chunks}")
+        received = set(progress['received'])
+        upload_token = progress.get('upload_token')
+        print(f"Resuming upload {upload_id}: {len(received)}/{total_chunks} chunks already received")
+    else:
+        # Sending the digest first lets the server skip an upload it already has the bytes for
+        resp = session.post(f"{server_url}/upload/initiate", data={
+            'filename': filename,
+            'total_chunks': total_chunks,
+            'file_digest': file_digest(filepath)
+        }, headers=key_headers(key_id, private_key))
+        resp.raise_for_status()
+        initiated = resp.json()
+        if initiated.get('duplicate'):
+            print("Server already has this file; nothing uploaded. Video link:", initiated['video_link'])
+            return initiated
+        upload_id = initiated['upload_id']
+        upload_token = initiated.get('upload_token')
+        received = set()
+        print(f"Upload ID: {upload_id}")
+
+    pending = [n for n in range(1, total_chunks + 1) if n not in received]
+    fd = os.open(filepath, os.O_RDONLY)
+    try:
+        def send(chunk_number):
+            data = read_chunk(fd, chunk_number, file_size, chunk_size)
+            post_chunk(session, server_url, upload_id, chunk_number, total_chunks, data,
+                       key_id, private_key, retries=retries, backoff=backoff, upload_token=upload_token)
+            return chunk_number
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(send, n) for n in pending]
+            for done, future in enumerate(as_completed(futures), len(received) + 1):
+                print(f"Uploaded chunk {future.result()} ({done}/{total_chunks})")
+    except BaseException:
+        print(f"Upload interrupted; resume with --resume {upload_id}")
+        raise
+    finally:
+        os.close(fd)
+
+    resp = session.post(f"{server_url}/upload/complete", data={
+        'upload_id': upload_id
+    }, headers=upload_headers(upload_token, key_id, private_key))
+    if resp.status_code == 401 and upload_token:
+        resp = session.post(f"{server_url}/upload/complete", data={
+            'upload_id': upload_id
+        }, headers=key_headers(key_id, private_key))
+    resp.raise_for_status()
+    job = wait_for_assembly(server_url, resp.json(), key_id, private_key, session=session)
+    print("Upload complete! Video link:", job.get('video_link'))
+    return job
+
+def upload_file_raw(server_url, keys_dir, filepath, key_id, upload_id=None, patch_size=RAW_PATCH_SIZE,
+                    session=None, retries=MAX_RETRIES, backoff=1.0):
+    """Upload the file as raw bytes with offset-based PATCH requests (no multipart encoding).
+
+    After a failed PATCH the client asks the server for its offset (HEAD) and
+    carries on from there; pass the ``upload_id`` of an interrupted upload to
+    resume it the same way.
+    """
+    private_key = load_private_key(keys_dir, key_id)
+    session = session or upload_session(1)
+    file_size = os.path.getsize(filepath)
+    upload_token = None
+
+    if not upload_id:
+        resp = session.post(f"{server_url}/upload/raw", data={
+            'filename': os.path.basename(filepath),
+            'upload_length': file_size
+        }, headers=key_headers(key_id, private_key))
+        resp.raise_for_status()
+        created = resp.json()
+        upload_id, upload_token = created['upload_id'], created.get('upload_token')
+        print(f"Upload ID: {upload_id}")
+    upload_url = f"{server_url}/upload/raw/{upload_id}"
+
+    def server_offset():
+        resp = session.head(upload_url, headers=upload_headers(upload_token, key_id, private_key))
+        resp.raise_for_status()
+        return int(resp.headers['upload-offset'])
+
+    offset = server_offset() if upload_token is None else 0
+    fd = os.open(filepath, os.O_RDONLY)
+    try:
+        attempt = 0
+        while offset < file_size:
+            data = os.pread(fd, min(patch_size, file_size - offset), offset)
+            try:
+                resp = session.patch(upload_url, data=data, headers={
+                    **upload_headers(upload_token, key_id, private_key),
+                    'content-type': 'application/offset+octet-stream',
+                    'upload-offset': str(offset)
+                })
+                if resp.status_code == 401 and upload_token:
+                    # Token expired, or the server restarted with a new secret: sign from now on
+                    upload_token = None
+                    continue
+                if resp.status_code < 500 and resp.status_code != 409:
+                    resp.raise_for_status()
+                    offset = int(resp.headers['upload-offset'])
+                    attempt = 0
+                    print(f"Uploaded {offset}/{file_size} bytes")
+                    continue
+                error = requests.HTTPError(f"{resp.status_code} {resp.text}", response=resp)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            if attempt >= retries:
+                raise error
+            delay = backoff * 2 ** attempt
+            attempt += 1
+            print(f"PATCH at offset {offset} failed ({error}), retrying in {delay:.0f}s")
+            time.sleep(delay)
+            # Part of the body may have arrived; continue from what the server has
+            offset = server_offset()
+    except BaseException:
+        print(f"Upload interrupted; resume with --raw --resume {upload_id}")
+        raise
+    finally:
+        os.close(fd)
+
+    resp = session.post(f"{server_url}/upload/complete", data={
+        'upload_id': upload_id
+    }, headers=upload_headers(upload_token, key_id, private_key))
+    resp.raise_for_status()
+    job = wait_for_assembly(server_url, resp.json(), key_id, private_key, session=session)
+    print("Upload complete! Video link:", job.get('video_link'))
+    return job
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Chunked video uploader client.")
     parser.add_argument('--server-url', help='Base URL of the FastAPI server, e.g. http://localhost:8000')
@@ -138,6 +381,11 @@ if __name__ == "__main__":
     upload_parser = subparsers.add_parser("upload-video", help="Upload a video file using a key.")
     upload_parser.add_argument('filepath', help='Path to the video file to upload')
     upload_parser.add_argument('key_id', help='Key ID to use for signing')
+    upload_parser.add_argument('--parallel', type=int, metavar='N',
+                               help='Upload N chunks at a time without temp files (default mode uploads one by one)')
+    upload_parser.add_argument('--resume', metavar='UPLOAD_ID', help='Resume an interrupted upload (implies --parallel)')
+    upload_parser.add_argument('--raw', action='store_true',
+                               help='Send the file as raw bytes with offset-based PATCH requests instead of multipart chunks')
 
     args = parser.parse_args()
     if not args.keys_dir:
@@ -154,4 +402,11 @@ if __name__ == "__main__":
     elif args.mode == "upload-key":
         upload_key(server_url=args.server_url, keys_dir=args.keys_dir, key_id=args.key_id, is_admin=args.admin)
     elif args.mode == "upload-video":
-        upload_file(server_url=args.server_url, keys_dir=args.keys_dir, filepath=args.filepath, key_id=args.key_id) 
\ No newline at end of file
+        if args.raw:
+            upload_file_raw(server_url=args.server_url, keys_dir=args.keys_dir, filepath=args.filepath,
+                            key_id=args.key_id, upload_id=args.resume)
+        elif args.parallel or args.resume:
+            upload_file_parallel(server_url=args.server_url, keys_dir=args.keys_dir, filepath=args.filepath,
+                                 key_id=args.key_id, workers=args.parallel or PARALLEL_UPLOADS, upload_id=args.resume)
+        else:
+            upload_file(server_url=args.server_url, keys_dir=args.keys_dir, filepath=args.filepath, key_id=args.key_id) 
\ No newline at end of file